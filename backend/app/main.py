@@ -1,11 +1,23 @@
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .routers import datasets, search, export, annotate, jobs, status, rubrics, analyze, taxonomy, nodes, graph, labeling, evaluate, canvas
 from .routers.labeling import nodes_router as labeling_nodes_router
 
-app = FastAPI(title="RAG Bloom API", version="0.2.0")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Models load in the background: the server accepts connections (and /health
+    # answers) right away, /ready turns 200 once warm-up is done.
+    from .services.warmup import start_background_warmup
+    start_background_warmup("api")
+    yield
+
+
+app = FastAPI(title="RAG Bloom API", version="0.2.0", lifespan=lifespan)
 
 # Frontend runs on a different origin (localhost:3000) than API (localhost:8000).
 # In dev/demo we allow broad CORS by default to avoid "TypeError: Failed to fetch".
@@ -41,6 +53,19 @@ app.include_router(canvas.router)
 
 @app.get("/health")
 def health():
-    from .services.embedding_provider import current_embedding_model
-    model = current_embedding_model()
-    return {"ok": True, "embedding_model": model, "semantic": not model.startswith("hash:")}
+    # Liveness: must stay cheap, so it reports the model only once loaded.
+    from .services.warmup import loaded_embedding_model, warmup_status
+    model = loaded_embedding_model()
+    return {
+        "ok": True,
+        "embedding_model": model,
+        "semantic": (not model.startswith("hash:")) if model else None,
+        "warmup": warmup_status()["status"],
+    }
+
+
+@app.get("/ready")
+def ready():
+    from .services.warmup import is_ready, warmup_status
+    ok = is_ready()
+    return JSONResponse({"ready": ok, **warmup_status()}, status_code=200 if ok else 503)
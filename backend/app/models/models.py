@@ -1,4 +1,4 @@
-from sqlalchemy import String, Integer, Text, JSON, DateTime, ForeignKey, Enum, Float, Boolean, UniqueConstraint, Index
+from sqlalchemy import String, Integer, Text, JSON, DateTime, ForeignKey, Enum, Float, Boolean, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .base import Base
@@ -20,6 +20,14 @@ class Dataset(Base):
     __tablename__="datasets"
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(200), unique=True, index=True)
+    # Bumped by a trigger whenever node vectors change (migration 0023); stamps vector snapshots
+    vectors_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # Bumped by every write that changes search/graph results; keys the response cache (migration 0024)
+    generation: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # Params of the last persisted graph build; set → node writes queue incremental edge updates (migration 0025)
+    graph_params: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    # Persisted graph rebuilds so far; stamps precomputed layouts (migration 0027)
+    graph_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
 class Document(Base):
@@ -48,9 +56,11 @@ class Embedding(Base):
     __table_args__ = (UniqueConstraint("chunk_id", name="uq_embeddings_chunk_id"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     chunk_id: Mapped[int] = mapped_column(ForeignKey("chunks.id", ondelete="CASCADE"), index=True)
+    # Denormalized from chunk -> document so per-dataset partial indexes can filter on it (migration 0022)
+    dataset_id: Mapped[int | None] = mapped_column(ForeignKey("datasets.id", ondelete="CASCADE"), nullable=True)
     dim: Mapped[int] = mapped_column(Integer, default=1536)
-    # 1536-dim storage: local model (default: multilingual-e5-large, 1024-dim) is zero-padded for OpenAI compatibility
-    vec: Mapped[Optional[list]] = mapped_column(_Vector(1536) if _PGVECTOR else JSON, nullable=True)
+    # Native dimension of `model` (column is dimensionless, see migration 0019)
+    vec: Mapped[Optional[list]] = mapped_column(_Vector() if _PGVECTOR else JSON, nullable=True)
     model: Mapped[str] = mapped_column(String(100), nullable=True)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
@@ -61,14 +71,8 @@ class KnowledgeNode(Base):
         # Covers the non-NULL document_id case (all Canvas-ingested nodes).
         # A separate partial index (see migration 0016) covers document_id IS NULL.
         UniqueConstraint("dataset_id", "document_id", "title", name="uq_kn_dataset_doc_title"),
-        # HNSW index for fast cosine similarity search over node embeddings.
-        # Requires pgvector >= 0.5. Alembic autogenerate won't handle this —
-        # create manually or via a migration:
-        #   CREATE INDEX ix_knode_vec_hnsw ON knowledge_nodes
-        #   USING hnsw (vec vector_cosine_ops) WITH (m=16, ef_construction=64);
-        Index("ix_knode_vec_hnsw", "vec", postgresql_using="hnsw",
-              postgresql_with={"m": 16, "ef_construction": 64},
-              postgresql_ops={"vec": "vector_cosine_ops"}),
+        # Vector indexes are per embedding model (partial HNSW over `vec::halfvec(dim)`),
+        # built on demand by services/vector_index.py — not declared here.
     )
     id: Mapped[int] = mapped_column(primary_key=True)
     dataset_id: Mapped[int] = mapped_column(ForeignKey("datasets.id", ondelete="CASCADE"), index=True)
@@ -80,8 +84,8 @@ class KnowledgeNode(Base):
     top_levels: Mapped[list] = mapped_column(JSON, default=list)
     embedding_dim: Mapped[int] = mapped_column(Integer, default=1536)
     embedding_model: Mapped[str] = mapped_column(String(100), nullable=True)
-    # 1536-dim storage: local model (default: multilingual-e5-large, 1024-dim) is zero-padded for OpenAI compatibility
-    vec: Mapped[Optional[list]] = mapped_column(_Vector(1536) if _PGVECTOR else JSON, nullable=True)
+    # Native dimension of `model` (column is dimensionless, see migration 0019)
+    vec: Mapped[Optional[list]] = mapped_column(_Vector() if _PGVECTOR else JSON, nullable=True)
     version: Mapped[int] = mapped_column(Integer, default=1)
     model_info: Mapped[dict] = mapped_column(JSON, default=dict)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -100,6 +104,42 @@ class KnowledgeEdge(Base):
     method: Mapped[str] = mapped_column(String(100), default="vector_topk")
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
+class GraphCluster(Base):
+    __tablename__ = "graph_clusters"
+    dataset_id: Mapped[int] = mapped_column(ForeignKey("datasets.id", ondelete="CASCADE"), primary_key=True)
+    cluster_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    size: Mapped[int] = mapped_column(Integer)
+    label: Mapped[str | None] = mapped_column(String(300), nullable=True)
+    label_node_id: Mapped[int | None] = mapped_column(ForeignKey("knowledge_nodes.id", ondelete="SET NULL"), nullable=True)
+    prob_vector: Mapped[list] = mapped_column(JSON, default=list)
+    top_levels: Mapped[list] = mapped_column(JSON, default=list)
+    embedding_model: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    # Mean of the members' normalized vectors (migration 0026)
+    centroid: Mapped[Optional[list]] = mapped_column(_Vector() if _PGVECTOR else JSON, nullable=True)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class GraphClusterMember(Base):
+    __tablename__ = "graph_cluster_members"
+    node_id: Mapped[int] = mapped_column(ForeignKey("knowledge_nodes.id", ondelete="CASCADE"), primary_key=True)
+    dataset_id: Mapped[int] = mapped_column(ForeignKey("datasets.id", ondelete="CASCADE"))
+    cluster_id: Mapped[int] = mapped_column(Integer)
+
+class GraphClusterEdge(Base):
+    __tablename__ = "graph_cluster_edges"
+    dataset_id: Mapped[int] = mapped_column(ForeignKey("datasets.id", ondelete="CASCADE"), primary_key=True)
+    from_cluster_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    to_cluster_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    weight: Mapped[float] = mapped_column(Float)
+    edges: Mapped[int] = mapped_column(Integer)
+
+class GraphNodePosition(Base):
+    __tablename__ = "graph_node_positions"
+    node_id: Mapped[int] = mapped_column(ForeignKey("knowledge_nodes.id", ondelete="CASCADE"), primary_key=True)
+    dataset_id: Mapped[int] = mapped_column(ForeignKey("datasets.id", ondelete="CASCADE"), index=True)
+    x: Mapped[float] = mapped_column(Float)
+    y: Mapped[float] = mapped_column(Float)
+    graph_version: Mapped[int] = mapped_column(Integer)
+
 class NodeLabel(Base):
     __tablename__ = "node_labels"
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -3,7 +3,6 @@ import re
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 
 from ..db.session import get_db
 from ..models.models import KnowledgeNode
@@ -23,9 +22,11 @@ from ..services.chunking import split_into_chunks
 from ..services.embedding import embed_texts
 from ..services.bloom_multilabel import classify_bloom_multilabel
 from ..utils.bloom import LEVEL_ORDER
-from ..services.embedding_provider import current_embedding_model
+from ..services.embedding_provider import get_embedding_provider
 from ..services.node_extractor import get_node_extractor
-from ..utils.vector import vector_literal
+from ..services.result_cache import bump_generation
+from ..services.vector_store import NodeVectorWriter
+from ..tasks.queue import schedule_graph_maintenance
 
 router = APIRouter(prefix="/analyze", tags=["analyze"])
 
@@ -122,10 +123,11 @@ def analyze_content(payload: AnalyzeContentIn, db: Session = Depends(get_db)):
 
     stored_nodes: list[KnowledgeNode] = []
     node_rationales: list[str | None] = []
-    embedding_dim = payload.embedding_dim or 1536
-    if embedding_dim != 1536:
-        raise HTTPException(400, "embedding_dim must be 1536 for current storage")
-    actual_embedding_model = current_embedding_model()
+    provider = get_embedding_provider()
+    embedding_dim = payload.embedding_dim or provider.dim
+    if embedding_dim != provider.dim:
+        raise HTTPException(400, f"embedding_dim must be {provider.dim} for the active embedding model")
+    actual_embedding_model = provider.embedding_model
     requested_embedding_model = (payload.embedding_model or "").strip() or None
     actual_classifier = os.getenv("BLOOM_CLASSIFIER", "keyword").strip().lower()
     min_prob = payload.min_prob or 0.2
@@ -211,12 +213,11 @@ def analyze_content(payload: AnalyzeContentIn, db: Session = Depends(get_db)):
         f"{kn.title}. {kn.context_text}".strip() for kn in stored_nodes
     ]
     vecs = embed_texts(embed_inputs, dim=embedding_dim)
-    for kn, vec in zip(stored_nodes, vecs):
-        db.execute(
-            text("UPDATE knowledge_nodes SET vec = CAST(:v AS vector) WHERE id = :id"),
-            {"v": vector_literal(vec), "id": kn.id},
-        )
+    with NodeVectorWriter(db, actual_embedding_model, commit=False) as writer:
+        writer.add([kn.id for kn in stored_nodes], vecs)
+    bump_generation(db, payload.dataset_id)
     db.commit()
+    schedule_graph_maintenance(db, payload.dataset_id)
 
     return {
         "nodes": [
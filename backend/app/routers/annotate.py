@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from ..db.session import get_db
 from ..models.models import BloomAnnotation, Chunk, Dataset, Document, Job, JobType, JobStatus
 from ..schemas.schemas import AnnotationListOut, AnnotationOut, AnnotationUpdateIn, AnnotationWithChunkOut
+from ..services.result_cache import bump_generation
 from ..services.validation import validate_annotation
 from ..tasks.queue import enqueue_or_mark
 from ..utils.quality import (
@@ -173,6 +174,7 @@ def update_chunk_annotation(
         )
         db.add(annotation)
 
+    bump_generation(db, chunk.document.dataset_id)
     db.commit()
     db.refresh(annotation)
     return annotation
@@ -187,6 +189,8 @@ def delete_chunk_annotation(chunk_id: int, level: str, db: Session = Depends(get
     )
     if not annotation:
         raise HTTPException(404, "annotation not found")
+    chunk = db.get(Chunk, chunk_id)
+    bump_generation(db, chunk.document.dataset_id if chunk is not None else None)
     db.delete(annotation)
     db.commit()
     return {"ok": True}
@@ -19,9 +19,11 @@ from ..services.chunking import split_into_chunks
 from ..services.embedding import embed_texts
 from ..services.embedding_provider import current_embedding_model
 from ..services.node_extractor import get_node_extractor
+from ..services.result_cache import bump_generation
 from ..services.text_extract import extract_text as extract_file_text
+from ..services.vector_store import ChunkEmbeddingWriter, NodeVectorWriter
 from ..utils.bloom import LEVEL_ORDER
-from ..utils.vector import vector_literal
+from ..tasks.queue import schedule_graph_maintenance
 
 SUPPORTED_MIME_PREFIXES = (
     "application/pdf",
@@ -388,38 +390,25 @@ def _process_document(
     # Attempt embeddings; failures are logged but never abort the commit —
     # nodes with vec=NULL are saved and can be re-embedded later.
     try:
-        chunk_vecs = embed_texts([chunk.text for chunk in chunks], dim=1536)
-        for chunk, vec in zip(chunks, chunk_vecs):
-            db.execute(
-                text(
-                    """
-                    INSERT INTO embeddings (chunk_id, dim, model, vec)
-                    VALUES (:cid, :dim, :model, CAST(:v AS vector))
-                    ON CONFLICT (chunk_id)
-                    DO UPDATE SET dim = EXCLUDED.dim,
-                                  model = EXCLUDED.model,
-                                  vec = EXCLUDED.vec
-                    """
-                ),
-                {"cid": chunk.id, "dim": 1536, "model": embedding_model, "v": vector_literal(vec)},
-            )
+        chunk_vecs = embed_texts([chunk.text for chunk in chunks])
+        with ChunkEmbeddingWriter(db, embedding_model, commit=False) as writer:
+            writer.add([chunk.id for chunk in chunks], chunk_vecs)
     except Exception as exc:
         logger.warning("Chunk embedding failed for %s: %s", source_label, exc)
 
     try:
-        node_vecs = embed_texts([f"{kn.title}. {kn.context_text}".strip() for kn in stored], dim=1536)
-        for kn, vec in zip(stored, node_vecs):
-            db.execute(
-                text("UPDATE knowledge_nodes SET vec = CAST(:v AS vector) WHERE id = :id"),
-                {"v": vector_literal(vec), "id": kn.id},
-            )
+        node_vecs = embed_texts([f"{kn.title}. {kn.context_text}".strip() for kn in stored])
+        with NodeVectorWriter(db, embedding_model, commit=False) as writer:
+            writer.add([kn.id for kn in stored], node_vecs)
     except Exception as exc:
         logger.warning("Node embedding failed for %s: %s", source_label, exc)
 
     # Single commit: nodes + chunk embeddings + node vectors land atomically.
     # If anything above raised outside the try/except the caller's session
     # will roll back the whole document — no partial writes.
+    bump_generation(db, dataset_id)
     db.commit()
+    schedule_graph_maintenance(db, dataset_id)
 
     return ImportedDocumentOut(
         document_id=document_id,
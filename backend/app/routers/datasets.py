@@ -11,6 +11,8 @@ from ..models.models import Dataset, Document, Job, JobType, JobStatus
 from ..tasks.queue import enqueue_or_mark
 from ..schemas.schemas import DatasetIn, DatasetOut
 from ..services.text_extract import extract_text
+from ..services.vector_index import VECTOR_DATASET_INDEX_MIN_ROWS, drop_dataset_indexes, list_dataset_indexes
+from ..services.vector_snapshot import drop_node_snapshots
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +36,24 @@ def create_dataset(data: DatasetIn, db: Session = Depends(get_db)):
     db.add(ds); db.commit(); db.refresh(ds)
     return ds
 
+@router.delete("/{dataset_id}")
+def delete_dataset(dataset_id: int, db: Session = Depends(get_db)):
+    """
+    Deletes the dataset with everything in it, dropping its partial vector
+    indexes first and its vector snapshots after.
+    """
+    ds = db.get(Dataset, dataset_id)
+    if not ds:
+        raise HTTPException(404, "dataset not found")
+    # End this session's transaction: DROP INDEX CONCURRENTLY waits for open ones.
+    db.commit()
+    dropped = drop_dataset_indexes(dataset_id)
+    db.execute(text("DELETE FROM datasets WHERE id = :id"), {"id": dataset_id})
+    db.commit()
+    drop_node_snapshots(dataset_id)
+    return {"ok": True, "dataset_id": dataset_id, "dropped_indexes": dropped}
+
+
 @router.post("/extract-text")
 def extract_text_from_file(file: UploadFile = File(...)):
     data = file.file.read()
@@ -118,3 +138,40 @@ def reindex_nodes(dataset_id: int, db: Session = Depends(get_db)):
     db.refresh(job)
     enqueue_or_mark(db, job)
     return {"job_id": job.id}
+
+
+@router.get("/{dataset_id}/vector-indexes")
+def get_vector_indexes(dataset_id: int, db: Session = Depends(get_db)):
+    """The dataset's partial vector indexes (catalog rows of `vector_indexes`)."""
+    ds = db.get(Dataset, dataset_id)
+    if not ds:
+        raise HTTPException(404, "dataset not found")
+    return {
+        "dataset_id": dataset_id,
+        "min_rows": VECTOR_DATASET_INDEX_MIN_ROWS,
+        "indexes": list_dataset_indexes(db, dataset_id),
+    }
+
+
+@router.post("/{dataset_id}/vector-indexes")
+def build_vector_indexes(
+    dataset_id: int, min_rows: int | None = Query(None, ge=0), db: Session = Depends(get_db)
+):
+    """
+    Builds partial vector indexes for the dataset (active embedding model) on the
+    tables where it has at least `min_rows` vectors (default
+    VECTOR_DATASET_INDEX_MIN_ROWS). Index jobs do this automatically.
+    """
+    ds = db.get(Dataset, dataset_id)
+    if not ds:
+        raise HTTPException(404, "dataset not found")
+    job = Job(
+        type=JobType.index,
+        status=JobStatus.queued,
+        payload={"dataset_id": dataset_id, "action": "vector_indexes", "min_rows": min_rows},
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    enqueue_or_mark(db, job)
+    return {"job_id": job.id}
@@ -2,14 +2,41 @@ from __future__ import annotations
 
 from collections import defaultdict
 
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import or_
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session, defer
 from sqlalchemy import text
 
 from ..db.session import get_db
-from ..models.models import KnowledgeNode, KnowledgeEdge, Job, JobType, JobStatus
-from ..schemas.schemas import GraphOut, GraphNodeOut, GraphEdgeOut, GraphRebuildIn, GraphRebuildOut
+from ..models.models import (
+    Dataset,
+    GraphCluster,
+    GraphClusterEdge,
+    GraphClusterMember,
+    GraphNodePosition,
+    Job,
+    JobStatus,
+    JobType,
+    KnowledgeEdge,
+    KnowledgeNode,
+)
+from ..schemas.schemas import (
+    GraphClusterIn,
+    GraphClusterOut,
+    GraphEdgeOut,
+    GraphNeighborhoodNodeOut,
+    GraphNeighborhoodOut,
+    GraphNodeOut,
+    GraphOut,
+    GraphRebuildIn,
+    GraphRebuildOut,
+    GraphSummaryOut,
+)
+from ..services.result_cache import encoded_response, etag_for, etag_matches, json_response, lookup
+from ..services.graph_build import rank_edges, similarity_edges
+from ..services.graph_neighborhood import edge_methods, subgraph_edges, walk
+from ..services.vector_snapshot import get_node_snapshot
+from ..services.wire_format import negotiate
 from ..tasks.queue import enqueue_or_mark
 
 router = APIRouter(prefix="/graph", tags=["graph"])
@@ -24,6 +51,35 @@ def _node_meta(node: KnowledgeNode) -> tuple[int | None, str | None]:
     return (int(frequency) if isinstance(frequency, (int, float)) else None, str(rationale) if rationale else None)
 
 
+def _node_positions(db: Session, node_ids: list[int]) -> dict[int, tuple[float, float]]:
+    """Precomputed layout positions of `node_ids`, only those of their dataset's current graph."""
+    if not node_ids:
+        return {}
+    rows = (
+        db.query(GraphNodePosition.node_id, GraphNodePosition.x, GraphNodePosition.y)
+        .join(Dataset, Dataset.id == GraphNodePosition.dataset_id)
+        .filter(GraphNodePosition.node_id.in_(node_ids), GraphNodePosition.graph_version == Dataset.graph_version)
+        .all()
+    )
+    return {int(node_id): (float(x), float(y)) for node_id, x, y in rows}
+
+
+def _node_fields(node: KnowledgeNode, positions: dict[int, tuple[float, float]]) -> dict:
+    frequency, rationale = _node_meta(node)
+    x, y = positions.get(node.id, (None, None))
+    return {
+        "id": node.id,
+        "title": node.title,
+        "context_text": node.context_text,
+        "prob_vector": node.prob_vector,
+        "top_levels": node.top_levels,
+        "frequency": frequency,
+        "rationale": rationale,
+        "x": x,
+        "y": y,
+    }
+
+
 @router.post("/rebuild", response_model=GraphRebuildOut)
 def rebuild_graph(payload: GraphRebuildIn, db: Session = Depends(get_db)):
     job = Job(
@@ -47,6 +103,26 @@ def rebuild_graph(payload: GraphRebuildIn, db: Session = Depends(get_db)):
     return GraphRebuildOut(job_id=job.id)
 
 
+@router.post("/clusters/rebuild", response_model=GraphRebuildOut)
+def rebuild_clusters(payload: GraphClusterIn, db: Session = Depends(get_db)):
+    """Queues community detection over the dataset's persisted edges (run after POST /graph/rebuild)."""
+    job = Job(
+        type=JobType.graph,
+        status=JobStatus.queued,
+        payload={
+            "dataset_id": payload.dataset_id,
+            "action": "cluster",
+            "include_cooccurrence": payload.include_cooccurrence,
+            "max_iterations": payload.max_iterations,
+        },
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    enqueue_or_mark(db, job)
+    return GraphRebuildOut(job_id=job.id)
+
+
 def _add_edge(edge_map: dict[tuple[int, int, str], float], a: int, b: int, weight: float, method: str):
     if a == b:
         return
@@ -86,7 +162,7 @@ def _load_persisted_edges(
         return []
 
     rows = (
-        db.query(KnowledgeEdge)
+        db.query(KnowledgeEdge.from_node_id, KnowledgeEdge.to_node_id, KnowledgeEdge.weight, KnowledgeEdge.method)
         .filter(
             KnowledgeEdge.dataset_id == dataset_id,
             KnowledgeEdge.from_node_id.in_(node_ids),
@@ -116,6 +192,7 @@ def _load_persisted_edges(
 
 @router.get("", response_model=GraphOut)
 def get_graph(
+    request: Request,
     dataset_id: int | None = None,
     document_id: int | None = None,
     embedding_model: str | None = None,
@@ -124,8 +201,56 @@ def get_graph(
     max_edges: int = Query(200, ge=1, le=5000),
     include_cooccurrence: bool = True,
     limit_nodes: int = Query(2000, ge=1, le=10000),
+    include_text: bool = False,
     db: Session = Depends(get_db),
 ):
+    """
+    Nodes and edges of a dataset (persisted edges, else computed on the fly).
+    Responses are cached until the dataset's next write and carry a weak ETag
+    derived from its generation; a matching If-None-Match gets 304.
+    `Accept: application/msgpack` or `application/vnd.apache.arrow.stream`
+    gets columnar bodies, without node texts unless `include_text`.
+    """
+    params = dict(
+        dataset_id=dataset_id,
+        document_id=document_id,
+        embedding_model=embedding_model,
+        top_k=top_k,
+        min_score=min_score,
+        max_edges=max_edges,
+        include_cooccurrence=include_cooccurrence,
+        limit_nodes=limit_nodes,
+    )
+    fmt = negotiate(request.headers.get("accept"))
+    cache_key, cached = lookup(db, "graph", dataset_id, {**params, "_format": fmt, "_text": include_text})
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if cache_key is None:
+        return encoded_response(
+            None, _build_graph(db, **params), fmt, {"Vary": "Accept"},
+            include_text=include_text, accept_encoding=accept_encoding,
+        )
+    headers = {"ETag": etag_for(cache_key), "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    body = cached if cached is not None else _build_graph(db, **params)
+    return encoded_response(
+        cache_key, body, fmt, headers,
+        include_text=include_text, accept_encoding=accept_encoding,
+    )
+
+
+def _build_graph(
+    db: Session,
+    *,
+    dataset_id: int | None,
+    document_id: int | None,
+    embedding_model: str | None,
+    top_k: int,
+    min_score: float,
+    max_edges: int,
+    include_cooccurrence: bool,
+    limit_nodes: int,
+) -> GraphOut:
     filters = ["kn.vec IS NOT NULL"]
     params: dict[str, object] = {"limit": limit_nodes}
     if dataset_id is not None:
@@ -149,6 +274,7 @@ def get_graph(
     if node_ids:
         nodes = (
             db.query(KnowledgeNode)
+            .options(defer(KnowledgeNode.vec))
             .filter(KnowledgeNode.id.in_(node_ids))
             .order_by(KnowledgeNode.id.asc())
             .all()
@@ -156,6 +282,7 @@ def get_graph(
     else:
         nodes = []
     node_index = {n.id: n for n in nodes}
+    positions = _node_positions(db, node_ids)
 
     persisted_edges = _load_persisted_edges(
         db,
@@ -169,15 +296,7 @@ def get_graph(
     )
     if persisted_edges:
         node_items = [
-            GraphNodeOut(
-                id=n.id,
-                title=n.title,
-                context_text=n.context_text,
-                prob_vector=n.prob_vector,
-                top_levels=n.top_levels,
-                frequency=_node_meta(n)[0],
-                rationale=_node_meta(n)[1],
-            )
+            GraphNodeOut(**_node_fields(n, positions))
             for n in nodes
         ]
         return GraphOut(nodes=node_items, edges=persisted_edges)
@@ -185,42 +304,31 @@ def get_graph(
     edges: dict[tuple[int, int, str], float] = {}
 
     if node_ids:
-        filters = ["kn2.id != :id", "kn2.vec IS NOT NULL"]
-        params_base: dict[str, object] = {"k": top_k, "min_score": min_score}
-        if dataset_id is not None:
-            filters.append("kn2.dataset_id = :ds")
-            params_base["ds"] = dataset_id
-        if document_id is not None:
-            filters.append("kn2.document_id = :doc")
-            params_base["doc"] = document_id
-        if embedding_model is not None:
-            filters.append("kn2.embedding_model = :em")
-            params_base["em"] = embedding_model
-        where_clause = " AND ".join(filters)
-
-        sql = f"""
-            WITH q AS (SELECT vec FROM knowledge_nodes WHERE id = :id)
-            SELECT kn2.id as node_id,
-                   1.0 - (kn2.vec <=> (SELECT vec FROM q)) as score
-            FROM knowledge_nodes kn2
-            WHERE {where_clause}
-            ORDER BY kn2.vec <=> (SELECT vec FROM q)
-            LIMIT :k
-        """
-
-        for node_id in node_ids:
-            params = dict(params_base)
-            params["id"] = node_id
-            rows = db.execute(text(sql), params).mappings().all()
-            for row in rows:
-                score = float(row["score"])
-                if score < min_score:
-                    continue
-                _add_edge(edges, node_id, int(row["node_id"]), round(score, 4), "similarity")
-                if len(edges) >= max_edges:
-                    break
-            if len(edges) >= max_edges:
-                break
+        # Neighbours always share the node's embedding model: vectors of other
+        # models live in other spaces (and may have another dimension). Per
+        # model, all nodes are searched at once — from a current vector snapshot
+        # (dataset-wide, so only without a document filter) or in one statement.
+        by_model: dict[str, list[int]] = defaultdict(list)
+        for n in nodes:
+            if n.embedding_model:
+                by_model[n.embedding_model].append(n.id)
+        ranked: list[tuple[int, int, float]] = []
+        for model, model_ids in by_model.items():
+            snapshot = None
+            if dataset_id is not None and document_id is None:
+                snapshot = get_node_snapshot(db, dataset_id, model)
+            if snapshot is not None:
+                ranked += rank_edges(
+                    snapshot.neighbours(model_ids, top_k), min_score=min_score, max_edges=max_edges
+                )
+            else:
+                ranked += similarity_edges(
+                    db, model_ids, model, top_k=top_k, min_score=min_score, max_edges=max_edges,
+                    dataset_id=dataset_id, document_id=document_id,
+                )
+        ranked.sort(key=lambda e: (-e[2], e[0], e[1]))
+        for a, b, score in ranked[:max_edges]:
+            _add_edge(edges, a, b, round(score, 4), "similarity")
 
     if include_cooccurrence and len(edges) < max_edges:
         by_doc: dict[int, list[int]] = defaultdict(list)
@@ -242,15 +350,203 @@ def get_graph(
         if a in node_index and b in node_index
     ]
     node_items = [
-        GraphNodeOut(
-            id=n.id,
-            title=n.title,
-            context_text=n.context_text,
-            prob_vector=n.prob_vector,
-            top_levels=n.top_levels,
-            frequency=_node_meta(n)[0],
-            rationale=_node_meta(n)[1],
-        )
+        GraphNodeOut(**_node_fields(n, positions))
         for n in nodes
     ]
     return GraphOut(nodes=node_items, edges=edge_items)
+
+
+@router.get("/nodes/{node_id}/neighborhood", response_model=GraphNeighborhoodOut)
+def get_neighborhood(
+    node_id: int,
+    request: Request,
+    depth: int = Query(2, ge=1, le=4),
+    max_nodes: int = Query(50, ge=1, le=500),
+    max_edges: int = Query(500, ge=1, le=5000),
+    min_weight: float = Query(0.0, ge=0.0, le=1.0),
+    embedding_model: str | None = None,
+    include_cooccurrence: bool = True,
+    db: Session = Depends(get_db),
+):
+    """
+    The node's ego network: nodes up to `depth` hops away over persisted edges
+    (POST /graph/rebuild), at most `max_nodes` of them — nearer first, then by
+    the weight of the edge that reached them — and the edges among them.
+    Similarity edges are those of the node's embedding model unless
+    `embedding_model` is given. Cached and ETagged like GET /graph.
+    """
+    node = db.get(KnowledgeNode, node_id)
+    if not node:
+        raise HTTPException(404, "node not found")
+    params = dict(
+        node_id=node_id,
+        depth=depth,
+        max_nodes=max_nodes,
+        max_edges=max_edges,
+        min_weight=min_weight,
+        embedding_model=embedding_model,
+        include_cooccurrence=include_cooccurrence,
+    )
+    cache_key, cached = lookup(db, "graph/neighborhood", node.dataset_id, params)
+    if cache_key is None:
+        return _build_neighborhood(db, node, **params)
+    headers = {"ETag": etag_for(cache_key)}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    body = cached if cached is not None else _build_neighborhood(db, node, **params)
+    return json_response(cache_key, body, headers)
+
+
+def _build_neighborhood(
+    db: Session,
+    node: KnowledgeNode,
+    *,
+    node_id: int,
+    depth: int,
+    max_nodes: int,
+    max_edges: int,
+    min_weight: float,
+    embedding_model: str | None,
+    include_cooccurrence: bool,
+) -> GraphNeighborhoodOut:
+    methods = edge_methods(embedding_model or node.embedding_model, include_cooccurrence)
+    depths, truncated = walk(
+        db,
+        dataset_id=node.dataset_id,
+        center_id=node_id,
+        methods=methods,
+        depth=depth,
+        max_nodes=max_nodes,
+        min_weight=min_weight,
+    )
+    edges = subgraph_edges(
+        db, dataset_id=node.dataset_id, node_ids=depths, methods=methods, min_weight=min_weight, max_edges=max_edges
+    )
+    by_id = {
+        n.id: n
+        for n in db.query(KnowledgeNode).options(defer(KnowledgeNode.vec)).filter(KnowledgeNode.id.in_(list(depths))).all()
+    }
+    positions = _node_positions(db, list(by_id))
+    return GraphNeighborhoodOut(
+        center_id=node_id,
+        truncated=truncated,
+        nodes=[
+            GraphNeighborhoodNodeOut(**_node_fields(n, positions), depth=hops)
+            for n, hops in ((by_id.get(i), hops) for i, hops in depths.items())
+            if n is not None
+        ],
+        edges=[GraphEdgeOut(from_id=a, to_id=b, weight=w) for a, b, w in edges],
+    )
+
+
+@router.get("/summary", response_model=GraphSummaryOut)
+def get_summary(
+    request: Request,
+    dataset_id: int,
+    limit: int = Query(200, ge=1, le=5000),
+    min_size: int = Query(1, ge=1),
+    max_edges: int = Query(1000, ge=1, le=20000),
+    db: Session = Depends(get_db),
+):
+    """
+    One super-node per cluster of the last POST /graph/clusters/rebuild run —
+    the `limit` largest with at least `min_size` members — and the edges between
+    them; drill into one with GET /graph/clusters/{id}. Cached and ETagged like GET /graph.
+    """
+    params = dict(dataset_id=dataset_id, limit=limit, min_size=min_size, max_edges=max_edges)
+    cache_key, cached = lookup(db, "graph/summary", dataset_id, params)
+    if cache_key is None:
+        return _build_summary(db, **params)
+    headers = {"ETag": etag_for(cache_key)}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return json_response(cache_key, cached if cached is not None else _build_summary(db, **params), headers)
+
+
+def _build_summary(db: Session, *, dataset_id: int, limit: int, min_size: int, max_edges: int) -> GraphSummaryOut:
+    clusters = (
+        db.query(GraphCluster)
+        .filter(GraphCluster.dataset_id == dataset_id, GraphCluster.size >= min_size)
+        .order_by(GraphCluster.cluster_id.asc())  # numbered by size, largest first
+        .limit(limit)
+        .all()
+    )
+    totals = (
+        db.query(func.count(GraphCluster.cluster_id), func.coalesce(func.sum(GraphCluster.size), 0))
+        .filter(GraphCluster.dataset_id == dataset_id)
+        .one()
+    )
+    shown = [c.cluster_id for c in clusters]
+    edges = (
+        db.query(GraphClusterEdge)
+        .filter(
+            GraphClusterEdge.dataset_id == dataset_id,
+            GraphClusterEdge.from_cluster_id.in_(shown),
+            GraphClusterEdge.to_cluster_id.in_(shown),
+        )
+        .order_by(GraphClusterEdge.weight.desc(), GraphClusterEdge.from_cluster_id, GraphClusterEdge.to_cluster_id)
+        .limit(max_edges)
+        .all()
+    ) if shown else []
+    return GraphSummaryOut(
+        dataset_id=dataset_id,
+        total_clusters=int(totals[0]),
+        total_nodes=int(totals[1]),
+        clusters=[
+            GraphClusterOut(
+                id=c.cluster_id,
+                size=c.size,
+                label=c.label,
+                label_node_id=c.label_node_id,
+                prob_vector=c.prob_vector or [],
+                top_levels=c.top_levels or [],
+            )
+            for c in clusters
+        ],
+        edges=[GraphEdgeOut(from_id=e.from_cluster_id, to_id=e.to_cluster_id, weight=e.weight) for e in edges],
+    )
+
+
+@router.get("/clusters/{cluster_id}", response_model=GraphOut)
+def get_cluster(
+    cluster_id: int,
+    request: Request,
+    dataset_id: int,
+    limit_nodes: int = Query(2000, ge=1, le=10000),
+    max_edges: int = Query(2000, ge=1, le=20000),
+    db: Session = Depends(get_db),
+):
+    """Drill-down: the cluster's member nodes and the persisted edges among them."""
+    params = dict(dataset_id=dataset_id, cluster_id=cluster_id, limit_nodes=limit_nodes, max_edges=max_edges)
+    cache_key, cached = lookup(db, "graph/cluster", dataset_id, params)
+    if cache_key is None:
+        return _build_cluster(db, **params)
+    headers = {"ETag": etag_for(cache_key)}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return json_response(cache_key, cached if cached is not None else _build_cluster(db, **params), headers)
+
+
+def _build_cluster(db: Session, *, dataset_id: int, cluster_id: int, limit_nodes: int, max_edges: int) -> GraphOut:
+    if db.get(GraphCluster, (dataset_id, cluster_id)) is None:
+        raise HTTPException(404, "cluster not found")
+    nodes = (
+        db.query(KnowledgeNode)
+        .options(defer(KnowledgeNode.vec))
+        .join(GraphClusterMember, GraphClusterMember.node_id == KnowledgeNode.id)
+        .filter(GraphClusterMember.dataset_id == dataset_id, GraphClusterMember.cluster_id == cluster_id)
+        .order_by(KnowledgeNode.id.asc())
+        .limit(limit_nodes)
+        .all()
+    )
+    edges = subgraph_edges(
+        db, dataset_id=dataset_id, node_ids=[n.id for n in nodes], methods=None, max_edges=max_edges
+    )
+    positions = _node_positions(db, [n.id for n in nodes])
+    return GraphOut(
+        nodes=[
+            GraphNodeOut(**_node_fields(n, positions))
+            for n in nodes
+        ],
+        edges=[GraphEdgeOut(from_id=a, to_id=b, weight=w) for a, b, w in edges],
+    )
@@ -1,8 +1,7 @@
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session, defer
 
 from ..db.session import get_db
 from ..models.models import KnowledgeNode
@@ -10,13 +9,19 @@ from ..schemas.schemas import (
     KnowledgeNodeBulkIn,
     KnowledgeNodeListOut,
     KnowledgeNodeOut,
+    KnowledgeNodeSearchDebugOut,
     KnowledgeNodeSearchHit,
     KnowledgeNodeUpdateIn,
 )
-from ..services.embedding_provider import current_embedding_model
-from ..services.query_embed import embed_query
+from ..services.embedding import embed_texts
+from ..services.embedding_provider import get_embedding_provider
+from ..services.result_cache import bump_generation, encoded_response, json_response, lookup
+from ..services.vector_search import plan_knn, run_hybrid, run_knn, run_snapshot_knn
+from ..services.vector_snapshot import get_node_snapshot
+from ..services.wire_format import negotiate
+from ..services.query_embed import embed_query, normalize_query
 from ..services.bloom_multilabel import classify_bloom_multilabel
-from ..utils.vector import vector_literal
+from ..tasks.queue import schedule_graph_maintenance
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +30,8 @@ router = APIRouter(prefix="/nodes", tags=["nodes"])
 
 @router.post("", response_model=KnowledgeNodeListOut)
 def create_nodes(payload: KnowledgeNodeBulkIn, db: Session = Depends(get_db)):
-    embedding_model = current_embedding_model()
+    provider = get_embedding_provider()
+    embedding_model = provider.embedding_model
     items: list[KnowledgeNode] = []
 
     # Collect nodes that need prob_vector or vec computed.
@@ -41,7 +47,7 @@ def create_nodes(payload: KnowledgeNodeBulkIn, db: Session = Depends(get_db)):
             context_text=node.context_text,
             prob_vector=node.prob_vector or [],
             top_levels=node.top_levels or [],
-            embedding_dim=node.embedding_dim if node.embedding_dim is not None else 1536,
+            embedding_dim=node.embedding_dim if node.embedding_dim is not None else provider.dim,
             embedding_model=node.embedding_model or embedding_model,
             version=node.version if node.version is not None else 1,
             model_info=node.model_info or {},
@@ -73,29 +79,39 @@ def create_nodes(payload: KnowledgeNodeBulkIn, db: Session = Depends(get_db)):
             for i in needs_embed
         ]
         try:
-            vecs = embed_texts(texts_to_embed, dim=1536)
+            vecs = embed_texts(texts_to_embed)
             for i, vec in zip(needs_embed, vecs):
                 items[i].vec = vec
                 items[i].embedding_model = embedding_model
+                items[i].embedding_dim = provider.dim
         except Exception as exc:
             logger.warning("embed_texts failed during create_nodes: %s", exc)
 
+    bump_generation(db, {obj.dataset_id for obj in items})
     db.commit()
     for obj in items:
         db.refresh(obj)
+    schedule_graph_maintenance(db, {obj.dataset_id for obj in items})
     return {"total": len(items), "items": items}
 
 
 @router.get("", response_model=KnowledgeNodeListOut)
 def list_nodes(
+    request: Request,
     dataset_id: int | None = None,
     document_id: int | None = None,
     chunk_id: int | None = None,
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    include_text: bool = False,
     db: Session = Depends(get_db),
 ):
-    query = db.query(KnowledgeNode)
+    """
+    Nodes page by page. `Accept: application/msgpack` or
+    `application/vnd.apache.arrow.stream` gets columnar bodies, without
+    context_text / model_info unless `include_text`.
+    """
+    query = db.query(KnowledgeNode).options(defer(KnowledgeNode.vec))
     if dataset_id is not None:
         query = query.filter(KnowledgeNode.dataset_id == dataset_id)
     if document_id is not None:
@@ -105,51 +121,94 @@ def list_nodes(
 
     total = query.count()
     items = query.order_by(KnowledgeNode.id.asc()).offset(offset).limit(limit).all()
-    return {"total": total, "items": items}
+    page = KnowledgeNodeListOut(total=total, items=[KnowledgeNodeOut.model_validate(n) for n in items])
+    fmt = negotiate(request.headers.get("accept"))
+    accept_encoding = request.headers.get("accept-encoding", "")
+    return encoded_response(
+        None, page, fmt, {"Vary": "Accept"},
+        include_text=include_text, accept_encoding=accept_encoding,
+    )
 
 
-@router.get("/search", response_model=list[KnowledgeNodeSearchHit])
+@router.get("/search", response_model=list[KnowledgeNodeSearchHit] | KnowledgeNodeSearchDebugOut)
 def search_nodes(
     q: str = Query(..., min_length=1),
     dataset_id: int | None = None,
     embedding_model: str | None = None,
     top_k: int = 5,
-    dim: int = 1536,
+    dim: int | None = None,
+    oversample: int | None = Query(None, ge=1, le=100),
+    debug: bool = False,
+    mode: str = Query("vector", pattern="^(vector|hybrid)$"),
+    w_vec: float = Query(1.0, ge=0),
+    w_lex: float = Query(1.0, ge=0),
+    rrf_k: int | None = Query(None, ge=1),
     db: Session = Depends(get_db),
 ):
-    if dim != 1536:
-        raise HTTPException(400, "dim must be 1536 for current storage")
-    current_model = current_embedding_model()
+    """
+    Semantic node search; `oversample`, `debug` and the hybrid parameters
+    (`mode=hybrid`, `w_vec`, `w_lex`, `rrf_k`) as in GET /search. Lexical
+    matches in titles rank above matches in the context text.
+
+    Vector searches within a dataset that has a current vector snapshot
+    (VECTOR_SNAPSHOT_DIR) are answered from it, with an exact rerank.
+    Non-debug responses are cached as in GET /search.
+    """
+    provider = get_embedding_provider()
+    if dim is not None and dim != provider.dim:
+        raise HTTPException(400, f"dim must be {provider.dim} for the active embedding model")
+    current_model = provider.embedding_model
     effective_model = embedding_model or current_model
     if effective_model != current_model:
         raise HTTPException(
             400,
             "query embedding model must match the active EMBEDDING_PROVIDER; switch provider or omit embedding_model",
         )
-    qvec = embed_query(q, dim=dim)
-    lit = vector_literal(qvec)
+    cache_key = None
+    if not debug:
+        cache_key, cached = lookup(db, "nodes/search", dataset_id, {
+            "q": q if mode == "hybrid" else normalize_query(q), "top_k": top_k, "oversample": oversample,
+            "mode": mode, "w_vec": w_vec, "w_lex": w_lex, "rrf_k": rrf_k,
+        })
+        if cached is not None:
+            return json_response(cache_key, cached)
+    qvec = embed_query(q)
     filters = ["kn.vec IS NOT NULL", "kn.embedding_model = :em"]
-    params = {"qvec": lit, "k": top_k, "em": effective_model}
+    params = {"qvec": qvec, "k": top_k, "em": effective_model}
     if dataset_id is not None:
         filters.append("kn.dataset_id = :ds")
         params["ds"] = dataset_id
-    where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-    sql = f"""
-        WITH q AS (SELECT CAST(:qvec AS vector) AS v)
-        SELECT kn.id as node_id,
+    sql_kw = dict(
+        select="""kn.id as node_id,
                kn.title,
                kn.context_text,
                kn.dataset_id,
                kn.document_id,
                kn.chunk_id,
-               1.0 - (kn.vec <=> (SELECT v FROM q)) as score
-        FROM knowledge_nodes kn
-        {where_clause}
-        ORDER BY kn.vec <=> (SELECT v FROM q)
-        LIMIT :k
-    """
-    rows = db.execute(text(sql), params).mappings().all()
-    return rows
+               1.0 - (kn.vec <=> (SELECT v FROM q)) as score""",
+        from_="knowledge_nodes kn",
+        where=" AND ".join(filters),
+        id_column="kn.id",
+        column="kn.vec",
+        debug=debug,
+    )
+    snapshot = None
+    if mode == "vector" and oversample is None and dataset_id is not None:
+        snapshot = get_node_snapshot(db, dataset_id, effective_model)
+    if snapshot is not None:
+        rows, info = run_snapshot_knn(db, snapshot, params=params, key="node_id", **sql_kw)
+    else:
+        plan = plan_knn(db, "knowledge_nodes", effective_model, top_k, oversample, dataset_id)
+        if mode == "hybrid":
+            rows, info = run_hybrid(
+                db, tsv_column="kn.tsv", params={**params, "qtext": q},
+                w_vec=w_vec, w_lex=w_lex, rrf_k=rrf_k, plan=plan, **sql_kw,
+            )
+        else:
+            rows, info = run_knn(db, params=params, plan=plan, key="node_id", **sql_kw)
+    if debug:
+        return {"items": rows, "debug": info}
+    return json_response(cache_key, [KnowledgeNodeSearchHit.model_validate(dict(r)) for r in rows])
 
 
 @router.get("/{node_id}", response_model=KnowledgeNodeOut)
@@ -181,8 +240,10 @@ def update_node(node_id: int, payload: KnowledgeNodeUpdateIn, db: Session = Depe
         node.version = payload.version
     if payload.model_info is not None:
         node.model_info = payload.model_info
+    bump_generation(db, node.dataset_id)
     db.commit()
     db.refresh(node)
+    schedule_graph_maintenance(db, node.dataset_id)
     return node
 
 
@@ -191,6 +252,9 @@ def delete_node(node_id: int, db: Session = Depends(get_db)):
     node = db.get(KnowledgeNode, node_id)
     if not node:
         raise HTTPException(404, "node not found")
+    dataset_id = node.dataset_id
+    bump_generation(db, dataset_id)
     db.delete(node)
     db.commit()
+    schedule_graph_maintenance(db, dataset_id)
     return {"ok": True}
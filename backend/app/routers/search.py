@@ -1,52 +1,143 @@
+import os
+
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from ..db.session import get_db
-from ..services.query_embed import embed_query
-from ..services.embedding_provider import current_embedding_model
-from ..utils.vector import vector_literal
+from ..schemas.schemas import SearchBatchIn, SearchBatchOut
+from ..services.query_embed import embed_queries, embed_query, normalize_query, query_cache_stats
+from ..services.result_cache import json_response, lookup, result_cache_stats
+from ..services.embedding_provider import get_embedding_provider
+from ..services.vector_search import plan_knn, run_batch_knn, run_hybrid, run_knn
 
 router = APIRouter(prefix="/search", tags=["search"])
 
+# Queries accepted by one POST /search/batch call.
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "1000"))
+
 @router.get("")
 def search(
     q: str = Query(..., min_length=1),
     dataset_id: int | None = None,
     embedding_model: str | None = None,
     top_k: int = 5,
-    dim: int = 1536,
+    dim: int | None = None,
+    oversample: int | None = Query(None, ge=1, le=100),
+    debug: bool = False,
+    mode: str = Query("vector", pattern="^(vector|hybrid)$"),
+    w_vec: float = Query(1.0, ge=0),
+    w_lex: float = Query(1.0, ge=0),
+    rrf_k: int | None = Query(None, ge=1),
     db: Session = Depends(get_db),
 ):
-    if dim != 1536:
-        raise HTTPException(400, "dim must be 1536 for current storage")
-    current_model = current_embedding_model()
+    """
+    Semantic search over chunk embeddings. `oversample` enables two-stage
+    retrieval (top_k * oversample candidates from the quantized index, reranked
+    exactly); `debug=true` wraps the hits as {"items", "debug"} with the plan
+    and recall against exact search.
+
+    `mode=hybrid` fuses the vector hits with full-text matches of `q` by
+    reciprocal rank fusion (branch weights `w_vec` / `w_lex`, constant `rrf_k`);
+    hits then also carry rrf_score, vector_rank and lexical_rank.
+
+    Non-debug responses are cached until the dataset's next write
+    (services/result_cache.py).
+    """
+    provider = get_embedding_provider()
+    if dim is not None and dim != provider.dim:
+        raise HTTPException(400, f"dim must be {provider.dim} for the active embedding model")
+    current_model = provider.embedding_model
     em = embedding_model or current_model
     if em != current_model:
         raise HTTPException(
             400,
             "query embedding model must match the active EMBEDDING_PROVIDER; switch provider or omit embedding_model",
         )
-    qvec = embed_query(q, dim=dim)
-    lit = vector_literal(qvec)
-    sql = """
-        WITH q AS (SELECT CAST(:qvec AS vector) AS v)
-        SELECT c.id as chunk_id, c.text,
+    cache_key = None
+    if not debug:
+        cache_key, cached = lookup(db, "search", dataset_id, {
+            "q": q if mode == "hybrid" else normalize_query(q), "top_k": top_k, "oversample": oversample,
+            "mode": mode, "w_vec": w_vec, "w_lex": w_lex, "rrf_k": rrf_k,
+        })
+        if cached is not None:
+            return json_response(cache_key, cached)
+    qvec = embed_query(q)
+    filters = ["e.vec IS NOT NULL", "e.model = :em"]
+    params: dict[str, object] = {"qvec": qvec, "k": top_k, "em": em}
+    if dataset_id is not None:
+        filters.append("e.dataset_id = :ds")
+        params["ds"] = dataset_id
+    sql_kw = dict(
+        select="""c.id as chunk_id, c.text,
                d.id as document_id, d.title as document_title,
-               1.0 - (e.vec <=> (SELECT v FROM q)) as score
-        FROM embeddings e
+               1.0 - (e.vec <=> (SELECT v FROM q)) as score""",
+        from_="""embeddings e
         JOIN chunks c ON c.id = e.chunk_id
-        JOIN documents d ON d.id = c.document_id
-        {where_clause}
-        ORDER BY e.vec <=> (SELECT v FROM q)
-        LIMIT :k
+        JOIN documents d ON d.id = c.document_id""",
+        where=" AND ".join(filters),
+        id_column="e.id",
+        column="e.vec",
+        plan=plan_knn(db, "embeddings", em, top_k, oversample, dataset_id),
+        debug=debug,
+    )
+    if mode == "hybrid":
+        rows, info = run_hybrid(
+            db, tsv_column="c.tsv", params={**params, "qtext": q},
+            w_vec=w_vec, w_lex=w_lex, rrf_k=rrf_k, **sql_kw,
+        )
+    else:
+        rows, info = run_knn(db, params=params, key="chunk_id", **sql_kw)
+    if debug:
+        return {"items": rows, "debug": info}
+    return json_response(cache_key, rows)
+
+
+@router.post("/batch", response_model=SearchBatchOut)
+def search_batch(payload: SearchBatchIn, db: Session = Depends(get_db)):
     """
+    GET /search for many queries with shared filters: the queries are embedded
+    as one provider batch (cached ones skipped) and searched in one SQL
+    statement. Results come back in input order.
+    """
+    if not payload.queries:
+        raise HTTPException(400, "queries must not be empty")
+    if len(payload.queries) > SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(400, f"at most {SEARCH_BATCH_MAX_QUERIES} queries per batch")
+    if any(not q.strip() for q in payload.queries):
+        raise HTTPException(400, "queries must not be blank")
+    if not 1 <= payload.top_k <= 100:
+        raise HTTPException(400, "top_k must be between 1 and 100")
+    provider = get_embedding_provider()
+    em = payload.embedding_model or provider.embedding_model
+    if em != provider.embedding_model:
+        raise HTTPException(
+            400,
+            "query embedding model must match the active EMBEDDING_PROVIDER; switch provider or omit embedding_model",
+        )
+    qvecs = embed_queries(payload.queries)
     filters = ["e.vec IS NOT NULL", "e.model = :em"]
-    params: dict[str, object] = {"qvec": lit, "k": top_k, "em": em}
-    if dataset_id is not None:
-        filters.append("d.dataset_id = :ds")
-        params["ds"] = dataset_id
-    where_clause = "WHERE " + " AND ".join(filters)
-    rows = db.execute(text(sql.format(where_clause=where_clause)), {
-        **params
-    }).mappings().all()
-    return rows
+    params: dict[str, object] = {"k": payload.top_k, "em": em}
+    if payload.dataset_id is not None:
+        filters.append("e.dataset_id = :ds")
+        params["ds"] = payload.dataset_id
+    hits = run_batch_knn(
+        db,
+        select="""c.id as chunk_id, c.text,
+               d.id as document_id, d.title as document_title,
+               1.0 - (e.vec <=> qs.v) as score""",
+        from_="""embeddings e
+        JOIN chunks c ON c.id = e.chunk_id
+        JOIN documents d ON d.id = c.document_id""",
+        where=" AND ".join(filters),
+        id_column="e.id",
+        column="e.vec",
+        qvecs=qvecs,
+        params=params,
+        plan=plan_knn(db, "embeddings", em, payload.top_k, None, payload.dataset_id),
+    )
+    return {"results": [{"query": q, "hits": h} for q, h in zip(payload.queries, hits)]}
+
+
+@router.get("/cache/stats")
+def search_cache_stats():
+    """Hit/miss counters of the query-embedding and response caches (this replica + Redis tier)."""
+    return {"query_embedding": query_cache_stats(), "results": result_cache_stats()}
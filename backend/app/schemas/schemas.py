@@ -35,6 +35,20 @@ class DocumentOut(BaseModel):
 class SearchHit(BaseModel):
     chunk_id:int; text:str; score:float; document_id:int; document_title:str
 
+class SearchBatchIn(BaseModel):
+    queries: List[str]
+    dataset_id: Optional[int] = None
+    embedding_model: Optional[str] = None
+    top_k: int = 5
+
+class SearchBatchResult(BaseModel):
+    query: str
+    hits: List[SearchHit]
+
+class SearchBatchOut(BaseModel):
+    # One entry per input query, in input order
+    results: List[SearchBatchResult]
+
 class AnnotateIn(BaseModel):
     level: BloomLevel
     rubric: Optional[str]=None
@@ -164,7 +178,8 @@ class KnowledgeNodeIn(BaseModel):
     top_levels: Optional[List[BloomLevel]] = None
     # None → auto-compute via embed_texts in POST /nodes
     vec: Optional[List[float]] = None
-    embedding_dim: Optional[int] = 1536
+    # None → native dim of the active embedding model
+    embedding_dim: Optional[int] = None
     embedding_model: Optional[str] = None
     version: Optional[int] = 1
     model_info: Optional[dict] = None
@@ -219,6 +234,15 @@ class KnowledgeNodeSearchHit(BaseModel):
     dataset_id: int
     document_id: Optional[int] = None
     chunk_id: Optional[int] = None
+    # mode=hybrid only: fused score and 1-based rank in each branch (None = missed)
+    rrf_score: Optional[float] = None
+    vector_rank: Optional[int] = None
+    lexical_rank: Optional[int] = None
+
+class KnowledgeNodeSearchDebugOut(BaseModel):
+    items: List[KnowledgeNodeSearchHit]
+    # plan mode, candidates, recall vs exact search, latencies
+    debug: dict
 
 class NodeLabelsIn(BaseModel):
     labels: List[BloomLevel]
@@ -263,7 +287,8 @@ class AnalyzeContentIn(BaseModel):
     min_freq: int = 1
     min_prob: Optional[float] = 0.2
     max_levels: Optional[int] = 6
-    embedding_dim: Optional[int] = 1536
+    # None → native dim of the active embedding model
+    embedding_dim: Optional[int] = None
     embedding_model: Optional[str] = None
     extractor: Optional[str] = "heuristic-v1"
     classifier: Optional[str] = "keyword-v1"
@@ -288,6 +313,9 @@ class GraphNodeOut(BaseModel):
     top_levels: List[BloomLevel]
     frequency: Optional[int] = None
     rationale: Optional[str] = None
+    # Precomputed layout in [-1, 1] (current graph version only; see services/graph_layout.py).
+    x: Optional[float] = None
+    y: Optional[float] = None
 
 class GraphEdgeOut(BaseModel):
     from_id: int
@@ -298,6 +326,15 @@ class GraphOut(BaseModel):
     nodes: List[GraphNodeOut]
     edges: List[GraphEdgeOut]
 
+class GraphNeighborhoodNodeOut(GraphNodeOut):
+    depth: int  # hops from the centre node
+
+class GraphNeighborhoodOut(BaseModel):
+    center_id: int
+    truncated: bool  # max_nodes cut the walk short
+    nodes: List[GraphNeighborhoodNodeOut]
+    edges: List[GraphEdgeOut]
+
 class GraphRebuildIn(BaseModel):
     dataset_id: int
     embedding_model: Optional[str] = None
@@ -310,3 +347,23 @@ class GraphRebuildIn(BaseModel):
 
 class GraphRebuildOut(BaseModel):
     job_id: int
+
+class GraphClusterIn(BaseModel):
+    dataset_id: int
+    include_cooccurrence: bool = True
+    max_iterations: int = 20
+
+class GraphClusterOut(BaseModel):
+    id: int
+    size: int
+    label: Optional[str] = None  # title of the best-connected member
+    label_node_id: Optional[int] = None
+    prob_vector: List[float]  # mean of the members' Bloom prob vectors
+    top_levels: List[BloomLevel]
+
+class GraphSummaryOut(BaseModel):
+    dataset_id: int
+    total_clusters: int
+    total_nodes: int
+    clusters: List[GraphClusterOut]
+    edges: List[GraphEdgeOut]  # between cluster ids: summed weight of the node edges
@@ -1,14 +1,76 @@
 from __future__ import annotations
 
-from .embedding_provider import STORAGE_DIM, get_embedding_provider
+from typing import Iterator
 
+import numpy as np
 
-def embed_texts(texts: list[str], dim: int = STORAGE_DIM) -> list[list[float]]:
+from .embedding_cache import get_embedding_cache, text_key
+from .embedding_provider import get_embedding_provider
+
+# Keys per cache round-trip when streaming.
+_CACHE_LOOKUP_WINDOW = 2000
+
+
+def iter_embed_texts(
+    texts: list[str], batch_size: int | None = None
+) -> Iterator[tuple[list[int], np.ndarray]]:
     """
-    Returns embeddings as Python lists.
-    Storage is fixed to 1536 dims (pgvector column vector(1536)).
+    Streams embeddings as `(positions, vectors)` batches, positions indexing into
+    `texts`. Memory stays bounded by one batch regardless of input size, so
+    callers can write each batch before the next one is computed.
+
+    Identical texts are embedded once per (embedding_model, content hash): cached
+    vectors are yielded first, then only misses are sent to the provider.
     """
-    if dim != STORAGE_DIM:
-        raise ValueError(f"dim must be {STORAGE_DIM} for current storage")
+    if not texts:
+        return
     provider = get_embedding_provider()
-    return provider.embed(texts)
+    cache = get_embedding_cache()
+    if cache is None:
+        yield from provider.embed_batches(texts, batch_size)
+        return
+
+    model = provider.embedding_model
+    # key -> positions of every text with that content, for misses only.
+    missing: dict[bytes, list[int]] = {}
+    for start in range(0, len(texts), _CACHE_LOOKUP_WINDOW):
+        window = range(start, min(start + _CACHE_LOOKUP_WINDOW, len(texts)))
+        keys = {i: text_key(texts[i]) for i in window}
+        found = cache.get_many(model, list(dict.fromkeys(keys.values())))
+        hit_positions = [i for i, k in keys.items() if k in found]
+        if hit_positions:
+            yield hit_positions, np.stack([found[keys[i]] for i in hit_positions])
+        for i, k in keys.items():
+            if k not in found:
+                missing.setdefault(k, []).append(i)
+
+    if not missing:
+        return
+    miss_keys = list(missing)
+    miss_texts = [texts[missing[k][0]] for k in miss_keys]
+    for batch_positions, vecs in provider.embed_batches(miss_texts, batch_size):
+        cache.put_many(model, {miss_keys[j]: vecs[n] for n, j in enumerate(batch_positions)})
+        positions: list[int] = []
+        rows: list[int] = []
+        for n, j in enumerate(batch_positions):
+            for pos in missing[miss_keys[j]]:
+                positions.append(pos)
+                rows.append(n)
+        yield positions, vecs[rows]
+
+
+def embed_texts(texts: list[str], dim: int | None = None) -> np.ndarray:
+    """
+    Returns embeddings as a float32 array of shape (len(texts), provider.dim),
+    ready to be bound directly as pgvector parameters (binary adapter, see
+    db/session.py). Vectors keep the model's native dimension; passing `dim`
+    only asserts it. Large inputs should prefer `iter_embed_texts`, which does
+    not hold every vector in memory at once.
+    """
+    provider_dim = get_embedding_provider().dim
+    if dim is not None and dim != provider_dim:
+        raise ValueError(f"dim must be {provider_dim} for the active embedding model")
+    out = np.empty((len(texts), provider_dim), dtype=np.float32)
+    for positions, vecs in iter_embed_texts(texts):
+        out[positions] = vecs
+    return out
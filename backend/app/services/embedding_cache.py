@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on cached vectors per cache (all models together).
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+# Eviction runs at most once per this many inserted vectors (Postgres backend).
+_EVICT_EVERY = 5000
+
+
+def text_key(text: str) -> bytes:
+    """Content address of a text: sha256 over its UTF-8 bytes."""
+    return hashlib.sha256((text or "").encode("utf-8")).digest()
+
+
+class EmbeddingCache(ABC):
+    """
+    Cache of provider outputs keyed by (embedding_model, text_key).
+    Implementations must never raise on lookup/store failures — a broken cache
+    only costs recomputation.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def get_many(self, model: str, keys: Sequence[bytes]) -> dict[bytes, np.ndarray]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_many(self, model: str, items: dict[bytes, np.ndarray]) -> None:
+        raise NotImplementedError
+
+
+class MemoryEmbeddingCache(EmbeddingCache):
+    """Per-process LRU; used in tests and when no database is available."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self._max = max(1, int(max_entries))
+        self._data: OrderedDict[tuple[str, bytes], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_many(self, model: str, keys: Sequence[bytes]) -> dict[bytes, np.ndarray]:
+        out: dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for k in keys:
+                vec = self._data.get((model, k))
+                if vec is not None:
+                    self._data.move_to_end((model, k))
+                    out[k] = vec
+        return out
+
+    def put_many(self, model: str, items: dict[bytes, np.ndarray]) -> None:
+        with self._lock:
+            for k, vec in items.items():
+                self._data[(model, k)] = np.asarray(vec, dtype=np.float32)
+                self._data.move_to_end((model, k))
+            while len(self._data) > self._max:
+                self._data.popitem(last=False)
+
+
+class PostgresEmbeddingCache(EmbeddingCache):
+    """
+    Persistent cache in the `embedding_cache` table (migration 0018), shared by the
+    API and all workers. Vectors are stored as raw float32 bytes so any model
+    dimension fits. Eviction is least-recently-used by `last_used_at`.
+    """
+
+    name = "postgres"
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        from ..db.session import engine  # local import: keeps the module DB-agnostic
+
+        self._engine = engine
+        self._max = max(1, int(max_entries))
+        self._inserted = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, model: str, keys: Sequence[bytes]) -> dict[bytes, np.ndarray]:
+        if not keys:
+            return {}
+        from sqlalchemy import text
+
+        try:
+            with self._engine.begin() as conn:
+                rows = conn.execute(
+                    text(
+                        "SELECT text_hash, vec FROM embedding_cache "
+                        "WHERE model = :m AND text_hash = ANY(:keys)"
+                    ),
+                    {"m": model, "keys": list(keys)},
+                ).all()
+                hits = [bytes(r[0]) for r in rows]
+                if hits:
+                    # Touch only rows not used recently to keep hit-path writes cheap.
+                    conn.execute(
+                        text(
+                            "UPDATE embedding_cache SET last_used_at = now() "
+                            "WHERE model = :m AND text_hash = ANY(:keys) "
+                            "AND last_used_at < now() - interval '1 hour'"
+                        ),
+                        {"m": model, "keys": hits},
+                    )
+        except Exception as exc:
+            logger.warning("embedding cache lookup failed: %s", exc)
+            return {}
+        return {bytes(r[0]): np.frombuffer(bytes(r[1]), dtype=np.float32) for r in rows}
+
+    def put_many(self, model: str, items: dict[bytes, np.ndarray]) -> None:
+        if not items:
+            return
+        from sqlalchemy import text
+
+        payload = [
+            {
+                "m": model,
+                "h": k,
+                "d": int(np.asarray(v).shape[-1]),
+                "v": np.asarray(v, dtype=np.float32).tobytes(),
+            }
+            for k, v in items.items()
+        ]
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(
+                    text(
+                        """
+                        INSERT INTO embedding_cache (model, text_hash, dim, vec)
+                        VALUES (:m, :h, :d, :v)
+                        ON CONFLICT (model, text_hash)
+                        DO UPDATE SET vec = EXCLUDED.vec,
+                                      dim = EXCLUDED.dim,
+                                      last_used_at = now()
+                        """
+                    ),
+                    payload,
+                )
+        except Exception as exc:
+            logger.warning("embedding cache store failed: %s", exc)
+            return
+        with self._lock:
+            self._inserted += len(payload)
+            due = self._inserted >= _EVICT_EVERY
+            if due:
+                self._inserted = 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drops least-recently-used rows above the configured bound."""
+        from sqlalchemy import text
+
+        try:
+            with self._engine.begin() as conn:
+                total = conn.execute(text("SELECT count(*) FROM embedding_cache")).scalar() or 0
+                excess = int(total) - self._max
+                if excess <= 0:
+                    return 0
+                conn.execute(
+                    text(
+                        """
+                        DELETE FROM embedding_cache
+                        WHERE (model, text_hash) IN (
+                            SELECT model, text_hash FROM embedding_cache
+                            ORDER BY last_used_at ASC
+                            LIMIT :n
+                        )
+                        """
+                    ),
+                    {"n": excess},
+                )
+                logger.info("embedding cache: evicted %d rows", excess)
+                return excess
+        except Exception as exc:
+            logger.warning("embedding cache eviction failed: %s", exc)
+            return 0
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> EmbeddingCache | None:
+    name = os.getenv("EMBEDDING_CACHE", "postgres").strip().lower()
+    if name in ("", "0", "off", "none", "false"):
+        return None
+    if name == "memory":
+        return MemoryEmbeddingCache()
+    if name == "postgres":
+        return PostgresEmbeddingCache()
+    raise RuntimeError(f"Unknown EMBEDDING_CACHE: {name}")
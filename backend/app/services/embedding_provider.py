@@ -3,17 +3,19 @@ from __future__ import annotations
 import hashlib
 import os
 import re
+import threading
 import warnings
 from abc import ABC, abstractmethod
-from functools import lru_cache
-from typing import Sequence
+from typing import Iterator, Sequence
 
 import numpy as np
 
-# multilingual-e5-large produces 1024-dim vectors; zero-padded to 1536 so the pgvector
-# column type (vector(1536)) stays compatible with OpenAI text-embedding-3-small.
-# Override with EMBEDDING_MODEL_LOCAL env var to use a different local model.
-STORAGE_DIM = 1536
+# Vectors are stored at each model's native dimension (the pgvector columns are
+# dimensionless, see migration 0019); this is the width of the hashing/random
+# providers and of OpenAI text-embedding-3-small.
+DEFAULT_DIM = 1536
+# Texts per provider call in the streaming API (see EmbeddingProvider.embed_batches).
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
 
 
 class EmbeddingProvider(ABC):
@@ -24,22 +26,33 @@ class EmbeddingProvider(ABC):
     def embedding_model(self) -> str:
         raise NotImplementedError
 
+    @property
+    def dim(self) -> int:
+        """Native output dimension; every vector of `embedding_model` has this width."""
+        return DEFAULT_DIM
+
     @abstractmethod
-    def embed(self, texts: Sequence[str]) -> list[list[float]]:
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Returns a float32 array of shape (len(texts), self.dim)."""
         raise NotImplementedError
 
+    def embed_batches(
+        self, texts: Sequence[str], batch_size: int | None = None
+    ) -> Iterator[tuple[list[int], np.ndarray]]:
+        """
+        Streaming variant of `embed`: yields `(positions, vectors)` per batch, where
+        `positions` index into `texts` and `vectors` is a float32 array of
+        shape (len(positions), self.dim). Every position is yielded exactly once;
+        the order of batches is provider-specific.
+        """
+        size = max(1, int(batch_size or EMBEDDING_BATCH_SIZE))
+        for start in range(0, len(texts), size):
+            positions = list(range(start, min(start + size, len(texts))))
+            yield positions, self.embed([texts[i] for i in positions])
+
 
-def _pad_to_storage(vecs: np.ndarray) -> np.ndarray:
-    if vecs.ndim != 2:
-        raise ValueError("vecs must be 2D")
-    dim = int(vecs.shape[1])
-    if dim > STORAGE_DIM:
-        raise ValueError(f"embedding dim {dim} exceeds storage dim {STORAGE_DIM}")
-    if dim == STORAGE_DIM:
-        return vecs.astype(np.float32, copy=False)
-    out = np.zeros((vecs.shape[0], STORAGE_DIM), dtype=np.float32)
-    out[:, :dim] = vecs.astype(np.float32, copy=False)
-    return out
+def _empty(dim: int = DEFAULT_DIM) -> np.ndarray:
+    return np.empty((0, dim), dtype=np.float32)
 
 
 def _l2_normalize(vecs: np.ndarray) -> np.ndarray:
@@ -47,45 +60,107 @@ def _l2_normalize(vecs: np.ndarray) -> np.ndarray:
     return vecs / norms
 
 
+def length_sorted_batches(texts: Sequence[str], batch_size: int | None = None) -> Iterator[list[int]]:
+    """
+    Positions of `texts` in batches sorted by length across the whole input, so
+    each batch pads to similar sequence lengths (transformer providers).
+    """
+    size = max(1, int(batch_size or EMBEDDING_BATCH_SIZE))
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i] or ""), reverse=True)
+    for start in range(0, len(order), size):
+        yield order[start : start + size]
+
+
 _TOK_RE = re.compile(r"[\w-]+", re.UNICODE)
+# Bounded memo of token -> signed slot; vocabularies of course material are
+# small, so almost every token after warm-up skips blake2b entirely.
+HASH_TOKEN_CACHE_SIZE = int(os.getenv("HASH_TOKEN_CACHE_SIZE", "262144"))
+# Rows per scatter-add block in HashingProvider (bounds the bincount buffer).
+_HASH_BLOCK_ROWS = 2048
+_TOKEN_SLOTS: dict[str, int] = {}
+_TOKEN_SLOTS_LOCK = threading.Lock()
+
+
+def _token_slot(tok: str) -> int:
+    """
+    Hash bucket of a token encoded as one int: `col` for sign +1, `-(col + 1)`
+    for sign -1. Same blake2b scheme as `hash:v1:1536`.
+    """
+    h = hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest()
+    v = int.from_bytes(h, "little", signed=False)
+    col = v % DEFAULT_DIM
+    return -(col + 1) if (v >> 63) & 1 else col
+
+
+def _token_slots(tokens: list[str]) -> np.ndarray:
+    # Slots of this call come from its own dict: other threads may reset the
+    # shared memo at any time without affecting the lookup below.
+    slots = {tok: _TOKEN_SLOTS.get(tok) for tok in set(tokens)}
+    missing = [tok for tok, slot in slots.items() if slot is None]
+    if missing:
+        for tok in missing:
+            slots[tok] = _token_slot(tok)
+        with _TOKEN_SLOTS_LOCK:
+            if len(_TOKEN_SLOTS) + len(missing) > HASH_TOKEN_CACHE_SIZE:
+                _TOKEN_SLOTS.clear()
+            _TOKEN_SLOTS.update((tok, slots[tok]) for tok in missing[:HASH_TOKEN_CACHE_SIZE])
+    return np.fromiter(map(slots.__getitem__, tokens), dtype=np.int64, count=len(tokens))
 
 
 class HashingProvider(EmbeddingProvider):
     """
     Lightweight offline embeddings (no torch).
-    Uses a signed hashing trick into STORAGE_DIM dimensions + L2 normalization.
+    Uses a signed hashing trick into DEFAULT_DIM dimensions + L2 normalization.
     This is not as semantic as real transformer embeddings, but it is deterministic and
     works well enough for graph edges and search on small/medium datasets.
     """
 
     name = "hash"
 
-    def __init__(self, dim: int = STORAGE_DIM):
-        if dim != STORAGE_DIM:
-            raise ValueError("HashingProvider only supports storage dim")
+    def __init__(self, dim: int = DEFAULT_DIM):
+        if dim != DEFAULT_DIM:
+            raise ValueError(f"HashingProvider only supports dim={DEFAULT_DIM}")
         self._dim = dim
 
     @property
     def embedding_model(self) -> str:
         return "hash:v1:1536"
 
-    def embed(self, texts: Sequence[str]) -> list[list[float]]:
-        if not texts:
-            return []
-        out = np.zeros((len(texts), self._dim), dtype=np.float32)
-        for i, t in enumerate(texts):
+    def _embed_block(self, texts: Sequence[str]) -> np.ndarray:
+        n = len(texts)
+        lens: list[int] = []
+        flat: list[str] = []
+        for t in texts:
             toks = _TOK_RE.findall((t or "").lower())
-            if not toks:
-                continue
-            # term frequency
-            for tok in toks:
-                h = hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest()
-                v = int.from_bytes(h, "little", signed=False)
-                idx = v % self._dim
-                sign = -1.0 if (v >> 63) & 1 else 1.0
-                out[i, idx] += sign
-        out = _l2_normalize(out)
-        return out.tolist()
+            lens.append(len(toks))
+            flat.extend(toks)
+        if not flat:
+            return np.zeros((n, self._dim), dtype=np.float32)
+        slots = _token_slots(flat)
+        negative = slots < 0
+        cols = np.where(negative, -slots - 1, slots)
+        signs = np.where(negative, -1.0, 1.0)
+        rows = np.repeat(np.arange(n, dtype=np.int64), lens)
+        # Term frequency via one scatter-add over flattened (row, column) indices.
+        counts = np.bincount(rows * self._dim + cols, weights=signs, minlength=n * self._dim)
+        out = counts.reshape(n, self._dim).astype(np.float32)
+        return _l2_normalize(out)
+
+    def embed_batches(
+        self, texts: Sequence[str], batch_size: int | None = None
+    ) -> Iterator[tuple[list[int], np.ndarray]]:
+        size = max(1, int(batch_size or _HASH_BLOCK_ROWS))
+        for start in range(0, len(texts), size):
+            positions = list(range(start, min(start + size, len(texts))))
+            yield positions, self._embed_block([texts[i] for i in positions])
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return _empty()
+        out = np.empty((len(texts), self._dim), dtype=np.float32)
+        for positions, vecs in self.embed_batches(texts):
+            out[positions[0] : positions[-1] + 1] = vecs
+        return out
 
 
 class LocalProvider(EmbeddingProvider):
@@ -101,50 +176,97 @@ class LocalProvider(EmbeddingProvider):
             ) from e
         # CPU-only; model weights are downloaded at runtime if missing.
         self._model = SentenceTransformer(model_name, device="cpu")
+        self._dim = int(self._model.get_sentence_embedding_dimension())
 
     @property
     def embedding_model(self) -> str:
-        return f"local:{self._model_name}:padded{STORAGE_DIM}"
+        return f"local:{self._model_name}:{self._dim}"
 
-    def embed(self, texts: Sequence[str]) -> list[list[float]]:
-        if not texts:
-            return []
+    @property
+    def legacy_embedding_model(self) -> str:
+        """Model string of rows written before native-dim storage (zero-padded to 1536)."""
+        return f"local:{self._model_name}:padded{DEFAULT_DIM}"
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def _encode(self, texts: list[str], batch_size: int) -> np.ndarray:
         vecs = self._model.encode(
-            list(texts),
+            texts,
+            batch_size=batch_size,
             normalize_embeddings=True,
             show_progress_bar=False,
+            convert_to_numpy=True,
         )
-        vecs = np.asarray(vecs, dtype=np.float32)
-        vecs = _pad_to_storage(vecs)
-        # normalize again after padding (padding changes norm slightly)
-        vecs = _l2_normalize(vecs)
-        return vecs.tolist()
+        return np.asarray(vecs, dtype=np.float32)
+
+    def embed_batches(
+        self, texts: Sequence[str], batch_size: int | None = None
+    ) -> Iterator[tuple[list[int], np.ndarray]]:
+        # sentence-transformers only sorts by length within one call.
+        size = max(1, int(batch_size or EMBEDDING_BATCH_SIZE))
+        for positions in length_sorted_batches(texts, size):
+            yield positions, self._encode([texts[i] for i in positions], size)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return _empty(self._dim)
+        out = np.empty((len(texts), self._dim), dtype=np.float32)
+        for positions, vecs in self.embed_batches(texts):
+            out[positions] = vecs
+        return out
+
+
+# Native widths of OpenAI embedding models; others need OPENAI_EMBEDDING_DIM.
+_OPENAI_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
 
 
 class OpenAIProvider(EmbeddingProvider):
     name = "openai"
 
-    def __init__(self, model: str):
+    def __init__(self, model: str, dim: int | None = None):
         self._model = model
-        from .openai_client import embeddings  # local import to avoid hard dependency
+        self._dim = int(dim or _OPENAI_DIMS.get(model, DEFAULT_DIM))
+        from .openai_client import iter_embeddings  # local import to avoid hard dependency
 
-        self._embeddings_fn = embeddings
+        self._iter_embeddings = iter_embeddings
 
     @property
     def embedding_model(self) -> str:
         return f"openai:{self._model}"
 
-    def embed(self, texts: Sequence[str]) -> list[list[float]]:
-        if not texts:
-            return []
-        vecs = self._embeddings_fn(self._model, list(texts))
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def _to_array(self, vecs: list[list[float]]) -> np.ndarray:
         arr = np.asarray(vecs, dtype=np.float32)
-        if arr.shape[1] != STORAGE_DIM:
+        if arr.shape[1] != self._dim:
             raise RuntimeError(
-                f"OpenAI embeddings returned dim={arr.shape[1]} but storage expects {STORAGE_DIM}"
+                f"OpenAI embeddings returned dim={arr.shape[1]} but {self._model} is configured for {self._dim}"
             )
-        arr = _l2_normalize(arr)
-        return arr.tolist()
+        return _l2_normalize(arr)
+
+    def embed_batches(
+        self, texts: Sequence[str], batch_size: int | None = None
+    ) -> Iterator[tuple[list[int], np.ndarray]]:
+        # Batches are sized by token budget and fetched concurrently (see
+        # openai_client.iter_embeddings); `batch_size` only caps inputs per request.
+        for positions, vecs in self._iter_embeddings(self._model, list(texts), max_inputs=batch_size):
+            yield positions, self._to_array(vecs)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return _empty(self._dim)
+        out = np.empty((len(texts), self._dim), dtype=np.float32)
+        for positions, vecs in self.embed_batches(texts):
+            out[positions] = vecs
+        return out
 
 
 class RandomProvider(EmbeddingProvider):
@@ -157,23 +279,45 @@ class RandomProvider(EmbeddingProvider):
     def embedding_model(self) -> str:
         return "random:test-only"
 
-    def embed(self, texts: Sequence[str]) -> list[list[float]]:
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
         if not texts:
-            return []
+            return _empty()
         vecs = []
         for t in texts:
             h = hashlib.sha256((str(self._seed) + "::" + t).encode("utf-8")).digest()
             # Turn first 8 bytes into seed.
             s = int.from_bytes(h[:8], "little", signed=False)
             rng = np.random.default_rng(s)
-            v = rng.normal(size=(STORAGE_DIM,)).astype(np.float32)
+            v = rng.normal(size=(DEFAULT_DIM,)).astype(np.float32)
             v = v / (np.linalg.norm(v) + 1e-12)
-            vecs.append(v.tolist())
-        return vecs
+            vecs.append(v)
+        return np.stack(vecs)
+
+
+_provider: EmbeddingProvider | None = None
+_provider_lock = threading.Lock()
 
 
-@lru_cache(maxsize=1)
 def get_embedding_provider() -> EmbeddingProvider:
+    """
+    Process-wide provider, built on first use. Concurrent first calls (the
+    warm-up thread and early requests) wait for one load instead of each
+    loading the model.
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = _build_embedding_provider()
+    return _provider
+
+
+def loaded_embedding_provider() -> EmbeddingProvider | None:
+    """The provider if it has already been built; never triggers a model load."""
+    return _provider
+
+
+def _build_embedding_provider() -> EmbeddingProvider:
     name = os.getenv("EMBEDDING_PROVIDER", "local").strip().lower()
     if name == "hash":
         import logging
@@ -193,9 +337,23 @@ def get_embedding_provider() -> EmbeddingProvider:
                 stacklevel=2,
             )
             return HashingProvider()
+    if name == "onnx":
+        model = os.getenv("EMBEDDING_MODEL_LOCAL", "intfloat/multilingual-e5-large")
+        try:
+            from .onnx_embedding import OnnxProvider  # local import: onnxruntime is optional
+
+            return OnnxProvider(model)
+        except Exception as exc:
+            warnings.warn(
+                f"Falling back to hash embeddings because ONNX model '{model}' is unavailable: {exc}",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+            return HashingProvider()
     if name == "openai":
         model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
-        return OpenAIProvider(model)
+        dim = os.getenv("OPENAI_EMBEDDING_DIM", "").strip()
+        return OpenAIProvider(model, dim=int(dim) if dim else None)
     if name == "random":
         seed = int(os.getenv("EMBEDDING_RANDOM_SEED", "42"))
         return RandomProvider(seed=seed)
@@ -0,0 +1,489 @@
+"""
+Similarity edges of the knowledge graph.
+
+Two engines compute the same thing — the top-k neighbours of every source node,
+pairs deduplicated as (min id, max id) keeping the best score, `max_edges`
+applied after ranking all of them by score:
+
+- "sql": one statement, a LATERAL kNN subquery per source node (same plan and
+  index settings as a single search);
+- "numpy": the dataset's vectors are streamed out of Postgres in blocks
+  (binary COPY) and scored exactly with blocked float32 matrix products, keeping each row's
+  top-k with argpartition. Far faster once a dataset has thousands of nodes.
+
+GRAPH_ENGINE=auto picks numpy from GRAPH_NUMPY_MIN_NODES source nodes on.
+
+Between full rebuilds, `refresh_node_edges` keeps a persisted graph current:
+only the edges of nodes queued in graph_dirty_nodes (migration 0025) are
+recomputed, with the parameters of the last rebuild (`datasets.graph_params`).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Any, Iterable, Iterator, Mapping
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .vector_index import distance_sql
+from .vector_search import apply_knn_settings, plan_knn
+
+logger = logging.getLogger(__name__)
+
+GRAPH_ENGINE = os.getenv("GRAPH_ENGINE", "auto").strip().lower()  # auto | sql | numpy
+GRAPH_NUMPY_MIN_NODES = int(os.getenv("GRAPH_NUMPY_MIN_NODES", "5000"))
+# Bound on one block of the similarity matrix (source rows x all nodes, float32).
+GRAPH_NUMPY_BLOCK_MB = float(os.getenv("GRAPH_NUMPY_BLOCK_MB", "64"))
+
+_FETCH_ROWS = 5000
+# refresh_node_edges: how far past its own top_k a dirty node looks for nodes it may now be a top_k neighbour of.
+_REVERSE_CANDIDATES = 3
+_EDGE_STAGE_DDL = (
+    "CREATE TEMP TABLE IF NOT EXISTS _stage_edges "
+    "(a int, b int, w double precision, m text) ON COMMIT DELETE ROWS"
+)
+
+
+def graph_engine(source_nodes: int) -> str:
+    if GRAPH_ENGINE in ("sql", "numpy"):
+        return GRAPH_ENGINE
+    return "numpy" if source_nodes >= GRAPH_NUMPY_MIN_NODES else "sql"
+
+
+def similarity_edges_sql(*, where: str, distance: str) -> str:
+    """
+    :src (node ids) are the sources; `where` filters their neighbours `kn2` and
+    `distance` orders them (it may refer to the source vector as `s.vec`).
+    """
+    return f"""
+        WITH src AS (
+            SELECT id, vec FROM knowledge_nodes WHERE id = ANY(:src) AND vec IS NOT NULL
+        ),
+        pairs AS (
+            SELECT s.id AS a, nb.id AS b, nb.score
+            FROM src s
+            CROSS JOIN LATERAL (
+                SELECT kn2.id, 1.0 - (kn2.vec <=> s.vec) AS score
+                FROM knowledge_nodes kn2
+                WHERE {where} AND kn2.id <> s.id
+                ORDER BY {distance}
+                LIMIT :k
+            ) nb
+        )
+        SELECT LEAST(a, b) AS a, GREATEST(a, b) AS b, max(score) AS score
+        FROM pairs
+        WHERE score >= :min_score
+        GROUP BY 1, 2
+        ORDER BY score DESC, a, b
+        LIMIT :max_edges
+    """
+
+
+def similarity_edges(
+    db: Session,
+    node_ids: Iterable[int],
+    model: str,
+    *,
+    top_k: int,
+    min_score: float,
+    max_edges: int,
+    dataset_id: int | None = None,
+    document_id: int | None = None,
+) -> list[tuple[int, int, float]]:
+    """
+    The `max_edges` best (a, b, score) pairs, a < b, among the top_k `model`
+    neighbours of `node_ids` scoring at least `min_score`; neighbours are
+    limited to the dataset / document when given. Best first.
+    """
+    src = sorted({int(i) for i in node_ids})
+    if not src or max_edges <= 0:
+        return []
+    filters = ["kn2.vec IS NOT NULL", "kn2.embedding_model = :em"]
+    params: dict[str, object] = {
+        "src": src, "em": model, "k": top_k, "min_score": min_score, "max_edges": max_edges,
+    }
+    if dataset_id is not None:
+        filters.append("kn2.dataset_id = :ds")
+        params["ds"] = dataset_id
+    if document_id is not None:
+        filters.append("kn2.document_id = :doc")
+        params["doc"] = document_id
+    # The plan's ef_search / iterative scan settings cover every LATERAL scan;
+    # two-stage plans scan exactly here.
+    plan = plan_knn(db, "knowledge_nodes", model, top_k, None, dataset_id)
+    apply_knn_settings(db, plan)
+    distance = distance_sql("kn2.vec", "s.vec", plan.coarse if plan.candidates is None else None)
+    rows = db.execute(text(similarity_edges_sql(where=" AND ".join(filters), distance=distance)), params).all()
+    return [(int(a), int(b), float(score)) for a, b, score in rows]
+
+
+def rank_edges(
+    hits: dict[int, list[tuple[int, float]]], *, min_score: float, max_edges: int
+) -> list[tuple[int, int, float]]:
+    """`similarity_edges` ranking for neighbour lists computed elsewhere (vector snapshots)."""
+    best: dict[tuple[int, int], float] = {}
+    for node_id, neighbours in hits.items():
+        for neighbour_id, score in neighbours:
+            if score < min_score or neighbour_id == node_id:
+                continue
+            key = (min(node_id, neighbour_id), max(node_id, neighbour_id))
+            if score > best.get(key, -2.0):
+                best[key] = score
+    ranked = sorted(best.items(), key=lambda item: (-item[1], item[0]))
+    return [(a, b, score) for (a, b), score in ranked[:max_edges]]
+
+
+def cooccurrence_pairs(rows: Iterable[Mapping[str, Any]], co_window: int) -> Iterable[tuple[int, int]]:
+    """
+    (a, b) pairs of nodes of one document at most `co_window` sentences apart,
+    from rows with id, document_id and model_info (source.sentence_idx);
+    document by document, in sentence order.
+    """
+    by_doc: dict[int, list[tuple[int, int]]] = {}
+    for r in rows:
+        doc_id = r["document_id"]
+        if doc_id is None:
+            continue
+        mi = r["model_info"] or {}
+        src = (mi.get("source") or {}) if isinstance(mi, dict) else {}
+        sent_idx = src.get("sentence_idx")
+        if sent_idx is None:
+            continue
+        by_doc.setdefault(int(doc_id), []).append((int(sent_idx), int(r["id"])))
+
+    for _doc_id, pairs in by_doc.items():
+        pairs.sort(key=lambda x: x[0])
+        for i in range(len(pairs)):
+            si, a = pairs[i]
+            # connect to next nodes within window
+            for j in range(i + 1, len(pairs)):
+                sj, b = pairs[j]
+                if (sj - si) > co_window:
+                    break
+                yield a, b
+
+
+def iter_node_vector_blocks(db: Session, dataset_id: int, model: str) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    (ids ascending, L2-normalized float32 vectors) of the dataset's `model`
+    nodes, block by block: keyset-paginated binary COPY output.
+    """
+    raw = db.connection().connection.driver_connection
+    after = 0
+    with raw.cursor() as cur:
+        while True:
+            buf = bytearray()
+            with cur.copy(
+                "COPY (SELECT id::int8, vec FROM knowledge_nodes "
+                "WHERE dataset_id = %s AND embedding_model = %s AND vec IS NOT NULL AND id > %s "
+                "ORDER BY id LIMIT %s) TO STDOUT (FORMAT BINARY)",
+                (dataset_id, model, after, _FETCH_ROWS),
+            ) as copy:
+                for data in copy:
+                    buf += data
+            ids, block = _parse_vector_copy(buf)
+            if len(ids) == 0:
+                return
+            block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+            yield ids, block
+            after = int(ids[-1])
+
+
+def load_node_vectors(db: Session, dataset_id: int, model: str) -> tuple[np.ndarray, np.ndarray]:
+    """All of `iter_node_vector_blocks` at once."""
+    id_blocks: list[np.ndarray] = []
+    vec_blocks: list[np.ndarray] = []
+    for ids, block in iter_node_vector_blocks(db, dataset_id, model):
+        id_blocks.append(ids)
+        vec_blocks.append(block)
+    if not id_blocks:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    return np.concatenate(id_blocks), np.concatenate(vec_blocks)
+
+
+# Binary COPY framing: 19-byte header, 2-byte trailer; per row a field count,
+# then (length, value) per field. pgvector's binary form is dim, unused, floats.
+_COPY_HEADER, _COPY_TRAILER = 19, 2
+
+
+def _parse_vector_copy(buf: bytes | bytearray) -> tuple[np.ndarray, np.ndarray]:
+    """(ids, float32 vectors) of a binary COPY of (int8, vector) rows of one dimension."""
+    body = len(buf) - _COPY_HEADER - _COPY_TRAILER
+    if body <= 0:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    dim_at = _COPY_HEADER + 2 + 4 + 8 + 4
+    dim = int.from_bytes(buf[dim_at : dim_at + 2], "big")
+    row = np.dtype([
+        ("fields", ">i2"), ("id_len", ">i4"), ("id", ">i8"),
+        ("vec_len", ">i4"), ("dim", ">u2"), ("unused", ">u2"), ("vec", ">f4", (dim,)),
+    ])
+    if body % row.itemsize:
+        raise ValueError("vectors of one embedding model must share a dimension")
+    rows = np.frombuffer(buf, dtype=row, count=body // row.itemsize, offset=_COPY_HEADER)
+    if (rows["dim"] != dim).any():
+        raise ValueError("vectors of one embedding model must share a dimension")
+    return rows["id"].astype(np.int64), rows["vec"].astype(np.float32)
+
+
+def numpy_similarity_edges(
+    db: Session,
+    node_ids: Iterable[int],
+    model: str,
+    *,
+    top_k: int,
+    min_score: float,
+    max_edges: int,
+    dataset_id: int,
+) -> list[tuple[int, int, float]]:
+    """`similarity_edges` computed exactly in NumPy (neighbours within the dataset)."""
+    started = time.perf_counter()
+    ids, vecs = load_node_vectors(db, dataset_id, model)
+    edges = topk_edges(
+        ids, vecs, np.asarray(sorted({int(i) for i in node_ids}), dtype=np.int64),
+        top_k=top_k, min_score=min_score, max_edges=max_edges,
+    )
+    logger.info(
+        "numpy graph edges of dataset %d (%s): %d nodes, %d edges in %.2fs",
+        dataset_id, model, len(ids), len(edges), time.perf_counter() - started,
+    )
+    return edges
+
+
+def topk_edges(
+    ids: np.ndarray,
+    vecs: np.ndarray,
+    sources: np.ndarray,
+    *,
+    top_k: int,
+    min_score: float,
+    max_edges: int,
+    block_rows: int | None = None,
+) -> list[tuple[int, int, float]]:
+    """
+    Ranked edges between `sources` and their top_k neighbours among `ids`
+    (`vecs` L2-normalized, `ids` ascending). Sources are scored `block_rows`
+    at a time, so memory beyond the vectors stays at one block of scores.
+    """
+    n = len(ids)
+    k = min(int(top_k), n - 1)
+    pos = np.searchsorted(ids, sources)
+    pos = pos[(pos < n) & (ids[np.minimum(pos, n - 1)] == sources)] if n else pos[:0]
+    if k <= 0 or len(pos) == 0 or max_edges <= 0:
+        return []
+    if block_rows is None:
+        block_rows = int(GRAPH_NUMPY_BLOCK_MB * 2**20 // (4 * n))
+    block_rows = max(1, block_rows)
+    a_parts: list[np.ndarray] = []
+    b_parts: list[np.ndarray] = []
+    s_parts: list[np.ndarray] = []
+    for start in range(0, len(pos), block_rows):
+        rows = pos[start : start + block_rows]
+        scores = vecs[rows] @ vecs.T
+        scores[np.arange(len(rows)), rows] = -np.inf  # never a node's own neighbour
+        top = np.argpartition(scores, n - k, axis=1)[:, n - k :]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        keep = top_scores >= min_score
+        a_parts.append(np.repeat(ids[rows], k).reshape(len(rows), k)[keep])
+        b_parts.append(ids[top][keep])
+        s_parts.append(top_scores[keep])
+    a, b, score = np.concatenate(a_parts), np.concatenate(b_parts), np.concatenate(s_parts).astype(np.float64)
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    # Best score per undirected pair, then the global ranking (score desc, ids asc).
+    order = np.lexsort((-score, hi, lo))
+    lo, hi, score = lo[order], hi[order], score[order]
+    first = np.ones(len(lo), dtype=bool)
+    first[1:] = (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])
+    lo, hi, score = lo[first], hi[first], score[first]
+    ranked = np.lexsort((hi, lo, -score))[:max_edges]
+    return [(int(lo[i]), int(hi[i]), float(score[i])) for i in ranked]
+
+
+def write_edges(db: Session, dataset_id: int, edges: Iterable[tuple[int, int, float, str]]) -> int:
+    """
+    Upserts (from, to, weight, method) edges of the dataset: COPY into a staging
+    table, then one INSERT .. ON CONFLICT keeping the higher weight. The caller commits.
+    """
+    raw = db.connection().connection.driver_connection
+    written = 0
+    with raw.cursor() as cur:
+        cur.execute(_EDGE_STAGE_DDL)
+        cur.execute("TRUNCATE _stage_edges")
+        with cur.copy("COPY _stage_edges (a, b, w, m) FROM STDIN") as copy:
+            for a, b, w, m in edges:
+                copy.write_row((a, b, w, m))
+                written += 1
+    if written:
+        db.execute(
+            text(
+                """
+                INSERT INTO knowledge_edges (dataset_id, from_node_id, to_node_id, weight, method)
+                SELECT :ds, a, b, max(w), m FROM _stage_edges GROUP BY a, b, m
+                ON CONFLICT (dataset_id, from_node_id, to_node_id, method)
+                DO UPDATE SET weight = GREATEST(knowledge_edges.weight, EXCLUDED.weight)
+                """
+            ),
+            {"ds": dataset_id},
+        )
+    return written
+
+
+def graph_params(
+    embedding_model: str,
+    *,
+    top_k: int,
+    min_score: float,
+    max_edges: int,
+    include_cooccurrence: bool,
+    co_window: int,
+    max_node_id: int | None,
+) -> dict[str, Any]:
+    """What `rebuild_graph_edges` stores in datasets.graph_params for `refresh_node_edges`."""
+    return {
+        "embedding_model": embedding_model,
+        "top_k": int(top_k),
+        "min_score": float(min_score),
+        "max_edges": int(max_edges),
+        "include_cooccurrence": bool(include_cooccurrence),
+        "co_window": int(co_window),
+        "max_node_id": None if max_node_id is None else int(max_node_id),
+    }
+
+
+def refresh_node_edges(db: Session, dataset_id: int, node_ids: Iterable[int], params: Mapping[str, Any]) -> int:
+    """
+    Recomputes the persisted edges of `node_ids` (new, re-embedded or moved
+    nodes, and former neighbours of deleted ones; ids no longer in the dataset
+    just lose their edges) with the dataset's graph params; the rest of the graph is
+    left alone. Existing similarity edges touching them are re-scored or
+    dropped, their kNN edges (both directions) upserted, their co-occurrence
+    edges rebuilt within their documents; then the dataset is trimmed back to
+    max_edges (similarity edges first, as in a rebuild). The caller commits.
+    Returns the number of edges written.
+    """
+    ids = sorted({int(i) for i in node_ids})
+    if not ids:
+        return 0
+    em = params["embedding_model"]
+    sim_method, co_method = f"similarity|{em}", "co_occurrence_window"
+    max_id = params.get("max_node_id")
+    bind = {
+        "ds": dataset_id, "ids": ids, "em": em, "sim": sim_method, "co": co_method,
+        "min_score": float(params["min_score"]),
+        "max_id": 2**31 - 1 if max_id is None else int(max_id),
+    }
+    live = """
+        SELECT id, vec FROM knowledge_nodes
+        WHERE dataset_id = :ds AND embedding_model = :em AND vec IS NOT NULL
+    """
+    # Edges of nodes that moved to another dataset, and co-occurrence edges, are recomputed below.
+    db.execute(
+        text(
+            """
+            DELETE FROM knowledge_edges
+            WHERE (from_node_id = ANY(:ids) OR to_node_id = ANY(:ids))
+              AND (dataset_id <> :ds OR method = :co)
+            """
+        ),
+        bind,
+    )
+    db.execute(
+        text(
+            f"""
+            WITH live AS ({live})
+            UPDATE knowledge_edges e
+            SET weight = round((1.0 - (a.vec <=> b.vec))::numeric, 4)
+            FROM live a, live b
+            WHERE e.dataset_id = :ds AND e.method = :sim
+              AND (e.from_node_id = ANY(:ids) OR e.to_node_id = ANY(:ids))
+              AND a.id = e.from_node_id AND b.id = e.to_node_id
+            """
+        ),
+        bind,
+    )
+    db.execute(
+        text(
+            f"""
+            WITH live AS ({live})
+            DELETE FROM knowledge_edges e
+            WHERE e.dataset_id = :ds AND e.method = :sim
+              AND (e.from_node_id = ANY(:ids) OR e.to_node_id = ANY(:ids))
+              AND (e.weight < :min_score
+                   OR NOT EXISTS (SELECT 1 FROM live WHERE live.id = e.from_node_id)
+                   OR NOT EXISTS (SELECT 1 FROM live WHERE live.id = e.to_node_id))
+            """
+        ),
+        bind,
+    )
+
+    # Like a rebuild, only the first limit_nodes nodes (ids up to max_node_id) are sources.
+    sources = db.execute(
+        text(
+            """
+            SELECT id FROM knowledge_nodes
+            WHERE id = ANY(:ids) AND dataset_id = :ds AND embedding_model = :em
+              AND vec IS NOT NULL AND id <= :max_id
+            """
+        ),
+        bind,
+    ).scalars().all()
+    top_k = int(params["top_k"])
+
+    def knn(src: list[int], k: int) -> list[tuple[int, int, float]]:
+        return similarity_edges(
+            db, src, em, top_k=k, min_score=bind["min_score"], max_edges=len(src) * k,
+            dataset_id=dataset_id,
+        )
+
+    dirty = set(ids)
+    found = knn(sources, top_k)
+    # Reverse neighbours: nodes whose top_k a dirty node entered are searched
+    # again among its _REVERSE_CANDIDATES * top_k nearest. Edges a new node
+    # pushed out of someone's top_k stay until the next rebuild.
+    around = sorted({
+        n for a, b, _ in knn(sources, top_k * _REVERSE_CANDIDATES) for n in (a, b)
+        if n not in dirty and n <= bind["max_id"]
+    })
+    found += [(a, b, score) for a, b, score in knn(around, top_k) if a in dirty or b in dirty]
+    edges: list[tuple[int, int, float, str]] = [(a, b, round(score, 4), sim_method) for a, b, score in found]
+    if params.get("include_cooccurrence"):
+        rows = db.execute(
+            text(
+                """
+                SELECT id, document_id, model_info
+                FROM knowledge_nodes
+                WHERE dataset_id = :ds AND embedding_model = :em AND vec IS NOT NULL AND id <= :max_id
+                  AND document_id IN (
+                      SELECT document_id FROM knowledge_nodes WHERE id = ANY(:ids) AND dataset_id = :ds
+                  )
+                ORDER BY id ASC
+                """
+            ),
+            bind,
+        ).mappings().all()
+        edges.extend(
+            (min(a, b), max(a, b), 0.5, co_method)
+            for a, b in cooccurrence_pairs(rows, int(params["co_window"]))
+            if a != b and (a in dirty or b in dirty)
+        )
+    written = write_edges(db, dataset_id, edges)
+
+    db.execute(
+        text(
+            """
+            DELETE FROM knowledge_edges e
+            USING (
+                SELECT id, row_number() OVER (
+                    ORDER BY (method = :co), weight DESC, from_node_id, to_node_id
+                ) AS rank
+                FROM knowledge_edges
+                WHERE dataset_id = :ds
+            ) r
+            WHERE e.id = r.id AND r.rank > :max_edges
+            """
+        ),
+        {"ds": dataset_id, "co": co_method, "max_edges": int(params["max_edges"])},
+    )
+    return written
@@ -0,0 +1,273 @@
+"""
+Server-side 2D layout of the persisted graph, so clients render without
+running a force simulation themselves.
+
+`compute_layout` is vectorized NumPy throughout: a spectral start (the two
+leading non-trivial eigenvectors of the normalized adjacency, by subspace
+iteration) refined by Fruchterman-Reingold forces — attraction along edges,
+repulsion from the mass centres of a grid of cells instead of from every
+other node, so an iteration costs O(edges + nodes x cells). Coordinates lie
+in [-1, 1].
+
+A full layout follows every graph rebuild (`layout_dataset`); between
+rebuilds `update_layout` only places changed nodes next to their neighbours
+and relaxes them with the rest held fixed, unless so many changed that a full
+layout is cheaper to trust.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Iterable
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .graph_cluster import load_edge_positions
+
+logger = logging.getLogger(__name__)
+
+GRAPH_LAYOUT_ENABLED = os.getenv("GRAPH_LAYOUT", "1").strip().lower() in ("1", "true", "yes", "on")
+GRAPH_LAYOUT_ITERATIONS = int(os.getenv("GRAPH_LAYOUT_ITERATIONS", "50"))
+# Share of changed nodes from which update_layout recomputes the whole layout.
+GRAPH_LAYOUT_RELAYOUT_FRACTION = float(os.getenv("GRAPH_LAYOUT_RELAYOUT_FRACTION", "0.2"))
+
+# Bound on nodes x grid cells per repulsion pass.
+_REPULSION_PAIRS = 5_000_000
+_BLOCK_ROWS = 4096
+
+
+def _adjacency_product(x: np.ndarray, src: np.ndarray, dst: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """A @ x for the symmetric weighted adjacency given by the edge arrays; x is (n, m)."""
+    n = len(x)
+    out = np.empty_like(x)
+    for c in range(x.shape[1]):
+        out[:, c] = np.bincount(src, weight * x[dst, c], minlength=n) + np.bincount(dst, weight * x[src, c], minlength=n)
+    return out
+
+
+def spectral_layout(
+    n: int, src: np.ndarray, dst: np.ndarray, weight: np.ndarray, *, iterations: int = 100, seed: int = 0
+) -> np.ndarray:
+    """(n, 2) spectral coordinates; nodes without edges are scattered at random."""
+    rng = np.random.default_rng(seed)
+    degree = np.bincount(src, weight, minlength=n) + np.bincount(dst, weight, minlength=n)
+    connected = degree > 0
+    inv_sqrt = np.where(connected, 1.0 / np.sqrt(np.where(connected, degree, 1.0)), 0.0)
+    trivial = np.sqrt(degree)
+    trivial /= max(np.linalg.norm(trivial), 1e-12)
+    q = rng.standard_normal((n, 2))
+    for _ in range(iterations):
+        # (I + D^-1/2 A D^-1/2) / 2: same eigenvectors, non-negative spectrum.
+        q = 0.5 * (q + inv_sqrt[:, None] * _adjacency_product(inv_sqrt[:, None] * q, src, dst, weight))
+        q -= np.outer(trivial, trivial @ q)
+        q, _ = np.linalg.qr(q)
+    pos = inv_sqrt[:, None] * q
+    pos[~connected] = rng.uniform(-1.0, 1.0, size=(int((~connected).sum()), 2)) * max(np.abs(pos).max(), 1e-6)
+    return pos
+
+
+def _normalize(pos: np.ndarray) -> np.ndarray:
+    pos = pos - pos.mean(axis=0)
+    return pos / max(float(np.abs(pos).max()), 1e-12)
+
+
+def force_layout(
+    pos: np.ndarray,
+    src: np.ndarray,
+    dst: np.ndarray,
+    weight: np.ndarray,
+    *,
+    iterations: int,
+    temperature: float = 0.1,
+    movable: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Fruchterman-Reingold refinement of `pos` (in [-1, 1]); only `movable`
+    node positions (default: all) change, the others only exert forces.
+    """
+    n = len(pos)
+    pos = pos.astype(np.float64, copy=True)
+    moving = np.arange(n) if movable is None else np.flatnonzero(movable)
+    if n < 2 or len(moving) == 0:
+        return pos
+    k = 2.0 / np.sqrt(n)  # ideal edge length in the [-1, 1] box
+    grid = int(np.clip(np.sqrt(_REPULSION_PAIRS / max(len(moving), 1)), 4, 32))
+    for it in range(iterations):
+        disp = np.zeros((n, 2))
+        # Attraction along edges: d^2 / k, scaled by the edge weight.
+        delta = pos[src] - pos[dst]
+        pull = (weight * np.linalg.norm(delta, axis=1) / k)[:, None] * delta
+        for c in range(2):
+            disp[:, c] -= np.bincount(src, pull[:, c], minlength=n)
+            disp[:, c] += np.bincount(dst, pull[:, c], minlength=n)
+
+        # Repulsion k^2 / d from every cell's mass centre (a node's own cell without itself).
+        lo, span = pos.min(axis=0), np.maximum(np.ptp(pos, axis=0), 1e-9)
+        cell_xy = np.minimum(((pos - lo) / span * grid).astype(np.int64), grid - 1)
+        cell = cell_xy[:, 0] * grid + cell_xy[:, 1]
+        mass = np.bincount(cell, minlength=grid * grid).astype(np.float64)
+        sums = np.stack([np.bincount(cell, pos[:, c], minlength=grid * grid) for c in range(2)], axis=1)
+        occupied = np.flatnonzero(mass)
+        centres, cell_mass = sums[occupied] / mass[occupied, None], mass[occupied]
+        slot = np.searchsorted(occupied, cell)
+        floor = 1e-6 * k * k
+        centres32, mass32 = centres.astype(np.float32), cell_mass.astype(np.float32)
+        for start in range(0, len(moving), _BLOCK_ROWS):
+            rows = moving[start : start + _BLOCK_ROWS]
+            p = pos[rows]
+            diff = p[:, None, :].astype(np.float32) - centres32[None, :, :]
+            coef = mass32 / np.maximum(np.einsum("bcd,bcd->bc", diff, diff), floor)
+            push = np.einsum("bc,bcd->bd", coef, diff).astype(np.float64)
+            # Own cell: swap its term for one from the cell's centre without this node.
+            own, own_mass = slot[rows], cell_mass[slot[rows]]
+            d_own = p - centres[own]
+            push -= d_own * (own_mass / np.maximum((d_own ** 2).sum(axis=1), floor))[:, None]
+            rest = np.maximum(own_mass - 1.0, 1.0)[:, None]
+            d_rest = p - (sums[cell[rows]] - p) / rest
+            push += d_rest * ((own_mass - 1.0) / np.maximum((d_rest ** 2).sum(axis=1), floor))[:, None]
+            disp[rows] += k * k * push
+
+        # Displacement capped by a cooling temperature.
+        step = temperature * (1.0 - it / iterations)
+        length = np.maximum(np.linalg.norm(disp[moving], axis=1), 1e-12)
+        pos[moving] += disp[moving] / length[:, None] * np.minimum(length, step)[:, None]
+    return pos
+
+
+def compute_layout(
+    n: int, src: np.ndarray, dst: np.ndarray, weight: np.ndarray, *, iterations: int | None = None, seed: int = 0
+) -> np.ndarray:
+    """(n, 2) layout coordinates in [-1, 1]."""
+    if n == 0:
+        return np.empty((0, 2))
+    if n == 1:
+        return np.zeros((1, 2))
+    pos = _normalize(spectral_layout(n, src, dst, weight, seed=seed))
+    pos = force_layout(pos, src, dst, weight, iterations=GRAPH_LAYOUT_ITERATIONS if iterations is None else iterations)
+    return _normalize(pos)
+
+
+def place_nodes(
+    pos: np.ndarray, placed: np.ndarray, src: np.ndarray, dst: np.ndarray, weight: np.ndarray, *, seed: int = 0
+) -> np.ndarray:
+    """
+    Positions for the nodes not `placed`: the weighted mean of their placed
+    neighbours (repeated, so chains of new nodes follow), slightly jittered;
+    nodes with no placed neighbour at all land at random.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(pos)
+    pos, placed = pos.astype(np.float64, copy=True), placed.copy()
+    jitter = 0.5 / np.sqrt(max(n, 1))
+    for _ in range(3):
+        todo = ~placed
+        if not todo.any():
+            break
+        w_src, w_dst = weight * placed[dst], weight * placed[src]
+        total = np.bincount(src, w_src, minlength=n) + np.bincount(dst, w_dst, minlength=n)
+        reach = todo & (total > 0)
+        if not reach.any():
+            break
+        for c in range(2):
+            acc = np.bincount(src, w_src * pos[dst, c], minlength=n) + np.bincount(dst, w_dst * pos[src, c], minlength=n)
+            pos[reach, c] = acc[reach] / total[reach]
+        pos[reach] += rng.normal(0.0, jitter, size=(int(reach.sum()), 2))
+        placed |= reach
+    pos[~placed] = rng.uniform(-1.0, 1.0, size=(int((~placed).sum()), 2))
+    return pos
+
+
+def _layout_nodes(db: Session, dataset_id: int) -> np.ndarray:
+    """Ids of the nodes GET /graph can show: the dataset's nodes with a vector."""
+    return np.asarray(
+        db.execute(
+            text("SELECT id FROM knowledge_nodes WHERE dataset_id = :ds AND vec IS NOT NULL ORDER BY id"),
+            {"ds": dataset_id},
+        ).scalars().all(),
+        dtype=np.int64,
+    )
+
+
+def _write_positions(db: Session, dataset_id: int, ids: np.ndarray, pos: np.ndarray) -> None:
+    if len(ids) == 0:
+        return
+    db.execute(
+        text(
+            """
+            INSERT INTO graph_node_positions (node_id, dataset_id, x, y, graph_version)
+            SELECT t.node_id, :ds, t.x, t.y, d.graph_version
+            FROM unnest(CAST(:node_id AS int[]), CAST(:x AS real[]), CAST(:y AS real[])) AS t(node_id, x, y),
+                 datasets d
+            WHERE d.id = :ds
+            ON CONFLICT (node_id) DO UPDATE
+            SET dataset_id = EXCLUDED.dataset_id, x = EXCLUDED.x, y = EXCLUDED.y, graph_version = EXCLUDED.graph_version
+            """
+        ),
+        {
+            "ds": dataset_id,
+            "node_id": ids.tolist(),
+            "x": np.round(pos[:, 0], 5).tolist(),
+            "y": np.round(pos[:, 1], 5).tolist(),
+        },
+    )
+
+
+def layout_dataset(db: Session, dataset_id: int) -> dict:
+    """Full layout of the dataset's graph, replacing its positions. The caller commits."""
+    started = time.perf_counter()
+    ids = _layout_nodes(db, dataset_id)
+    src, dst, weight = load_edge_positions(db, dataset_id, ids)
+    pos = compute_layout(len(ids), src, dst, weight, seed=dataset_id)
+    db.execute(text("DELETE FROM graph_node_positions WHERE dataset_id = :ds"), {"ds": dataset_id})
+    _write_positions(db, dataset_id, ids, pos)
+    logger.info(
+        "graph layout of dataset %d: %d nodes, %d edges in %.2fs",
+        dataset_id, len(ids), len(weight), time.perf_counter() - started,
+    )
+    return {"nodes": len(ids), "edges": len(weight), "mode": "full"}
+
+
+def update_layout(db: Session, dataset_id: int, node_ids: Iterable[int]) -> dict:
+    """
+    After `node_ids` changed: places them (and any other node still without a
+    current position) near their neighbours and relaxes only those, or redoes
+    the whole layout when they are more than GRAPH_LAYOUT_RELAYOUT_FRACTION of
+    the graph. The caller commits.
+    """
+    ids = _layout_nodes(db, dataset_id)
+    changed = np.asarray(sorted({int(i) for i in node_ids}), dtype=np.int64)
+    db.execute(
+        text("DELETE FROM graph_node_positions WHERE node_id = ANY(:ids)"), {"ids": changed.tolist()}
+    )
+    rows = db.execute(
+        text(
+            """
+            SELECT p.node_id, p.x, p.y
+            FROM graph_node_positions p JOIN datasets d ON d.id = p.dataset_id
+            WHERE p.dataset_id = :ds AND p.graph_version = d.graph_version
+            """
+        ),
+        {"ds": dataset_id},
+    ).all()
+    pos = np.zeros((len(ids), 2))
+    placed = np.zeros(len(ids), dtype=bool)
+    if rows and len(ids):
+        known = np.asarray([r[0] for r in rows], dtype=np.int64)
+        at = np.minimum(np.searchsorted(ids, known), len(ids) - 1)
+        hit = ids[at] == known
+        pos[at[hit]] = np.asarray([(r[1], r[2]) for r in rows], dtype=np.float64)[hit]
+        placed[at[hit]] = True
+    missing = int((~placed).sum())
+    if missing == 0:
+        return {"nodes": 0, "mode": "none"}
+    if missing > GRAPH_LAYOUT_RELAYOUT_FRACTION * len(ids):
+        return layout_dataset(db, dataset_id)
+    src, dst, weight = load_edge_positions(db, dataset_id, ids)
+    movable = ~placed
+    pos = place_nodes(pos, placed, src, dst, weight, seed=dataset_id)
+    pos = force_layout(pos, src, dst, weight, iterations=20, temperature=0.02, movable=movable)
+    _write_positions(db, dataset_id, ids[movable], pos[movable])
+    return {"nodes": missing, "mode": "incremental"}
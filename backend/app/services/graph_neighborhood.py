@@ -0,0 +1,117 @@
+"""
+Ego networks over persisted graph edges (`knowledge_edges`).
+
+A bounded breadth-first walk: one indexed query per level returns the
+frontier's unseen neighbours ranked by their strongest edge into the
+frontier, and only as many as the node budget still allows are kept, so the
+walk never materializes more than `max_nodes` nodes however dense the graph.
+Levels are taken whole before the next one starts, so the result is always
+connected to the centre.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+_EXPANDING = ("frontier", "seen", "methods")
+
+
+def _expanding(sql: str):
+    stmt = text(sql)
+    return stmt.bindparams(*(bindparam(name, expanding=True) for name in _EXPANDING if f":{name}" in sql))
+
+
+def edge_methods(embedding_model: str | None, include_cooccurrence: bool) -> list[str]:
+    """Persisted edge methods a walk follows: the model's similarity edges, optionally co-occurrence."""
+    methods = [f"similarity|{embedding_model}"] if embedding_model else []
+    if include_cooccurrence:
+        methods.append("co_occurrence_window")
+    return methods
+
+
+def walk(
+    db: Session,
+    *,
+    dataset_id: int,
+    center_id: int,
+    methods: Iterable[str],
+    depth: int,
+    max_nodes: int,
+    min_weight: float = 0.0,
+) -> tuple[dict[int, int], bool]:
+    """
+    ({node id: hops from the centre}, truncated) of the centre's neighbourhood
+    up to `depth` hops along edges of `methods` weighing at least `min_weight`.
+    `truncated` is set when the budget cut a level short.
+    """
+    methods = sorted(set(methods))
+    depths = {int(center_id): 0}
+    frontier = [int(center_id)]
+    stmt = _expanding(
+        """
+        SELECT nb, max(weight) AS w
+        FROM (
+            SELECT to_node_id AS nb, weight FROM knowledge_edges
+            WHERE dataset_id = :ds AND from_node_id IN :frontier AND method IN :methods AND weight >= :min_weight
+            UNION ALL
+            SELECT from_node_id AS nb, weight FROM knowledge_edges
+            WHERE dataset_id = :ds AND to_node_id IN :frontier AND method IN :methods AND weight >= :min_weight
+        ) e
+        WHERE nb NOT IN :seen
+        GROUP BY nb
+        ORDER BY w DESC, nb
+        LIMIT :n
+        """
+    )
+    for level in range(1, depth + 1):
+        room = max_nodes - len(depths)
+        if not frontier or not methods or room <= 0:
+            break
+        rows = db.execute(
+            stmt,
+            {
+                "ds": dataset_id, "frontier": frontier, "methods": methods, "min_weight": min_weight,
+                "seen": sorted(depths), "n": room + 1,
+            },
+        ).all()
+        frontier = [int(nb) for nb, _w in rows[:room]]
+        depths.update((nb, level) for nb in frontier)
+        if len(rows) > room:
+            return depths, True
+    return depths, False
+
+
+def subgraph_edges(
+    db: Session,
+    *,
+    dataset_id: int,
+    node_ids: Iterable[int],
+    methods: Iterable[str] | None,
+    min_weight: float = 0.0,
+    max_edges: int,
+) -> list[tuple[int, int, float]]:
+    """
+    The `max_edges` heaviest (from, to, weight) edges among `node_ids`, pairs
+    merged across methods (None: any method).
+    """
+    ids = sorted({int(i) for i in node_ids})
+    methods = None if methods is None else sorted(set(methods))
+    if len(ids) < 2 or methods == []:
+        return []
+    rows = db.execute(
+        _expanding(
+            f"""
+            SELECT from_node_id, to_node_id, max(weight) AS w
+            FROM knowledge_edges
+            WHERE dataset_id = :ds AND from_node_id IN :seen AND to_node_id IN :seen
+              {"" if methods is None else "AND method IN :methods"} AND weight >= :min_weight
+            GROUP BY from_node_id, to_node_id
+            ORDER BY w DESC, from_node_id, to_node_id
+            LIMIT :n
+            """
+        ),
+        {"ds": dataset_id, "seen": ids, "methods": methods, "min_weight": min_weight, "n": max_edges},
+    ).all()
+    return [(int(a), int(b), float(w)) for a, b, w in rows]
@@ -3,9 +3,9 @@ from __future__ import annotations
 import json
 import os
 import re
+import threading
 import warnings
 from abc import ABC, abstractmethod
-from functools import lru_cache
 from typing import Any, Sequence
 
 from ..utils.node_extract import extract_nodes_from_text as heuristic_extract
@@ -319,8 +319,21 @@ def _ner_fallback(text: str, max_nodes: int, min_freq: int) -> list[dict[str, An
         return HeuristicExtractor().extract(text, max_nodes=max_nodes, min_freq=min_freq)
 
 
-@lru_cache(maxsize=1)
+_extractor: NodeExtractor | None = None
+_extractor_lock = threading.Lock()
+
+
 def get_node_extractor() -> NodeExtractor:
+    """Process-wide extractor, built once even when first requested concurrently."""
+    global _extractor
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                _extractor = _build_node_extractor()
+    return _extractor
+
+
+def _build_node_extractor() -> NodeExtractor:
     name = os.getenv("NODE_EXTRACTOR", "local_ner").strip().lower()
     if name == "local_ner":
         try:
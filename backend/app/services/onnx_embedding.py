@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Iterator, Sequence
+
+import numpy as np
+
+from .embedding_provider import EmbeddingProvider, _empty, _l2_normalize, length_sorted_batches
+
+logger = logging.getLogger(__name__)
+
+# Exported models are cached here, one directory per sentence-transformers model.
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", os.path.expanduser("~/.cache/rag_bloom/onnx"))
+# "int8" = dynamic int8 quantization of the weights (smaller, faster on CPU),
+# "none" = the fp32 export as is.
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "int8").strip().lower()
+# ONNX Runtime intra-op threads; 0 lets it use one per physical core.
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+
+_FORMAT_VERSION = 1
+_OPSET = 17
+_POOLING_MODES = ("mean", "cls")
+
+
+def _model_dir(model_name: str, cache_dir: str | None = None) -> Path:
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "__", model_name)
+    return Path(cache_dir or ONNX_CACHE_DIR) / slug
+
+
+def export_onnx(model_name: str, cache_dir: str | None = None) -> Path:
+    """
+    Exports the transformer of a sentence-transformers model to ONNX (fp32, with
+    dynamic batch/sequence axes) plus its tokenizer and pooling settings, once.
+    Needs torch and sentence-transformers; loading the export later does not.
+    Returns the cache directory; concurrent exporters race harmlessly (the
+    directory is published with an atomic rename).
+    """
+    target = _model_dir(model_name, cache_dir)
+    if (target / "meta.json").exists():
+        return target
+    try:
+        import torch  # type: ignore
+        from sentence_transformers import SentenceTransformer  # type: ignore
+        from sentence_transformers.models import Normalize, Pooling, Transformer  # type: ignore
+    except Exception as e:  # pragma: no cover
+        raise RuntimeError("exporting to ONNX needs torch and sentence-transformers") from e
+
+    started = time.perf_counter()
+    st = SentenceTransformer(model_name, device="cpu")
+    modules = list(st)
+    if not modules or not isinstance(modules[0], Transformer) or any(
+        not isinstance(m, (Transformer, Pooling, Normalize)) for m in modules
+    ):
+        raise RuntimeError(f"{model_name}: only Transformer + Pooling (+ Normalize) pipelines can be exported")
+    pooling = next((m for m in modules if isinstance(m, Pooling)), None)
+    mode = pooling.get_pooling_mode_str() if pooling is not None else "cls"
+    if mode not in _POOLING_MODES:
+        raise RuntimeError(f"{model_name}: pooling mode {mode!r} is not supported")
+
+    transformer = modules[0]
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["ONNX export"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    tmp = target.with_name(f"{target.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        encoder = _Encoder(transformer.auto_model).eval()
+        with torch.no_grad():
+            torch.onnx.export(
+                encoder,
+                tuple(sample[n] for n in input_names),
+                str(tmp / "model.onnx"),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes={n: {0: "batch", 1: "seq"} for n in [*input_names, "last_hidden_state"]},
+                opset_version=_OPSET,
+            )
+        tokenizer.save_pretrained(str(tmp / "tokenizer"))
+        meta = {
+            "format_version": _FORMAT_VERSION,
+            "model": model_name,
+            "dim": int(st.get_sentence_embedding_dimension()),
+            "pooling": mode,
+            "max_seq_length": int(st.max_seq_length),
+            "input_names": input_names,
+        }
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            if not (target / "meta.json").exists():
+                raise
+            # Another process published the same export first.
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    logger.info("exported %s to ONNX in %.1fs", model_name, time.perf_counter() - started)
+    return target
+
+
+def quantized_model_path(model_dir: Path) -> Path:
+    """Dynamic int8 quantization of `model_dir/model.onnx`, created on first use."""
+    out = model_dir / "model.int8.onnx"
+    if out.exists():
+        return out
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+    except Exception as e:  # pragma: no cover
+        raise RuntimeError("int8 quantization needs onnxruntime and onnx") from e
+    started = time.perf_counter()
+    tmp = model_dir / f"model.int8.onnx.tmp-{os.getpid()}"
+    try:
+        quantize_dynamic(
+            str(model_dir / "model.onnx"),
+            str(tmp),
+            weight_type=QuantType.QInt8,
+            use_external_data_format=False,
+        )
+        os.replace(tmp, out)
+    finally:
+        tmp.unlink(missing_ok=True)
+    logger.info("quantized %s to int8 in %.1fs", model_dir.name, time.perf_counter() - started)
+    return out
+
+
+class OnnxProvider(EmbeddingProvider):
+    """
+    CPU inference of a sentence-transformers model through ONNX Runtime: the
+    transformer runs as an (optionally int8-quantized) ONNX graph, pooling and
+    L2 normalization in NumPy. Vectors differ slightly from LocalProvider's, so
+    the model string carries the backend and precision and they are never mixed.
+    """
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: str | None = None,
+        threads: int | None = None,
+        cache_dir: str | None = None,
+    ):
+        quantize = (quantize or ONNX_QUANTIZE).strip().lower()
+        if quantize not in ("int8", "none"):
+            raise RuntimeError(f"Unknown ONNX_QUANTIZE: {quantize}")
+        try:
+            import onnxruntime as ort  # type: ignore
+            from transformers import AutoTokenizer  # type: ignore
+        except Exception as e:  # pragma: no cover
+            raise RuntimeError("onnxruntime and transformers are required for EMBEDDING_PROVIDER=onnx") from e
+
+        model_dir = export_onnx(model_name, cache_dir)
+        meta = json.loads((model_dir / "meta.json").read_text(encoding="utf-8"))
+        path = quantized_model_path(model_dir) if quantize == "int8" else model_dir / "model.onnx"
+
+        opts = ort.SessionOptions()
+        threads = ONNX_INTRA_OP_THREADS if threads is None else int(threads)
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        self._tokenizer = AutoTokenizer.from_pretrained(str(model_dir / "tokenizer"))
+        self._model_name = model_name
+        self._precision = "int8" if quantize == "int8" else "fp32"
+        self._dim = int(meta["dim"])
+        self._pooling = str(meta["pooling"])
+        self._max_length = int(meta["max_seq_length"])
+        self._input_names = list(meta["input_names"])
+
+    @property
+    def embedding_model(self) -> str:
+        return f"onnx:{self._model_name}:{self._dim}:{self._precision}"
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        enc = self._tokenizer(
+            texts, padding=True, truncation=True, max_length=self._max_length, return_tensors="np"
+        )
+        feed = {n: np.asarray(enc[n], dtype=np.int64) for n in self._input_names}
+        hidden = self._session.run(None, feed)[0]
+        if self._pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = feed["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return _l2_normalize(pooled.astype(np.float32, copy=False))
+
+    def embed_batches(
+        self, texts: Sequence[str], batch_size: int | None = None
+    ) -> Iterator[tuple[list[int], np.ndarray]]:
+        for positions in length_sorted_batches(texts, batch_size):
+            yield positions, self._encode([texts[i] or "" for i in positions])
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return _empty(self._dim)
+        out = np.empty((len(texts), self._dim), dtype=np.float32)
+        for positions, vecs in self.embed_batches(texts):
+            out[positions] = vecs
+        return out
@@ -1,15 +1,60 @@
 import json
+import logging
 import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
 
 _DEFAULT_BASE = "https://api.openai.com/v1"
 OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+# Embedding requests in flight at once (also the keep-alive pool size).
+OPENAI_EMBED_CONCURRENCY = int(os.getenv("OPENAI_EMBED_CONCURRENCY", "4"))
+# Per-request budgets; the API allows 2048 inputs and 300k tokens per request.
+OPENAI_EMBED_MAX_INPUTS = int(os.getenv("OPENAI_EMBED_MAX_INPUTS", "2048"))
+OPENAI_EMBED_MAX_TOKENS = int(os.getenv("OPENAI_EMBED_MAX_TOKENS", "250000"))
+# Retries on 429 / 5xx / connection errors, with exponential backoff.
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+_BACKOFF_BASE_S = 1.0
+_BACKOFF_MAX_S = 60.0
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
 
 
 def _base() -> str:
     return os.getenv("OPENAI_BASE", _DEFAULT_BASE).rstrip("/")
 
+
+def _get_session() -> requests.Session:
+    """Process-wide keep-alive session; its pool fits every concurrent request."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, OPENAI_EMBED_CONCURRENCY))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _headers() -> dict[str, str]:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is empty")
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+
 def extract_json_block(text: str) -> str:
     """Возвращает JSON-строку из content: ищет ```json ... ``` или первую валидную JSON-структуру."""
     t = text.strip()
@@ -35,42 +80,124 @@ def extract_json_block(text: str) -> str:
     raise ValueError("No JSON payload found in LLM response")
 
 def chat_completion_json(model: str, prompt: str, max_tokens: int = 400) -> str:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is empty")
     url = f"{_base()}/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
+    headers = _headers()
     payload = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.2,
         "max_tokens": max_tokens,
     }
-    resp = requests.post(url, headers=headers, json=payload, timeout=OPENAI_TIMEOUT)
+    resp = _get_session().post(url, headers=headers, json=payload, timeout=OPENAI_TIMEOUT)
     resp.raise_for_status()
     content = resp.json()["choices"][0]["message"]["content"]
     return extract_json_block(content)
 
 
-def embeddings(model: str, inputs: list[str]) -> list[list[float]]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is empty")
+def estimate_tokens(text: str) -> int:
+    """
+    Upper-bound token estimate without a tokenizer: cl100k averages ~4 bytes of
+    UTF-8 per token for English and ~3 for Cyrillic, so bytes / 3 rarely undercounts.
+    """
+    return len((text or "").encode("utf-8")) // 3 + 1
+
+
+def token_batches(
+    inputs: list[str], max_tokens: int | None = None, max_inputs: int | None = None
+) -> list[list[int]]:
+    """Splits input positions into consecutive batches within the per-request budgets."""
+    max_tokens = max_tokens or OPENAI_EMBED_MAX_TOKENS
+    max_inputs = max_inputs or OPENAI_EMBED_MAX_INPUTS
+    batches: list[list[int]] = []
+    current: list[int] = []
+    used = 0
+    for i, t in enumerate(inputs):
+        n = estimate_tokens(t)
+        if current and (used + n > max_tokens or len(current) >= max_inputs):
+            batches.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += n
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _retry_delay(resp: requests.Response | None, attempt: int) -> float:
+    if resp is not None:
+        for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+            value = resp.headers.get(header)
+            if value:
+                try:
+                    return min(_BACKOFF_MAX_S, max(0.0, float(value) * scale))
+                except ValueError:
+                    pass
+    delay = min(_BACKOFF_MAX_S, _BACKOFF_BASE_S * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+def _post_embeddings(model: str, batch: list[str]) -> list[list[float]]:
     url = f"{_base()}/embeddings"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": model,
-        "input": inputs,
-    }
-    resp = requests.post(url, headers=headers, json=payload, timeout=OPENAI_TIMEOUT)
-    resp.raise_for_status()
-    data = resp.json()["data"]
-    # Preserve input order.
-    data_sorted = sorted(data, key=lambda x: x["index"])
-    return [item["embedding"] for item in data_sorted]
+    headers = _headers()
+    session = _get_session()
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        resp = None
+        try:
+            resp = session.post(
+                url, headers=headers, json={"model": model, "input": batch}, timeout=OPENAI_TIMEOUT
+            )
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+            logger.warning("OpenAI embeddings request failed (%s); retrying", exc)
+        else:
+            if resp.status_code not in _RETRY_STATUS or attempt == OPENAI_MAX_RETRIES:
+                resp.raise_for_status()
+                data = resp.json()["data"]
+                # Preserve input order.
+                return [item["embedding"] for item in sorted(data, key=lambda x: x["index"])]
+            logger.warning("OpenAI embeddings returned %d; retrying", resp.status_code)
+        time.sleep(_retry_delay(resp, attempt))
+    raise RuntimeError("unreachable")
+
+
+def iter_embeddings(
+    model: str, inputs: list[str], max_inputs: int | None = None
+) -> Iterator[tuple[list[int], list[list[float]]]]:
+    """
+    Embeds `inputs` as token-budgeted batches over the pooled session, with at
+    most OPENAI_EMBED_CONCURRENCY requests in flight. Yields `(positions,
+    vectors)` per request in completion order; positions index into `inputs`.
+    """
+    batches = token_batches(inputs, max_inputs=max_inputs)
+    if not batches:
+        return
+    _headers()  # fail fast without an API key
+    workers = max(1, min(OPENAI_EMBED_CONCURRENCY, len(batches)))
+    pending_batches = iter(batches)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openai-embed") as pool:
+        in_flight = {}
+
+        def submit_next() -> None:
+            positions = next(pending_batches, None)
+            if positions is not None:
+                future = pool.submit(_post_embeddings, model, [inputs[i] for i in positions])
+                in_flight[future] = positions
+
+        for _ in range(workers):
+            submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                positions = in_flight.pop(future)
+                vectors = future.result()
+                submit_next()
+                yield positions, vectors
+
+
+def embeddings(model: str, inputs: list[str]) -> list[list[float]]:
+    out: list[list[float] | None] = [None] * len(inputs)
+    for positions, vectors in iter_embeddings(model, inputs):
+        for pos, vec in zip(positions, vectors):
+            out[pos] = vec
+    return out  # type: ignore[return-value]
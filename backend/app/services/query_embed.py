@@ -1,5 +1,91 @@
+import hashlib
+import os
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
 from .embedding import embed_texts
+from .embedding_provider import get_embedding_provider
+from ..utils.cache import RedisCache, TTLCache
+
+# In-process cache of query vectors; the API answers repeated queries without
+# running the model. QUERY_CACHE_REDIS=1 adds a Redis tier shared by replicas.
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "4096"))
+QUERY_CACHE_TTL_S = float(os.getenv("QUERY_CACHE_TTL_S", "3600"))
+
+
+def normalize_query(q: str) -> str:
+    """NFKC + collapsed whitespace; the normalized text is what gets embedded."""
+    return " ".join(unicodedata.normalize("NFKC", q or "").split())
+
+
+@lru_cache(maxsize=1)
+def get_query_cache() -> TTLCache:
+    return TTLCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_S)
+
+
+@lru_cache(maxsize=1)
+def get_query_redis_cache() -> RedisCache | None:
+    if os.getenv("QUERY_CACHE_REDIS", "0").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    return RedisCache(url, prefix="qemb:", ttl_seconds=QUERY_CACHE_TTL_S)
+
+
+def embed_query(q: str, dim: int | None = None) -> np.ndarray:
+    """
+    Query vector for the active embedding model, cached by (model, normalized
+    query): in-process first, then Redis (if enabled), then the model itself.
+    """
+    return embed_queries([q], dim)[0]
+
+
+def embed_queries(queries: list[str], dim: int | None = None) -> np.ndarray:
+    """
+    Vectors of `queries`, shape (len(queries), provider.dim), in input order.
+    Cache lookups as in `embed_query`; all misses (deduplicated by normalized
+    text) go to the provider as one batch.
+    """
+    provider = get_embedding_provider()
+    if dim is not None and dim != provider.dim:
+        raise ValueError(f"dim must be {provider.dim} for the active embedding model")
+    model = provider.embedding_model
+    texts = [normalize_query(q) for q in queries]
+    local = get_query_cache()
+    shared = get_query_redis_cache()
+    found: dict[str, np.ndarray] = {}
+    for text in dict.fromkeys(texts):
+        vec = local.get((model, text))
+        if vec is None and shared is not None:
+            raw = shared.get(_redis_key(model, text))
+            if raw is not None and len(raw) == provider.dim * 4:
+                vec = np.frombuffer(raw, dtype=np.float32)
+                local.set((model, text), vec)
+        if vec is not None:
+            found[text] = vec
+
+    missing = [t for t in dict.fromkeys(texts) if t not in found]
+    if missing:
+        for text, vec in zip(missing, embed_texts(missing)):
+            vec.setflags(write=False)  # shared between requests
+            local.set((model, text), vec)
+            if shared is not None:
+                shared.set(_redis_key(model, text), vec.tobytes())
+            found[text] = vec
+    out = np.empty((len(texts), provider.dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        out[i] = found[text]
+    return out
+
+
+def _redis_key(model: str, text: str) -> str:
+    return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
 
-def embed_query(q: str, dim: int = 1536):
-    # Реально здесь должен быть тот же эмбеддинг, что и для документов.
-    return embed_texts([q], dim=dim)[0]
+def query_cache_stats() -> dict:
+    shared = get_query_redis_cache()
+    return {
+        "local": get_query_cache().stats(),
+        "redis": shared.stats() if shared is not None else None,
+    }
@@ -0,0 +1,162 @@
+"""
+Versioned cache of read responses (GET /search, /nodes/search, /graph).
+
+Every write path that changes what these endpoints return bumps
+`datasets.generation` (`bump_generation`, in the writer's transaction).
+Responses are cached as serialized JSON under (endpoint, generation stamp,
+normalized params), so a bump makes every older entry unreachable: nothing is
+ever invalidated explicitly, stale entries just age out of the LRU / TTL.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+from typing import Any, Iterable
+
+from fastapi import Response
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from .embedding_provider import current_embedding_model
+from .wire_format import JSON, MEDIA_TYPES, encode, gzip_enabled, maybe_gzip
+from ..utils.cache import RedisCache, TTLCache
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE", "1").strip().lower() in ("1", "true", "yes", "on")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "2048"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "600"))
+
+
+def bump_generation(db: Session, dataset_ids: int | Iterable[int] | None) -> None:
+    """Marks the datasets as changed; takes effect when the caller commits."""
+    if dataset_ids is None:
+        return
+    ids = [int(dataset_ids)] if isinstance(dataset_ids, int) else sorted({int(i) for i in dataset_ids})
+    if ids:
+        db.execute(
+            text("UPDATE datasets SET generation = generation + 1 WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": ids},
+        )
+
+
+def generation_stamp(db: Session, dataset_id: int | None) -> str | None:
+    """
+    What cached responses of `dataset_id` are keyed by; None for an unknown
+    dataset (not cached). Without a dataset the stamp covers all of them: any
+    bump, creation or deletion changes it.
+    """
+    if dataset_id is not None:
+        gen = db.execute(text("SELECT generation FROM datasets WHERE id = :ds"), {"ds": dataset_id}).scalar()
+        return None if gen is None else f"{int(dataset_id)}:{int(gen)}"
+    row = db.execute(
+        text("SELECT count(*), COALESCE(max(id), 0), COALESCE(sum(generation), 0) FROM datasets")
+    ).first()
+    return f"all:{int(row[0])}:{int(row[1])}:{int(row[2])}"
+
+
+def result_key(endpoint: str, stamp: str, params: dict[str, Any]) -> str:
+    normalized = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+    return f"{endpoint}:{stamp}:{digest}"
+
+
+def etag_for(key: str) -> str:
+    return 'W/"' + hashlib.sha1(key.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {t.strip() for t in if_none_match.split(",")}
+    return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+
+@lru_cache(maxsize=1)
+def get_result_cache() -> TTLCache:
+    return TTLCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_S)
+
+
+@lru_cache(maxsize=1)
+def get_result_redis_cache() -> RedisCache | None:
+    if os.getenv("RESULT_CACHE_REDIS", "0").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    return RedisCache(url, prefix="result:", ttl_seconds=RESULT_CACHE_TTL_S)
+
+
+def cache_get(key: str) -> bytes | None:
+    local = get_result_cache()
+    body = local.get(key)
+    if body is None:
+        shared = get_result_redis_cache()
+        if shared is not None:
+            body = shared.get(key)
+            if body is not None:
+                local.set(key, body)
+    return body
+
+
+def cache_set(key: str, body: bytes) -> None:
+    get_result_cache().set(key, body)
+    shared = get_result_redis_cache()
+    if shared is not None:
+        shared.set(key, body)
+
+
+def lookup(db: Session, endpoint: str, dataset_id: int | None, params: dict[str, Any]) -> tuple[str | None, bytes | None]:
+    """
+    Cache key of a response (None: not cacheable) and its cached body, if any.
+    The active embedding model is part of the key.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return None, None
+    stamp = generation_stamp(db, dataset_id)
+    if stamp is None:
+        return None, None
+    key = result_key(endpoint, stamp, {**params, "_model": current_embedding_model()})
+    return key, cache_get(key)
+
+
+def json_response(key: str | None, value: Any, headers: dict[str, str] | None = None) -> Response:
+    """Serializes `value` once; the bytes are both cached under `key` and sent."""
+    return encoded_response(key, value, JSON, headers)
+
+
+def encoded_response(
+    key: str | None,
+    value: Any,
+    fmt: str,
+    headers: dict[str, str] | None = None,
+    *,
+    include_text: bool = False,
+    accept_encoding: str | None = None,
+) -> Response:
+    """
+    As json_response, in response encoding `fmt` (services/wire_format.py);
+    the key must tell encodings apart. With `accept_encoding` (the request's
+    Accept-Encoding, "" when absent) the body is gzipped per response when
+    the client accepts it; the cache keeps it uncompressed.
+    """
+    body = value if isinstance(value, bytes) else encode(value, fmt, include_text=include_text)
+    if key is not None and not isinstance(value, bytes):
+        cache_set(key, body)
+    if accept_encoding is not None and gzip_enabled():
+        headers = dict(headers or {})
+        vary = headers.get("Vary")
+        headers["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+        body, gzipped = maybe_gzip(body, accept_encoding)
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+def result_cache_stats() -> dict:
+    shared = get_result_redis_cache()
+    return {
+        "enabled": RESULT_CACHE_ENABLED,
+        "local": get_result_cache().stats(),
+        "redis": shared.stats() if shared is not None else None,
+    }
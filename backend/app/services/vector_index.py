@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# "half" indexes `vec::halfvec(dim)` (pgvector >= 0.7, half the index memory);
+# "full" indexes `vec::vector(dim)`. Rows themselves always keep float32.
+VECTOR_INDEX_PRECISION = os.getenv("VECTOR_INDEX_PRECISION", "half").strip().lower()
+# Index kinds built per model: "hnsw" (cosine, VECTOR_INDEX_PRECISION) and/or
+# "binary" (Hamming over binary_quantize(vec), 1 bit per dimension, pgvector >= 0.7;
+# searched with an exact rerank, see services/vector_search.py).
+VECTOR_INDEX_KINDS = tuple(
+    k.strip() for k in os.getenv("VECTOR_INDEX_KINDS", "hnsw").lower().split(",") if k.strip()
+)
+# Datasets with at least this many vectors of a model also get their own partial
+# indexes (`WHERE model = … AND dataset_id = …`), so their queries traverse a
+# graph of their rows only instead of every dataset's.
+VECTOR_DATASET_INDEX_MIN_ROWS = int(os.getenv("VECTOR_DATASET_INDEX_MIN_ROWS", "5000"))
+# Largest dimension pgvector's HNSW can index per element type.
+_MAX_INDEX_DIM = {"half": 4000, "full": 2000, "bit": 64000}
+# Column holding the embedding model name, per vector table.
+_MODEL_COLUMN = {"embeddings": "model", "knowledge_nodes": "embedding_model"}
+_TABLE_TAG = {"embeddings": "emb", "knowledge_nodes": "kn"}
+_HNSW_EF_CONSTRUCTION = {"embeddings": 200, "knowledge_nodes": 64}
+# How long a looked-up IndexSpec is reused before re-reading `vector_indexes`.
+_SPEC_TTL_SECONDS = 60.0
+
+_spec_cache: dict[tuple[str, str, str, int | None], tuple[float, "IndexSpec | None"]] = {}
+_spec_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """How the vectors of one model are indexed; queries must use the same expression."""
+
+    dim: int
+    precision: str  # "half" | "full" | "bit" (binary-quantized)
+
+    @property
+    def kind(self) -> str:
+        return "binary" if self.precision == "bit" else "hnsw"
+
+    def expression(self, column: str) -> str:
+        if self.precision == "bit":
+            return f"binary_quantize({column})::bit({self.dim})"
+        sql_type = f"halfvec({self.dim})" if self.precision == "half" else f"vector({self.dim})"
+        return f"({column})::{sql_type}"
+
+    @property
+    def opclass(self) -> str:
+        return {"half": "halfvec_cosine_ops", "full": "vector_cosine_ops", "bit": "bit_hamming_ops"}[
+            self.precision
+        ]
+
+    @property
+    def operator(self) -> str:
+        return "<~>" if self.precision == "bit" else "<=>"
+
+
+def distance_sql(column: str, query: str, spec: IndexSpec | None) -> str:
+    """
+    Distance between `column` and `query` spelled exactly like the index
+    expression so the planner can use it: cosine for HNSW specs, Hamming for
+    binary ones. Without an index the plain (exact) cosine form is used.
+    """
+    if spec is None:
+        return f"{column} <=> {query}"
+    return f"{spec.expression(column)} {spec.operator} {spec.expression(query)}"
+
+
+def index_name(table: str, model: str, kind: str = "hnsw", dataset_id: int | None = None) -> str:
+    if dataset_id is None:
+        digest = hashlib.sha1(f"{table}|{model}".encode("utf-8")).hexdigest()[:12]
+        scope = ""
+    else:
+        digest = hashlib.sha1(f"{table}|{model}|{int(dataset_id)}".encode("utf-8")).hexdigest()[:12]
+        scope = f"_d{int(dataset_id)}"
+    suffix = "" if kind == "hnsw" else "_bq"
+    return f"vidx_{_TABLE_TAG[table]}{scope}_{digest}{suffix}"
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def pgvector_version(conn) -> tuple[int, ...]:
+    v = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    if not v:
+        return ()
+    return tuple(int(p) for p in str(v).split(".") if p.isdigit())
+
+
+def resolve_precision(conn) -> str:
+    """VECTOR_INDEX_PRECISION, downgraded to "full" when halfvec is unavailable."""
+    if VECTOR_INDEX_PRECISION == "full":
+        return "full"
+    if VECTOR_INDEX_PRECISION != "half":
+        raise RuntimeError(f"Unknown VECTOR_INDEX_PRECISION: {VECTOR_INDEX_PRECISION}")
+    if pgvector_version(conn) >= (0, 7):
+        return "half"
+    logger.info("pgvector < 0.7 has no halfvec; using full-precision vector indexes")
+    return "full"
+
+
+def index_spec(
+    db: Session, table: str, model: str, kind: str = "hnsw", dataset_id: int | None = None
+) -> IndexSpec | None:
+    """
+    Ready index of `model` on `table` (with `dataset_id`: that dataset's partial
+    index), or None (queries then use the model index or scan exactly).
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    key = (table, model, kind, dataset_id)
+    now = time.monotonic()
+    with _spec_lock:
+        cached = _spec_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    scope = "dataset_id IS NULL" if dataset_id is None else "dataset_id = :ds"
+    row = db.execute(
+        text(
+            "SELECT dim, precision FROM vector_indexes "
+            "WHERE table_name = :t AND model = :m AND kind = :k "
+            f"AND {scope} AND status = 'ready'"
+        ),
+        {"t": table, "m": model, "k": kind, "ds": dataset_id},
+    ).first()
+    spec = IndexSpec(int(row[0]), str(row[1])) if row else None
+    with _spec_lock:
+        _spec_cache[key] = (now + _SPEC_TTL_SECONDS, spec)
+    return spec
+
+
+def ensure_model_index(
+    table: str, model: str, dim: int, kind: str = "hnsw", dataset_id: int | None = None
+) -> IndexSpec | None:
+    """
+    Builds (CONCURRENTLY, outside any transaction) the partial HNSW index for one
+    model on one vector table, optionally restricted to one dataset, and records
+    it in `vector_indexes`. Idempotent and safe to call from several workers: the
+    build is guarded by an advisory lock. Never raises — without an index,
+    queries fall back to exact scans.
+    """
+    from ..db.session import engine  # local import: keeps the module DB-agnostic
+
+    if engine.dialect.name != "postgresql":
+        return None
+    name = index_name(table, model, kind, dataset_id)
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            got_lock = conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:n))"), {"n": name}).scalar()
+            if not got_lock:
+                return None  # another process is building it
+            try:
+                return _build_index(conn, table, model, dim, kind, name, dataset_id)
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:n))"), {"n": name})
+    except Exception as exc:
+        logger.warning("vector index %s for %s could not be built: %s", table, model, exc)
+        return None
+    finally:
+        with _spec_lock:
+            _spec_cache.pop((table, model, kind, dataset_id), None)
+
+
+def _build_index(
+    conn, table: str, model: str, dim: int, kind: str, name: str, dataset_id: int | None = None
+) -> IndexSpec | None:
+    row = conn.execute(
+        text("SELECT dim, precision, status FROM vector_indexes WHERE index_name = :n"),
+        {"n": name},
+    ).first()
+    valid = conn.execute(
+        text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :n"
+        ),
+        {"n": name},
+    ).scalar()
+    if row is not None and row[2] == "ready" and valid and int(row[0]) == dim:
+        return IndexSpec(dim, str(row[1]))
+
+    if kind == "binary":
+        if pgvector_version(conn) < (0, 7):
+            logger.warning("binary-quantized vector indexes need pgvector >= 0.7")
+            return None
+        precision = "bit"
+    elif kind == "hnsw":
+        precision = resolve_precision(conn)
+    else:
+        raise RuntimeError(f"Unknown vector index kind: {kind}")
+    if dim > _MAX_INDEX_DIM[precision]:
+        logger.warning(
+            "%s vectors of %s have %d dims; HNSW supports at most %d at %s precision",
+            table, model, dim, _MAX_INDEX_DIM[precision], precision,
+        )
+        return None
+    spec = IndexSpec(dim, precision)
+    if valid is not None:
+        # Left invalid by an interrupted build, or built for another dimension.
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    conn.execute(
+        text(
+            """
+            INSERT INTO vector_indexes (table_name, model, kind, dataset_id, dim, precision, index_name, status)
+            VALUES (:t, :m, :k, :ds, :d, :p, :n, 'building')
+            ON CONFLICT (index_name)
+            DO UPDATE SET dim = EXCLUDED.dim, precision = EXCLUDED.precision,
+                          status = 'building', error = NULL, updated_at = now()
+            """
+        ),
+        {"t": table, "m": model, "k": kind, "ds": dataset_id, "d": dim, "p": precision, "n": name},
+    )
+    predicate = f"{_MODEL_COLUMN[table]} = {_sql_literal(model)}"
+    if dataset_id is not None:
+        predicate += f" AND dataset_id = {int(dataset_id)}"
+    started = time.perf_counter()
+    try:
+        conn.execute(text("SET maintenance_work_mem = '512MB'"))
+        conn.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} "
+                f"USING hnsw (({spec.expression('vec')}) {spec.opclass}) "
+                f"WITH (m = 16, ef_construction = {_HNSW_EF_CONSTRUCTION[table]}) "
+                f"WHERE {predicate}"
+            )
+        )
+    except Exception as exc:
+        conn.execute(
+            text("UPDATE vector_indexes SET status = 'failed', error = :e, updated_at = now() WHERE index_name = :n"),
+            {"e": str(exc)[:2000], "n": name},
+        )
+        raise
+    finally:
+        conn.execute(text("RESET maintenance_work_mem"))
+    conn.execute(
+        text("UPDATE vector_indexes SET status = 'ready', updated_at = now() WHERE index_name = :n"),
+        {"n": name},
+    )
+    logger.info(
+        "built %s index %s for %s%s (%d dims) in %.1fs",
+        precision, name, model, "" if dataset_id is None else f" in dataset {dataset_id}", dim,
+        time.perf_counter() - started,
+    )
+    return spec
+
+
+def ensure_vector_indexes(model: str, dim: int) -> dict[str, IndexSpec | None]:
+    """
+    Per-model indexes (every kind in VECTOR_INDEX_KINDS) on both vector tables,
+    keyed "<table>" for HNSW and "<table>:<kind>" for other kinds.
+    """
+    out: dict[str, IndexSpec | None] = {}
+    for table in _MODEL_COLUMN:
+        for kind in VECTOR_INDEX_KINDS:
+            key = table if kind == "hnsw" else f"{table}:{kind}"
+            out[key] = ensure_model_index(table, model, dim, kind)
+    return out
+
+
+def dataset_vector_rows(conn, table: str, model: str, dataset_id: int) -> int:
+    return int(
+        conn.execute(
+            text(
+                f"SELECT count(*) FROM {table} "
+                f"WHERE {_MODEL_COLUMN[table]} = :m AND dataset_id = :ds AND vec IS NOT NULL"
+            ),
+            {"m": model, "ds": dataset_id},
+        ).scalar()
+        or 0
+    )
+
+
+def ensure_dataset_indexes(
+    dataset_id: int, model: str, dim: int, min_rows: int | None = None
+) -> dict[str, IndexSpec | None]:
+    """
+    Dataset-scoped counterpart of `ensure_vector_indexes`, for the tables where
+    the dataset has at least `min_rows` (VECTOR_DATASET_INDEX_MIN_ROWS) vectors
+    of `model`; smaller ones map to None and keep using the model index.
+    """
+    from ..db.session import engine
+
+    if engine.dialect.name != "postgresql":
+        return {}
+    threshold = VECTOR_DATASET_INDEX_MIN_ROWS if min_rows is None else int(min_rows)
+    out: dict[str, IndexSpec | None] = {}
+    for table in _MODEL_COLUMN:
+        with engine.connect() as conn:
+            rows = dataset_vector_rows(conn, table, model, dataset_id)
+        for kind in VECTOR_INDEX_KINDS:
+            key = table if kind == "hnsw" else f"{table}:{kind}"
+            out[key] = ensure_model_index(table, model, dim, kind, dataset_id) if rows >= max(threshold, 1) else None
+    return out
+
+
+def drop_dataset_indexes(dataset_id: int) -> list[str]:
+    """
+    Drops (CONCURRENTLY) every partial index of the dataset and its catalog rows.
+    Call it before deleting the dataset: the catalog rows would cascade away
+    with it, but the indexes themselves would stay behind.
+    """
+    from ..db.session import engine
+
+    if engine.dialect.name != "postgresql":
+        return []
+    dropped: list[str] = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        rows = conn.execute(
+            text("SELECT index_name, table_name, model, kind FROM vector_indexes WHERE dataset_id = :ds"),
+            {"ds": dataset_id},
+        ).all()
+        for name, table, model, kind in rows:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            conn.execute(text("DELETE FROM vector_indexes WHERE index_name = :n"), {"n": name})
+            with _spec_lock:
+                _spec_cache.pop((table, model, kind, dataset_id), None)
+            dropped.append(name)
+    if dropped:
+        logger.info("dropped %d vector indexes of dataset %d", len(dropped), dataset_id)
+    return dropped
+
+
+def list_dataset_indexes(db: Session, dataset_id: int) -> list[dict]:
+    rows = db.execute(
+        text(
+            "SELECT table_name, model, kind, dim, precision, index_name, status, error, updated_at "
+            "FROM vector_indexes WHERE dataset_id = :ds ORDER BY table_name, model, kind"
+        ),
+        {"ds": dataset_id},
+    ).mappings().all()
+    return [dict(r) for r in rows]
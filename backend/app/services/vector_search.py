@@ -0,0 +1,539 @@
+from __future__ import annotations
+
+import math
+import os
+import time
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..utils.cache import TTLCache
+from .vector_index import IndexSpec, distance_sql, index_name, index_spec, pgvector_version
+
+if TYPE_CHECKING:
+    from .vector_snapshot import NodeVectorSnapshot
+
+# Default oversampling for two-stage search when a model only has a binary index.
+VECTOR_RERANK_OVERSAMPLE = int(os.getenv("VECTOR_RERANK_OVERSAMPLE", "4"))
+# pgvector caps hnsw.ef_search at 1000, so one HNSW scan yields at most this many rows.
+MAX_CANDIDATES = 1000
+# pgvector's default hnsw.ef_search.
+_DEFAULT_EF_SEARCH = 40
+# hnsw.ef_search per requested row of a single-stage HNSW query; divided by the
+# filter's selectivity when pgvector cannot scan iteratively.
+VECTOR_EF_SEARCH_FACTOR = float(os.getenv("VECTOR_EF_SEARCH_FACTOR", "2"))
+# Filters leaving at most this many rows of a model are searched exactly: a
+# sequential scan of so few rows is fast and never misses neighbours.
+VECTOR_EXACT_MAX_ROWS = int(os.getenv("VECTOR_EXACT_MAX_ROWS", "2000"))
+# hnsw.iterative_scan for filtered queries (pgvector >= 0.8): "strict_order",
+# "relaxed_order" or "off".
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "strict_order").strip().lower()
+# A vector snapshot proposes max(2 * top_k, top_k + this) candidates for the exact rerank.
+SNAPSHOT_RERANK_EXTRA = 10
+# How long row counts used for selectivity are reused.
+_COUNT_TTL_SECONDS = 60.0
+# Reciprocal rank fusion constant; larger values flatten the rank differences.
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Candidates taken from each branch of hybrid search, per result.
+HYBRID_POOL_FACTOR = int(os.getenv("HYBRID_POOL_FACTOR", "10"))
+
+_QUERY = "(SELECT v FROM q)"
+
+_counts = TTLCache(4096, _COUNT_TTL_SECONDS)
+
+# Rows of one model, optionally restricted to a dataset, per vector table.
+_FILTERED_COUNT_SQL = {
+    "embeddings": (
+        "SELECT count(*) FROM embeddings WHERE model = :m AND vec IS NOT NULL AND dataset_id = :ds"
+    ),
+    "knowledge_nodes": (
+        "SELECT count(*) FROM knowledge_nodes "
+        "WHERE embedding_model = :m AND vec IS NOT NULL AND dataset_id = :ds"
+    ),
+}
+_MODEL_COUNT_SQL = {
+    "embeddings": "SELECT count(*) FROM embeddings WHERE model = :m AND vec IS NOT NULL",
+    "knowledge_nodes": "SELECT count(*) FROM knowledge_nodes WHERE embedding_model = :m AND vec IS NOT NULL",
+}
+
+
+@dataclass(frozen=True)
+class KnnPlan:
+    """
+    How a kNN query runs. Single stage (`candidates is None`) orders by `coarse`
+    directly; two stage takes `candidates` rows by `coarse` and reranks them by
+    exact cosine distance over the float32 vectors.
+    """
+
+    mode: str  # "exact" | "hnsw" | "hnsw+rerank" | "binary+rerank"
+    coarse: IndexSpec | None = None
+    candidates: int | None = None
+    # Per-transaction index settings (None = server default) and the filter
+    # statistics they were derived from.
+    ef_search: int | None = None
+    iterative_scan: str | None = None
+    filtered_rows: int | None = None
+    selectivity: float | None = None
+    # Set when `coarse` is this dataset's own partial index.
+    index_dataset: int | None = None
+
+
+EXACT = KnnPlan("exact")
+
+
+def plan_knn(
+    db: Session, table: str, model: str, top_k: int, oversample: int | None, dataset_id: int | None = None
+) -> KnnPlan:
+    """
+    Without `oversample`, uses the model's HNSW index (or an exact scan); models
+    indexed only by binary quantization always go through two stages. With
+    `oversample`, stage one fetches top_k * oversample candidates, preferring the
+    binary index (smallest, least accurate) over HNSW.
+
+    With `dataset_id`, the dataset's own partial indexes are preferred (every
+    row they hold passes the filter). Otherwise the share of the model's rows in
+    the dataset decides the rest: a small dataset is scanned exactly, a larger
+    one raises ef_search as the filter gets more selective (or pgvector >= 0.8
+    scans the index iteratively until enough rows pass the filter).
+    """
+    hnsw = binary = None
+    if dataset_id is not None:
+        hnsw = index_spec(db, table, model, dataset_id=dataset_id)
+        binary = index_spec(db, table, model, "binary", dataset_id)
+    scoped = hnsw is not None or binary is not None
+    if not scoped:
+        hnsw = index_spec(db, table, model)
+        binary = index_spec(db, table, model, "binary")
+    if oversample is None:
+        if hnsw is not None:
+            plan = KnnPlan("hnsw", hnsw)
+        elif binary is None:
+            return EXACT
+        else:
+            oversample = VECTOR_RERANK_OVERSAMPLE
+    if oversample is not None:
+        coarse = binary or hnsw
+        if coarse is None:
+            return EXACT
+        candidates = min(MAX_CANDIDATES, max(top_k, top_k * max(1, int(oversample))))
+        plan = KnnPlan(f"{coarse.kind}+rerank", coarse, candidates)
+
+    filtered_rows = selectivity = iterative = None
+    if scoped:
+        filtered_rows, selectivity = _row_counts(db, table, model, dataset_id)[0], 1.0
+    elif dataset_id is not None:
+        filtered_rows, model_rows = _row_counts(db, table, model, dataset_id)
+        if filtered_rows <= VECTOR_EXACT_MAX_ROWS:
+            return replace(EXACT, filtered_rows=filtered_rows)
+        selectivity = round(min(1.0, filtered_rows / max(model_rows, 1)), 6)
+        if VECTOR_ITERATIVE_SCAN != "off" and _has_iterative_scan(db):
+            iterative = VECTOR_ITERATIVE_SCAN
+    rows = plan.candidates if plan.candidates is not None else math.ceil(top_k * VECTOR_EF_SEARCH_FACTOR)
+    return replace(
+        plan,
+        ef_search=ef_search_for(rows, None if iterative else selectivity),
+        iterative_scan=iterative,
+        filtered_rows=filtered_rows,
+        selectivity=selectivity,
+        index_dataset=dataset_id if scoped else None,
+    )
+
+
+def ef_search_for(rows: int, selectivity: float | None = None) -> int | None:
+    """
+    hnsw.ef_search for an index scan that should yield `rows` rows when only
+    `selectivity` of the indexed rows pass the filter; None when the default
+    already suffices. Capped at pgvector's maximum.
+    """
+    ef = float(rows)
+    if selectivity is not None:
+        ef /= max(selectivity, 1e-6)
+    ef = min(MAX_CANDIDATES, math.ceil(ef))
+    return ef if ef > _DEFAULT_EF_SEARCH else None
+
+
+def _row_counts(db: Session, table: str, model: str, dataset_id: int) -> tuple[int, int]:
+    """(rows of `model` in the dataset, rows of `model` overall), cached briefly."""
+    key = (table, model, dataset_id)
+    cached = _counts.get(key)
+    if cached is not None:
+        return cached
+    filtered = int(db.execute(text(_FILTERED_COUNT_SQL[table]), {"m": model, "ds": dataset_id}).scalar() or 0)
+    total = _model_rows(db, table, model)
+    counts = (filtered, max(total, filtered))
+    _counts.set(key, counts)
+    return counts
+
+
+def _model_rows(db: Session, table: str, model: str) -> int:
+    key = (table, model, None)
+    cached = _counts.get(key)
+    if cached is not None:
+        return cached[1]
+    rows = None
+    if db.get_bind().dialect.name == "postgresql":
+        # The partial index holds exactly the model's rows; its statistics are free.
+        rows = db.execute(
+            text("SELECT reltuples FROM pg_class WHERE relname = :n"), {"n": index_name(table, model)}
+        ).scalar()
+    if rows is None or rows <= 0:
+        rows = db.execute(text(_MODEL_COUNT_SQL[table]), {"m": model}).scalar()
+    rows = int(rows or 0)
+    _counts.set(key, (rows, rows))
+    return rows
+
+
+def _has_iterative_scan(db: Session) -> bool:
+    cached = _counts.get("iterative_scan")
+    if cached is None:
+        cached = db.get_bind().dialect.name == "postgresql" and pgvector_version(db) >= (0, 8)
+        _counts.set("iterative_scan", cached)
+    return cached
+
+
+def apply_knn_settings(db: Session, plan: KnnPlan, rows: int | None = None) -> dict[str, str]:
+    """
+    Sets the plan's index settings for the current transaction only; `rows`
+    raises ef_search for scans yielding more than the plan's rows (hybrid pools).
+    Returns what was set.
+    """
+    if plan.coarse is None:
+        return {}
+    ef = plan.ef_search
+    if rows is not None:
+        ef = max(ef or 0, ef_search_for(rows, None if plan.iterative_scan else plan.selectivity) or 0) or None
+    settings: dict[str, str] = {}
+    if ef is not None:
+        settings["hnsw.ef_search"] = str(ef)
+    if plan.iterative_scan is not None:
+        settings["hnsw.iterative_scan"] = plan.iterative_scan
+    if plan.index_dataset is not None:
+        # A partial index matches `dataset_id = :ds` only in plans made for the
+        # bound value; psycopg prepares repeated statements, so generic plans
+        # (which could not use it) are ruled out.
+        settings["plan_cache_mode"] = "force_custom_plan"
+    if settings:
+        calls = ", ".join(f"set_config('{name}', :v{i}, true)" for i, name in enumerate(settings))
+        db.execute(text(f"SELECT {calls}"), {f"v{i}": v for i, v in enumerate(settings.values())})
+    return settings
+
+
+def _plan_debug(plan: KnnPlan, settings: dict[str, str]) -> dict[str, Any]:
+    ef = settings.get("hnsw.ef_search")
+    return {
+        "ef_search": int(ef) if ef is not None else (_DEFAULT_EF_SEARCH if plan.coarse is not None else None),
+        "iterative_scan": plan.iterative_scan,
+        "filtered_rows": plan.filtered_rows,
+        "selectivity": plan.selectivity,
+        "index_scope": None if plan.coarse is None else ("dataset" if plan.index_dataset is not None else "model"),
+    }
+
+
+def knn_sql(
+    *, select: str, from_: str, where: str, id_column: str, column: str, plan: KnnPlan, limit: str = ":k"
+) -> str:
+    """
+    kNN statement for `plan`. The query vector is bound as :qvec and the result
+    size as `limit` (:k); `select` may refer to the query vector as `(SELECT v FROM q)`.
+    """
+    head = "WITH q AS (SELECT CAST(:qvec AS vector) AS v)"
+    order = distance_sql(column, _QUERY, plan.coarse)
+    if plan.candidates is None:
+        return f"""
+            {head}
+            SELECT {select}
+            FROM {from_}
+            WHERE {where}
+            ORDER BY {order}
+            LIMIT {limit}
+        """
+    return f"""
+        {head},
+        cand AS MATERIALIZED (
+            SELECT {id_column} AS id
+            FROM {from_}
+            WHERE {where}
+            ORDER BY {order}
+            LIMIT {int(plan.candidates)}
+        )
+        SELECT {select}
+        FROM {from_}
+        WHERE {id_column} IN (SELECT id FROM cand)
+        ORDER BY {column} <=> {_QUERY}
+        LIMIT {limit}
+    """
+
+
+def batch_knn_sql(*, select: str, from_: str, where: str, id_column: str, column: str, plan: KnnPlan) -> str:
+    """
+    kNN for many query vectors in one statement: :qvecs (vector[]) is unnested
+    WITH ORDINALITY and a LATERAL subquery per query runs the same plan as
+    `knn_sql` (:k rows each). `select` refers to the query vector as `qs.v`;
+    rows come back ordered by query position (`qpos`, 1-based), then distance.
+    """
+    order = distance_sql(column, "qs.v", plan.coarse)
+    if plan.candidates is None:
+        inner = f"""
+            SELECT {select}, {column} <=> qs.v AS _dist
+            FROM {from_}
+            WHERE {where}
+            ORDER BY {order}
+            LIMIT :k
+        """
+    else:
+        inner = f"""
+            SELECT {select}, {column} <=> qs.v AS _dist
+            FROM {from_}
+            WHERE {id_column} IN (
+                SELECT {id_column} FROM {from_}
+                WHERE {where}
+                ORDER BY {order}
+                LIMIT {int(plan.candidates)}
+            )
+            ORDER BY {column} <=> qs.v
+            LIMIT :k
+        """
+    return f"""
+        WITH qs AS (
+            SELECT qpos, v FROM unnest(CAST(:qvecs AS vector[])) WITH ORDINALITY AS t(v, qpos)
+        )
+        SELECT qs.qpos, h.*
+        FROM qs
+        CROSS JOIN LATERAL ({inner}) h
+        ORDER BY qs.qpos, h._dist
+    """
+
+
+def hybrid_sql(
+    *, select: str, from_: str, where: str, id_column: str, column: str, tsv_column: str, plan: KnnPlan
+) -> str:
+    """
+    Hybrid statement: the top :pool rows by vector distance (per `plan`) and the
+    top :pool full-text matches of :qtext (websearch syntax, russian config,
+    ranked by ts_rank_cd) are fused by reciprocal rank fusion,
+    rrf = :w_vec / (:rrf_k + vector_rank) + :w_lex / (:rrf_k + lexical_rank),
+    and the :k best are returned with `select` plus rrf_score, vector_rank and
+    lexical_rank (NULL when a branch missed the row); a zero weight turns its
+    branch off. Both branches run in the same statement, so fusion costs one
+    round-trip.
+    """
+    ann = knn_sql(
+        select=f"{id_column} AS id, {column} <=> {_QUERY} AS dist",
+        from_=from_, where=where, id_column=id_column, column=column, plan=plan, limit=":pool",
+    )
+    return f"""
+        WITH q AS (SELECT CAST(:qvec AS vector) AS v),
+        tsq AS (SELECT websearch_to_tsquery('russian', :qtext) AS t),
+        ann AS (
+            SELECT id, row_number() OVER (ORDER BY dist, id) AS rnk
+            FROM ({ann}) a
+        ),
+        lex AS (
+            SELECT id, row_number() OVER (ORDER BY r DESC, id) AS rnk
+            FROM (
+                SELECT {id_column} AS id, ts_rank_cd({tsv_column}, (SELECT t FROM tsq)) AS r
+                FROM {from_}
+                WHERE {where} AND {tsv_column} @@ (SELECT t FROM tsq)
+                ORDER BY r DESC
+                LIMIT :pool
+            ) l
+        ),
+        fused AS (
+            SELECT id,
+                   SUM(w / (:rrf_k + rnk)) AS rrf_score,
+                   MIN(rnk) FILTER (WHERE src = 'vec') AS vector_rank,
+                   MIN(rnk) FILTER (WHERE src = 'lex') AS lexical_rank
+            FROM (
+                SELECT id, rnk, CAST(:w_vec AS float8) AS w, 'vec' AS src FROM ann
+                UNION ALL
+                SELECT id, rnk, CAST(:w_lex AS float8), 'lex' FROM lex
+            ) u
+            GROUP BY id
+            HAVING SUM(w / (:rrf_k + rnk)) > 0
+            ORDER BY rrf_score DESC, id
+            LIMIT :k
+        )
+        SELECT {select}, f.rrf_score, f.vector_rank, f.lexical_rank
+        FROM fused f, {from_}
+        WHERE {id_column} = f.id
+        ORDER BY f.rrf_score DESC, f.id
+    """
+
+
+def recall_at_k(rows, exact, key: str, score_key: str = "score") -> float:
+    """
+    Share of the exact top-k found by `rows`. Hits tied with the exact k-th score
+    count as found: with equal distances either neighbour is a correct answer.
+    """
+    if not exact:
+        return 1.0
+    exact_ids = {r[key] for r in exact}
+    kth = min(float(r[score_key]) for r in exact)
+    found = sum(1 for r in rows if r[key] in exact_ids or float(r[score_key]) >= kth - 1e-6)
+    return round(min(found, len(exact)) / len(exact), 4)
+
+
+def run_knn(
+    db: Session,
+    *,
+    select: str,
+    from_: str,
+    where: str,
+    id_column: str,
+    column: str,
+    params: dict[str, Any],
+    plan: KnnPlan,
+    key: str,
+    debug: bool = False,
+) -> tuple[list, dict[str, Any] | None]:
+    """
+    Runs `plan`; with `debug` also runs the exact query and reports recall@k of
+    the planned result against it (`key` names the result column holding ids,
+    `score` the similarity).
+    """
+    sql_kw = dict(select=select, from_=from_, where=where, id_column=id_column, column=column)
+    settings = apply_knn_settings(db, plan)
+    started = time.perf_counter()
+    rows = db.execute(text(knn_sql(plan=plan, **sql_kw)), params).mappings().all()
+    latency_ms = (time.perf_counter() - started) * 1000.0
+    if not debug:
+        return rows, None
+
+    started = time.perf_counter()
+    exact = db.execute(text(knn_sql(plan=EXACT, **sql_kw)), params).mappings().all()
+    exact_ms = (time.perf_counter() - started) * 1000.0
+    return rows, {
+        "mode": plan.mode,
+        "candidates": plan.candidates,
+        **_plan_debug(plan, settings),
+        "recall": recall_at_k(rows, exact, key),
+        "latency_ms": round(latency_ms, 2),
+        "exact_latency_ms": round(exact_ms, 2),
+    }
+
+
+def run_snapshot_knn(
+    db: Session,
+    snapshot: "NodeVectorSnapshot",
+    *,
+    select: str,
+    from_: str,
+    where: str,
+    id_column: str,
+    column: str,
+    params: dict[str, Any],
+    key: str,
+    debug: bool = False,
+) -> tuple[list, dict[str, Any] | None]:
+    """
+    kNN against an in-process vector snapshot: the snapshot proposes a few more
+    candidates than :k, and Postgres returns those rows (primary-key lookups)
+    reranked by exact distance, so results and scores match `run_knn`.
+    """
+    top_k = int(params["k"])
+    started = time.perf_counter()
+    ids, _ = snapshot.search(params["qvec"], max(2 * top_k, top_k + SNAPSHOT_RERANK_EXTRA))
+    sql = f"""
+        WITH q AS (SELECT CAST(:qvec AS vector) AS v)
+        SELECT {select}
+        FROM {from_}
+        WHERE {where} AND {id_column} = ANY(:ids)
+        ORDER BY {column} <=> {_QUERY}
+        LIMIT :k
+    """
+    rows = db.execute(text(sql), {**params, "ids": [int(i) for i in ids[0]]}).mappings().all()
+    latency_ms = (time.perf_counter() - started) * 1000.0
+    if not debug:
+        return rows, None
+
+    started = time.perf_counter()
+    sql_kw = dict(select=select, from_=from_, where=where, id_column=id_column, column=column)
+    exact = db.execute(text(knn_sql(plan=EXACT, **sql_kw)), params).mappings().all()
+    exact_ms = (time.perf_counter() - started) * 1000.0
+    return rows, {
+        "mode": "snapshot",
+        "candidates": int(ids.shape[1]),
+        "snapshot": {"version": snapshot.version, "rows": len(snapshot)},
+        "recall": recall_at_k(rows, exact, key),
+        "latency_ms": round(latency_ms, 2),
+        "exact_latency_ms": round(exact_ms, 2),
+    }
+
+
+def run_hybrid(
+    db: Session,
+    *,
+    select: str,
+    from_: str,
+    where: str,
+    id_column: str,
+    column: str,
+    tsv_column: str,
+    params: dict[str, Any],
+    plan: KnnPlan,
+    w_vec: float = 1.0,
+    w_lex: float = 1.0,
+    rrf_k: int | None = None,
+    debug: bool = False,
+) -> tuple[list, dict[str, Any] | None]:
+    """
+    Runs `hybrid_sql`; `params` must bind :qvec, :qtext and :k. Each branch
+    contributes top_k * HYBRID_POOL_FACTOR candidates.
+    """
+    top_k = int(params["k"])
+    pool = min(MAX_CANDIDATES, max(top_k, top_k * HYBRID_POOL_FACTOR, plan.candidates or 0))
+    settings = apply_knn_settings(db, plan, pool)
+    sql = hybrid_sql(
+        select=select, from_=from_, where=where, id_column=id_column, column=column,
+        tsv_column=tsv_column, plan=plan,
+    )
+    bind = {
+        **params,
+        "pool": pool,
+        "w_vec": float(w_vec),
+        "w_lex": float(w_lex),
+        "rrf_k": int(rrf_k if rrf_k is not None else HYBRID_RRF_K),
+    }
+    started = time.perf_counter()
+    rows = db.execute(text(sql), bind).mappings().all()
+    latency_ms = (time.perf_counter() - started) * 1000.0
+    if not debug:
+        return rows, None
+    return rows, {
+        "mode": "hybrid",
+        "vector_mode": plan.mode,
+        "candidates": pool,
+        **_plan_debug(plan, settings),
+        "rrf_k": bind["rrf_k"],
+        "weights": {"vector": bind["w_vec"], "lexical": bind["w_lex"]},
+        "vector_hits": sum(1 for r in rows if r["vector_rank"] is not None),
+        "lexical_hits": sum(1 for r in rows if r["lexical_rank"] is not None),
+        "latency_ms": round(latency_ms, 2),
+    }
+
+
+def run_batch_knn(
+    db: Session,
+    *,
+    select: str,
+    from_: str,
+    where: str,
+    id_column: str,
+    column: str,
+    qvecs,
+    params: dict[str, Any],
+    plan: KnnPlan,
+) -> list[list[dict[str, Any]]]:
+    """Runs `batch_knn_sql`; returns one hit list per query vector, in input order."""
+    apply_knn_settings(db, plan)
+    sql = batch_knn_sql(select=select, from_=from_, where=where, id_column=id_column, column=column, plan=plan)
+    rows = db.execute(text(sql), {**params, "qvecs": list(qvecs)}).mappings().all()
+    out: list[list[dict[str, Any]]] = [[] for _ in range(len(qvecs))]
+    for row in rows:
+        hit = dict(row)
+        pos = int(hit.pop("qpos")) - 1
+        hit.pop("_dist", None)
+        out[pos].append(hit)
+    return out
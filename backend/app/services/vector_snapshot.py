@@ -0,0 +1,316 @@
+"""
+Read-only, memory-mapped snapshots of a dataset's node vectors.
+
+A snapshot is a directory `<VECTOR_SNAPSHOT_DIR>/nodes/<dataset>/<model slug>/v<version>/`
+with `vecs.npy` (float16, L2-normalized, one row per node), `ids.npy` (int64,
+ascending) and `meta.json`. `version` is `datasets.vectors_version` read before
+the export; a trigger (migration 0023) bumps it whenever node vectors of the
+dataset change, so a snapshot whose version differs from the dataset's is stale
+and callers fall back to Postgres.
+
+API processes open the arrays with `np.load(mmap_mode="r")`, so every process
+shares the page cache instead of holding its own copy, and score them in blocks
+(float16 rows are widened to float32 one block at a time; small snapshots
+are widened once, see VECTOR_SNAPSHOT_WIDEN_MAX_MB).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .graph_build import iter_node_vector_blocks
+
+logger = logging.getLogger(__name__)
+
+# Empty disables snapshots. Must be shared by the workers (which write
+# snapshots) and the API processes (which read them), e.g. a common volume.
+VECTOR_SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR", "").strip()
+# Datasets with fewer node vectors of a model are not worth a snapshot.
+VECTOR_SNAPSHOT_MIN_ROWS = int(os.getenv("VECTOR_SNAPSHOT_MIN_ROWS", "1000"))
+# How often (seconds) a process re-reads datasets.vectors_version of a snapshot it serves.
+VECTOR_SNAPSHOT_CHECK_S = float(os.getenv("VECTOR_SNAPSHOT_CHECK_S", "5"))
+# Rows widened to float32 and scored per matrix product.
+VECTOR_SNAPSHOT_BLOCK_ROWS = int(os.getenv("VECTOR_SNAPSHOT_BLOCK_ROWS", "4096"))
+# Snapshots whose float32 form fits in this many MB are widened once when a
+# process opens them; widening dominates the cost of scoring float16 blocks.
+VECTOR_SNAPSHOT_WIDEN_MAX_MB = float(os.getenv("VECTOR_SNAPSHOT_WIDEN_MAX_MB", "64"))
+
+_FORMAT_VERSION = 1
+
+
+def snapshots_enabled() -> bool:
+    return bool(VECTOR_SNAPSHOT_DIR)
+
+
+def _model_dir(dataset_id: int, model: str, root: str | None = None) -> Path:
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "__", model)
+    return Path(root or VECTOR_SNAPSHOT_DIR) / "nodes" / str(int(dataset_id)) / slug
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Per row of `scores` (m, n): column indexes and scores of the k largest, best first."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    top = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-top, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+@dataclass
+class NodeVectorSnapshot:
+    dataset_id: int
+    model: str
+    version: int
+    ids: np.ndarray  # int64, ascending
+    vecs: np.ndarray  # float16 (n, dim), L2-normalized
+    path: Path
+    widened: np.ndarray | None = None  # float32 copy of `vecs`, for small snapshots
+
+    @classmethod
+    def open(cls, path: Path, widen_max_mb: float | None = None) -> "NodeVectorSnapshot":
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("format_version") != _FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot format {meta.get('format_version')!r} (expected {_FORMAT_VERSION})")
+        vecs = np.load(path / "vecs.npy", mmap_mode="r")
+        limit = VECTOR_SNAPSHOT_WIDEN_MAX_MB if widen_max_mb is None else widen_max_mb
+        widened = np.asarray(vecs, dtype=np.float32) if vecs.size * 4 <= limit * 1024 * 1024 else None
+        return cls(
+            dataset_id=int(meta["dataset_id"]),
+            model=str(meta["model"]),
+            version=int(meta["version"]),
+            ids=np.load(path / "ids.npy", mmap_mode="r"),
+            vecs=vecs,
+            path=path,
+            widened=widened,
+        )
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    def search(
+        self, queries: np.ndarray, k: int, block_rows: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k cosine neighbours of each query row: (ids (m, k), scores (m, k)),
+        best first; k is capped at the snapshot size. Scores come from float16
+        vectors, so they are accurate to about 1e-3.
+        """
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        k = max(1, min(int(k), len(self)))
+        if self.widened is not None:
+            idx, top = _top_k_rows(q @ self.widened.T, k)
+            return np.asarray(self.ids)[idx], top
+        block = max(k, int(block_rows or VECTOR_SNAPSHOT_BLOCK_ROWS))
+        buf = np.empty((min(block, len(self)), self.vecs.shape[1]), dtype=np.float32)
+        best_idx = np.empty((q.shape[0], 0), dtype=np.int64)
+        best = np.empty((q.shape[0], 0), dtype=np.float32)
+        for start in range(0, len(self), block):
+            rows = self.vecs[start : start + block]
+            np.copyto(buf[: len(rows)], rows)
+            scores = q @ buf[: len(rows)].T
+            idx, top = _top_k_rows(scores, k)
+            merged = np.concatenate([best, top], axis=1)
+            merged_idx = np.concatenate([best_idx, idx + start], axis=1)
+            keep, best = _top_k_rows(merged, k)
+            best_idx = np.take_along_axis(merged_idx, keep, axis=1)
+        return np.asarray(self.ids)[best_idx], best
+
+    def vectors_of(self, node_ids) -> dict[int, np.ndarray]:
+        """Snapshot vectors of the given nodes that it holds."""
+        wanted = np.asarray(list(node_ids), dtype=np.int64)
+        pos = np.searchsorted(self.ids, wanted)
+        pos = np.minimum(pos, max(len(self) - 1, 0))
+        found = (len(self) > 0) & (np.asarray(self.ids)[pos] == wanted)
+        source = self.widened if self.widened is not None else self.vecs
+        return {
+            int(node_id): np.asarray(source[p], dtype=np.float32)
+            for node_id, p, ok in zip(wanted, pos, found)
+            if ok
+        }
+
+    def neighbours(self, node_ids, k: int) -> dict[int, list[tuple[int, float]]]:
+        """Top-k neighbours (excluding the node itself) of every node in the snapshot."""
+        vectors = self.vectors_of(node_ids)
+        if not vectors:
+            return {}
+        keys = list(vectors)
+        ids, scores = self.search(np.stack([vectors[i] for i in keys]), k + 1)
+        out: dict[int, list[tuple[int, float]]] = {}
+        for node_id, row_ids, row_scores in zip(keys, ids, scores):
+            hits = [(int(i), float(s)) for i, s in zip(row_ids, row_scores) if int(i) != node_id]
+            out[node_id] = hits[:k]
+        return out
+
+
+def build_node_snapshot(
+    db: Session, dataset_id: int, model: str, root: str | None = None, min_rows: int | None = None
+) -> Path | None:
+    """
+    Exports the dataset's `model` node vectors as a snapshot (no-op when the
+    current version already exists) and removes older versions. Returns the
+    snapshot directory, or None when disabled or below `min_rows`.
+    """
+    root = root or VECTOR_SNAPSHOT_DIR
+    if not root:
+        return None
+    # Read first: changes committed during the export bump the version past it.
+    version = db.execute(
+        text("SELECT vectors_version FROM datasets WHERE id = :ds"), {"ds": dataset_id}
+    ).scalar()
+    if version is None:
+        return None
+    model_dir = _model_dir(dataset_id, model, root)
+    target = model_dir / f"v{int(version)}"
+    if (target / "meta.json").exists():
+        return target
+    n = int(
+        db.execute(
+            text(
+                "SELECT count(*) FROM knowledge_nodes "
+                "WHERE dataset_id = :ds AND embedding_model = :m AND vec IS NOT NULL"
+            ),
+            {"ds": dataset_id, "m": model},
+        ).scalar()
+        or 0
+    )
+    threshold = VECTOR_SNAPSHOT_MIN_ROWS if min_rows is None else int(min_rows)
+    if n == 0 or n < threshold:
+        return None
+
+    started = time.perf_counter()
+    tmp = model_dir / f".v{int(version)}.tmp-{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        ids = np.empty(n, dtype=np.int64)
+        vecs = None
+        count = 0
+        # Binary COPY blocks straight into the memmap; rows added since the
+        # count are left out (they bumped the version past this snapshot anyway).
+        for block_ids, block in iter_node_vector_blocks(db, dataset_id, model):
+            take = min(len(block_ids), n - count)
+            if vecs is None:
+                vecs = np.lib.format.open_memmap(
+                    tmp / "vecs.npy", mode="w+", dtype=np.float16, shape=(n, block.shape[1])
+                )
+            ids[count : count + take] = block_ids[:take]
+            vecs[count : count + take] = block[:take]
+            count += take
+            if count >= n:
+                break
+        if vecs is None:
+            return None
+        vecs.flush()
+        del vecs
+        if count < n:
+            # Rows deleted since the count: shrink to what was read.
+            full = np.load(tmp / "vecs.npy", mmap_mode="r")
+            np.save(tmp / "vecs.part.npy", np.asarray(full[:count]))
+            del full
+            os.replace(tmp / "vecs.part.npy", tmp / "vecs.npy")
+        np.save(tmp / "ids.npy", ids[:count])
+        meta = {
+            "format_version": _FORMAT_VERSION,
+            "dataset_id": int(dataset_id),
+            "model": model,
+            "version": int(version),
+            "rows": count,
+            "created_at": time.time(),
+        }
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            if not (target / "meta.json").exists():
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    # Processes still mapping an older version keep reading it until they re-check.
+    for old in model_dir.glob("v*"):
+        if old != target and old.is_dir():
+            shutil.rmtree(old, ignore_errors=True)
+    logger.info(
+        "node vector snapshot of dataset %d (%s): %d rows, version %d in %.2fs",
+        dataset_id, model, count, version, time.perf_counter() - started,
+    )
+    return target
+
+
+@dataclass
+class _Entry:
+    snapshot: NodeVectorSnapshot | None
+    checked_at: float
+    current_version: int | None
+
+
+_open: dict[tuple[int, str], _Entry] = {}
+_open_lock = threading.Lock()
+
+
+def get_node_snapshot(db: Session, dataset_id: int, model: str) -> NodeVectorSnapshot | None:
+    """
+    The current snapshot of the dataset's `model` vectors, or None (disabled,
+    missing, or stale: the dataset changed since it was exported). The
+    dataset's version is re-read at most every VECTOR_SNAPSHOT_CHECK_S seconds.
+    """
+    if not VECTOR_SNAPSHOT_DIR:
+        return None
+    key = (int(dataset_id), model)
+    now = time.monotonic()
+    with _open_lock:
+        entry = _open.get(key)
+    if entry is not None and now - entry.checked_at < VECTOR_SNAPSHOT_CHECK_S:
+        snap = entry.snapshot
+        return snap if snap is not None and snap.version == entry.current_version else None
+
+    version = db.execute(
+        text("SELECT vectors_version FROM datasets WHERE id = :ds"), {"ds": dataset_id}
+    ).scalar()
+    snap = entry.snapshot if entry is not None else None
+    if version is not None and (snap is None or snap.version != int(version)):
+        path = _model_dir(dataset_id, model) / f"v{int(version)}"
+        if (path / "meta.json").exists():
+            try:
+                snap = NodeVectorSnapshot.open(path)
+            except (OSError, ValueError, KeyError) as exc:
+                logger.warning("could not open vector snapshot %s: %s", path, exc)
+                snap = None
+    with _open_lock:
+        _open[key] = _Entry(snap, now, int(version) if version is not None else None)
+    if snap is None or version is None or snap.version != int(version):
+        return None
+    return snap
+
+
+def drop_node_snapshots(dataset_id: int, root: str | None = None) -> bool:
+    """Removes every snapshot of the dataset (e.g. once it is deleted); True if there were any."""
+    with _open_lock:
+        for key in [k for k in _open if k[0] == int(dataset_id)]:
+            del _open[key]
+    root = root or VECTOR_SNAPSHOT_DIR
+    if not root:
+        return False
+    dataset_dir = Path(root) / "nodes" / str(int(dataset_id))
+    if not dataset_dir.exists():
+        return False
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    return True
+
+
+def snapshot_info(snap: NodeVectorSnapshot) -> dict:
+    return {"version": snap.version, "rows": len(snap), "path": str(snap.path)}
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import logging
+import os
+from typing import Sequence
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Rows per COPY + merge round; each round is committed when commit=True.
+VECTOR_WRITE_BATCH = int(os.getenv("VECTOR_WRITE_BATCH", "2000"))
+
+
+class _StagedVectorWriter:
+    """
+    Buffers (id, vector) rows and writes them in bounded batches: binary COPY into
+    a session-local temp table, then one set-based merge statement per batch.
+    With commit=True every batch is committed, so a failure only loses the batch
+    in flight; with commit=False the caller owns the transaction.
+    """
+
+    stage_table = ""
+    stage_ddl = ""
+
+    def __init__(self, db: Session, *, batch_size: int | None = None, commit: bool = True):
+        self._db = db
+        self._batch_size = max(1, int(batch_size or VECTOR_WRITE_BATCH))
+        self._commit = commit
+        self._ids: list[int] = []
+        self._vecs: list[np.ndarray] = []
+        self._pending = 0
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, ids: Sequence[int], vecs: np.ndarray) -> None:
+        vecs = np.asarray(vecs, dtype=np.float32)
+        start = 0
+        # Split the input so no batch grows past batch_size.
+        while start < len(ids):
+            end = start + min(len(ids) - start, self._batch_size - self._pending)
+            self._ids.extend(int(i) for i in ids[start:end])
+            self._vecs.append(vecs[start:end])
+            self._pending += end - start
+            start = end
+            if self._pending >= self._batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        if not self._ids:
+            return
+        ids = self._ids
+        vecs = np.concatenate(self._vecs) if len(self._vecs) > 1 else self._vecs[0]
+        self._ids, self._vecs, self._pending = [], [], 0
+        self._stage(ids, vecs)
+        self._merge()
+        if self._commit:
+            self._db.commit()
+        self.written += len(ids)
+
+    def _stage(self, ids: list[int], vecs: np.ndarray) -> None:
+        raw = self._db.connection().connection.driver_connection
+        with raw.cursor() as cur:
+            cur.execute(self.stage_ddl)
+            cur.execute(f"TRUNCATE {self.stage_table}")
+            with cur.copy(f"COPY {self.stage_table} (id, vec) FROM STDIN WITH (FORMAT BINARY)") as copy:
+                copy.set_types(["int4", "vector"])
+                for row_id, vec in zip(ids, vecs):
+                    copy.write_row((row_id, vec))
+
+    def _merge(self) -> None:
+        raise NotImplementedError
+
+
+class ChunkEmbeddingWriter(_StagedVectorWriter):
+    """Upserts `embeddings` rows keyed by chunk_id."""
+
+    stage_table = "_stage_chunk_vecs"
+    stage_ddl = (
+        "CREATE TEMP TABLE IF NOT EXISTS _stage_chunk_vecs "
+        "(id int PRIMARY KEY, vec vector) ON COMMIT DELETE ROWS"
+    )
+
+    def __init__(self, db: Session, model: str, **kwargs):
+        super().__init__(db, **kwargs)
+        self._model = model
+
+    def _merge(self) -> None:
+        self._db.execute(
+            text(
+                """
+                INSERT INTO embeddings (chunk_id, dataset_id, dim, model, vec)
+                SELECT s.id, d.dataset_id, vector_dims(s.vec), :model, s.vec
+                FROM _stage_chunk_vecs s
+                JOIN chunks c ON c.id = s.id
+                JOIN documents d ON d.id = c.document_id
+                ON CONFLICT (chunk_id)
+                DO UPDATE SET dataset_id = EXCLUDED.dataset_id,
+                              dim = EXCLUDED.dim,
+                              model = EXCLUDED.model,
+                              vec = EXCLUDED.vec
+                """
+            ),
+            {"model": self._model},
+        )
+
+
+class NodeVectorWriter(_StagedVectorWriter):
+    """Sets `knowledge_nodes.vec` (and embedding_model/dim) for existing nodes."""
+
+    stage_table = "_stage_node_vecs"
+    stage_ddl = (
+        "CREATE TEMP TABLE IF NOT EXISTS _stage_node_vecs "
+        "(id int PRIMARY KEY, vec vector) ON COMMIT DELETE ROWS"
+    )
+
+    def __init__(self, db: Session, model: str, **kwargs):
+        super().__init__(db, **kwargs)
+        self._model = model
+
+    def _merge(self) -> None:
+        self._db.execute(
+            text(
+                """
+                UPDATE knowledge_nodes kn
+                SET vec = s.vec, embedding_model = :model, embedding_dim = vector_dims(s.vec)
+                FROM _stage_node_vecs s
+                WHERE kn.id = s.id
+                """
+            ),
+            {"model": self._model},
+        )
+
+
+def _as_array(value) -> np.ndarray:
+    # pgvector's psycopg loader returns `Vector` objects (older releases: ndarrays).
+    if hasattr(value, "to_numpy"):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+def migrate_legacy_vectors(
+    db: Session, legacy_model: str, model: str, dim: int, *, batch_size: int | None = None
+) -> dict[str, int]:
+    """
+    Rewrites rows stored under `legacy_model` (vectors zero-padded to 1536) as
+    native `dim`-wide vectors of `model`: the padding is cut off and the rows are
+    re-normalized, so no texts need to be re-embedded. Runs in committed batches
+    and can be resumed after an interruption.
+    """
+    size = max(1, int(batch_size or VECTOR_WRITE_BATCH))
+    sources = (
+        ("embeddings", "SELECT id, chunk_id, vec FROM embeddings", "model", ChunkEmbeddingWriter),
+        ("knowledge_nodes", "SELECT id, id, vec FROM knowledge_nodes", "embedding_model", NodeVectorWriter),
+    )
+    moved: dict[str, int] = {}
+    for table, select_sql, model_col, writer_cls in sources:
+        after = 0
+        with writer_cls(db, model, batch_size=size) as writer:
+            while True:
+                rows = db.execute(
+                    text(
+                        f"{select_sql} WHERE {model_col} = :legacy AND vec IS NOT NULL "
+                        "AND id > :after ORDER BY id LIMIT :n"
+                    ),
+                    {"legacy": legacy_model, "after": after, "n": size},
+                ).all()
+                if not rows:
+                    break
+                after = int(rows[-1][0])
+                vecs = np.stack([_as_array(r[2])[:dim] for r in rows])
+                norms = np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+                writer.add([int(r[1]) for r in rows], vecs / norms)
+                writer.flush()
+        moved[table] = writer.written
+        logger.info("migrated %d %s rows from %s to %s", writer.written, table, legacy_model, model)
+    return moved
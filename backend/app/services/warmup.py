@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable
+
+from .embedding_provider import OpenAIProvider, get_embedding_provider, loaded_embedding_provider
+from .node_extractor import LLMNodeExtractor, get_node_extractor
+
+logger = logging.getLogger(__name__)
+
+# Load models when the API (lifespan) or a Celery worker process starts instead
+# of on the first request/task. WARMUP_ON_STARTUP=0 restores lazy loading.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1").strip().lower() in ("1", "true", "yes", "on")
+
+_DUMMY_TEXTS = [
+    "Фотосинтез — процесс преобразования солнечного света в химическую энергию.",
+    "Warm-up batch.",
+]
+
+_state: dict[str, Any] = {
+    "status": "pending",  # pending | running | ready | failed | disabled
+    "component": None,
+    "started_at": None,
+    "finished_at": None,
+    "seconds": None,
+    "steps": {},
+}
+_state_lock = threading.Lock()
+_thread: threading.Thread | None = None
+
+
+def _warm_embeddings() -> dict[str, Any]:
+    provider = get_embedding_provider()
+    info: dict[str, Any] = {"model": provider.embedding_model, "dim": provider.dim}
+    if isinstance(provider, OpenAIProvider):
+        info["dummy_batch"] = False  # remote API: nothing to load, a call would only cost tokens
+        return info
+    vecs = provider.embed(_DUMMY_TEXTS)
+    info["dummy_batch"] = int(vecs.shape[0])
+    return info
+
+
+def _warm_node_extractor() -> dict[str, Any]:
+    extractor = get_node_extractor()
+    info: dict[str, Any] = {"extractor": type(extractor).__name__}
+    if isinstance(extractor, LLMNodeExtractor):
+        info["dummy_batch"] = False
+        return info
+    info["dummy_batch"] = len(extractor.extract(" ".join(_DUMMY_TEXTS), max_nodes=5, min_freq=1))
+    return info
+
+
+_STEPS: list[tuple[str, Callable[[], dict[str, Any]]]] = [
+    ("embedding", _warm_embeddings),
+    ("node_extractor", _warm_node_extractor),
+]
+
+
+def run_warmup(component: str = "api") -> dict[str, Any]:
+    """
+    Loads the embedding model and node extractor and pushes a dummy batch through
+    each (so lazy kernels/weights are initialised too), timing every step. A
+    failing step is recorded and logged but never raised: the process then
+    serves, loading lazily as before.
+    """
+    started = time.perf_counter()
+    with _state_lock:
+        _state.update(status="running", component=component, started_at=time.time(), finished_at=None, steps={})
+    failed = False
+    for name, step in _STEPS:
+        t0 = time.perf_counter()
+        try:
+            result = {"ok": True, **step()}
+        except Exception as exc:
+            failed = True
+            result = {"ok": False, "error": str(exc)[:500]}
+            logger.warning("warm-up step %s failed in %s: %s", name, component, exc)
+        result["seconds"] = round(time.perf_counter() - t0, 3)
+        with _state_lock:
+            _state["steps"][name] = result
+    seconds = round(time.perf_counter() - started, 3)
+    with _state_lock:
+        _state.update(status="failed" if failed else "ready", finished_at=time.time(), seconds=seconds)
+    logger.info(
+        "%s warm-up %s in %.2fs: %s",
+        component,
+        "failed" if failed else "done",
+        seconds,
+        ", ".join(f"{k}={v['seconds']:.2f}s" for k, v in _state["steps"].items()),
+    )
+    return warmup_status()
+
+
+def start_background_warmup(component: str = "api") -> threading.Thread | None:
+    """Runs `run_warmup` in a daemon thread so startup (and /health) never waits on it."""
+    global _thread
+    if not WARMUP_ON_STARTUP:
+        with _state_lock:
+            _state.update(status="disabled", component=component)
+        return None
+    with _state_lock:
+        if _thread is not None and _thread.is_alive():
+            return _thread
+        _state.update(status="running", component=component)
+        _thread = threading.Thread(target=run_warmup, args=(component,), name="model-warmup", daemon=True)
+    _thread.start()
+    return _thread
+
+
+def warmup_status() -> dict[str, Any]:
+    with _state_lock:
+        return {**_state, "steps": {k: dict(v) for k, v in _state["steps"].items()}}
+
+
+def is_ready() -> bool:
+    """
+    True once warm-up has finished (a failed step still counts: requests then
+    load lazily) or when it is disabled.
+    """
+    with _state_lock:
+        return _state["status"] in ("ready", "failed", "disabled")
+
+
+def loaded_embedding_model() -> str | None:
+    provider = loaded_embedding_provider()
+    return provider.embedding_model if provider is not None else None
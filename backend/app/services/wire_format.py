@@ -0,0 +1,200 @@
+"""
+Response encodings of the large read endpoints (GET /graph, GET /nodes).
+
+JSON stays the default (orjson when installed). A client that sends
+`Accept: application/msgpack` or `Accept: application/vnd.apache.arrow.stream`
+gets the same response columnar instead: every list of objects becomes one
+array per field, so keys are not repeated per row. Columnar bodies leave the
+long text fields out unless asked for (`include_text=true`); clients load
+them lazily per node from GET /nodes/{id}.
+
+msgpack:  the response object with each list field as {field: [values]}.
+Arrow:    an IPC stream of one row; scalar fields are columns, each list
+          field a list<struct> column (e.g. `table["nodes"][0].values`).
+
+Encodings whose library is missing fall back to JSON (Accept is a preference).
+Bodies from GZIP_MIN_BYTES up are gzipped for clients that accept it; only
+here, not app-wide, since a gzip middleware would hold back streamed (SSE)
+responses until they end.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import typing
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+try:
+    import orjson  # type: ignore
+    _HAS_ORJSON = True
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+    _HAS_ORJSON = False
+
+try:
+    import msgpack  # type: ignore
+    _HAS_MSGPACK = True
+except Exception:  # pragma: no cover
+    msgpack = None  # type: ignore
+    _HAS_MSGPACK = False
+
+try:
+    import pyarrow as pa  # type: ignore
+    _HAS_ARROW = True
+except Exception:  # pragma: no cover
+    pa = None  # type: ignore
+    _HAS_ARROW = False
+
+# 0 disables; level 6 instead of 9: nearly the same size for far less CPU.
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "4096"))
+GZIP_LEVEL = 6
+
+JSON, MSGPACK, ARROW = "json", "msgpack", "arrow"
+MEDIA_TYPES = {
+    JSON: "application/json",
+    MSGPACK: "application/msgpack",
+    ARROW: "application/vnd.apache.arrow.stream",
+}
+_ACCEPTED = {
+    "application/json": JSON,
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.apache.arrow.stream": ARROW,
+}
+# Left out of columnar bodies unless include_text is set.
+TEXT_FIELDS = frozenset({"context_text", "rationale", "model_info"})
+
+
+def available(fmt: str) -> bool:
+    return fmt == JSON or (fmt == MSGPACK and _HAS_MSGPACK) or (fmt == ARROW and _HAS_ARROW)
+
+
+def _q_value(options: list[str]) -> float:
+    """q of one Accept(-Encoding) entry: 1 when absent, 0 when malformed."""
+    for option in options:
+        name, _, value = option.partition("=")
+        if name.strip() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def negotiate(accept: str | None) -> str:
+    """The encoding for an Accept header: the client's most preferred one this server can produce."""
+    ranked: list[tuple[float, int, str]] = []
+    for i, part in enumerate((accept or "").split(",")):
+        media, *options = (p.strip() for p in part.split(";"))
+        fmt = _ACCEPTED.get(media.lower())
+        if fmt is None or not available(fmt):
+            continue
+        q = _q_value(options)
+        if q > 0:
+            ranked.append((-q, i, fmt))
+    return min(ranked)[2] if ranked else JSON
+
+
+def gzip_enabled() -> bool:
+    return GZIP_MIN_BYTES > 0
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """Whether an Accept-Encoding header allows gzip (by name or via *, q > 0)."""
+    q_by_coding: dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        coding, *options = (p.strip() for p in part.split(";"))
+        if coding:
+            q_by_coding[coding.lower()] = _q_value(options)
+    return q_by_coding.get("gzip", q_by_coding.get("*", 0.0)) > 0
+
+
+def maybe_gzip(body: bytes, accept_encoding: str | None) -> tuple[bytes, bool]:
+    """(gzipped `body`, True) if large enough and accepted, else (body, False)."""
+    if not gzip_enabled() or len(body) < GZIP_MIN_BYTES:
+        return body, False
+    if not accepts_gzip(accept_encoding):
+        return body, False
+    return gzip.compress(body, compresslevel=GZIP_LEVEL), True
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return jsonable_encoder(value)
+
+
+def dumps_json(value: Any) -> bytes:
+    if isinstance(value, BaseModel):
+        return value.model_dump_json().encode("utf-8")
+    if _HAS_ORJSON:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(jsonable_encoder(value), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _row_fields(model: type[BaseModel], name: str) -> list[str] | None:
+    """Field names of the rows of list field `name` (List[SomeModel]), else None."""
+    annotation = model.model_fields[name].annotation
+    if typing.get_origin(annotation) is not list:
+        return None
+    (row,) = typing.get_args(annotation) or (None,)
+    if isinstance(row, type) and issubclass(row, BaseModel):
+        return list(row.model_fields)
+    return None
+
+
+def columnar(value: BaseModel, *, include_text: bool = False) -> dict[str, Any]:
+    """`value` as plain data with each list of models turned into {field: [values]}."""
+    data = value.model_dump(mode="json")
+    out: dict[str, Any] = {}
+    for name, field_value in data.items():
+        fields = _row_fields(type(value), name)
+        if fields is None:
+            out[name] = field_value
+            continue
+        if not include_text:
+            fields = [f for f in fields if f not in TEXT_FIELDS]
+        out[name] = {f: [row[f] for row in field_value] for f in fields}
+    return out
+
+
+def _arrow_array(values: list) -> "pa.Array":
+    if any(isinstance(v, dict) for v in values):
+        # Free-form objects (model_info) travel as JSON text.
+        values = [None if v is None else json.dumps(v, ensure_ascii=False) for v in values]
+    return pa.array(values)
+
+
+def _arrow_stream(data: dict[str, Any]) -> bytes:
+    names, arrays = [], []
+    for name, field_value in data.items():
+        if isinstance(field_value, dict):
+            columns = {f: _arrow_array(v) for f, v in field_value.items()}
+            rows = pa.StructArray.from_arrays(list(columns.values()), names=list(columns))
+            arrays.append(pa.ListArray.from_arrays(pa.array([0, len(rows)], pa.int32()), rows))
+        else:
+            arrays.append(pa.array([field_value]))
+        names.append(name)
+    table = pa.Table.from_arrays(arrays, names=names)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(value: Any, fmt: str, *, include_text: bool = False) -> bytes:
+    """Body bytes of `value` in encoding `fmt` (columnar ones need a model)."""
+    if fmt == JSON:
+        return dumps_json(value)
+    if not isinstance(value, BaseModel):
+        raise TypeError(f"{fmt} bodies are encoded from response models")
+    data = columnar(value, include_text=include_text)
+    if fmt == MSGPACK:
+        return msgpack.packb(data, use_bin_type=True)
+    if fmt == ARROW:
+        return _arrow_stream(data)
+    raise ValueError(f"unknown response encoding: {fmt}")
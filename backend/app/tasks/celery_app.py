@@ -1,7 +1,19 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 celery_app = Celery("rag_bloom", broker=REDIS_URL, backend=REDIS_URL)
+# Children warm up models in worker_process_init; the 4s default would kill a
+# child still loading a large embedding model.
+celery_app.conf.worker_proc_alive_timeout = float(os.getenv("CELERY_WORKER_INIT_TIMEOUT", "300"))
 
 # Ensure tasks are registered in the worker process.
 celery_app.autodiscover_tasks(["app.tasks"])
+
+
+@worker_process_init.connect
+def _warm_up_worker_process(**_kwargs):
+    # Runs in every prefork child, so the first task does not pay for model loading.
+    from ..services.warmup import WARMUP_ON_STARTUP, run_warmup
+    if WARMUP_ON_STARTUP:
+        run_warmup("worker")
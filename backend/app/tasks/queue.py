@@ -1,53 +1,77 @@
 import logging
 import os
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from .celery_app import celery_app
-from .tasks import index_dataset, annotate_dataset, rebuild_graph_edges, parse_document, reindex_dataset_nodes
+from .tasks import (
+    annotate_dataset,
+    build_dataset_vector_indexes,
+    cluster_graph,
+    index_dataset,
+    maintain_graph_edges,
+    parse_document,
+    rebuild_graph_edges,
+    reindex_dataset_nodes,
+)
 from ..models.models import Job, JobStatus, JobType
 
 logger = logging.getLogger(__name__)
 
 ENABLE_CELERY = os.getenv("ENABLE_CELERY", "1") not in ("0", "false", "False")
+# Lets a burst of writes queue up before one maintain_graph_edges run drains them.
+GRAPH_MAINTENANCE_DELAY_S = float(os.getenv("GRAPH_MAINTENANCE_DELAY_S", "2"))
 
 
 def _run_sync(db: Session, job: Job):
     """Run a job synchronously (used when ENABLE_CELERY=0)."""
     db.execute(text("UPDATE jobs SET status='running' WHERE id=:id"), {"id": job.id})
+    # Reading the job again after a commit reopens a transaction; copy what the
+    # task needs first, or CREATE INDEX CONCURRENTLY in it waits on this session.
+    job_id, job_type, payload = job.id, job.type, dict(job.payload or {})
     db.commit()
     try:
-        if job.type == JobType.index:
-            index_dataset(job.payload["dataset_id"], job.id)
-        elif job.type == JobType.annotate:
-            annotate_dataset(job.payload["dataset_id"], job.payload["level"], job.id)
-        elif job.type == JobType.parse:
+        if job_type == JobType.index:
+            if payload.get("action") == "vector_indexes":
+                build_dataset_vector_indexes(payload["dataset_id"], job_id, payload.get("min_rows"))
+            else:
+                index_dataset(payload["dataset_id"], job_id)
+        elif job_type == JobType.annotate:
+            annotate_dataset(payload["dataset_id"], payload["level"], job_id)
+        elif job_type == JobType.parse:
             parse_document(
-                job.payload["document_id"],
-                job.payload["file_path"],
-                job.payload["filename"],
-                job.payload["content_type"],
-                job.id,
+                payload["document_id"],
+                payload["file_path"],
+                payload["filename"],
+                payload["content_type"],
+                job_id,
             )
-        elif job.type == JobType.graph:
-            if job.payload.get("action") == "reindex":
-                reindex_dataset_nodes(job.payload["dataset_id"], job.id)
+        elif job_type == JobType.graph:
+            if payload.get("action") == "reindex":
+                reindex_dataset_nodes(payload["dataset_id"], job_id)
+            elif payload.get("action") == "cluster":
+                cluster_graph(
+                    payload["dataset_id"],
+                    job_id,
+                    payload.get("include_cooccurrence", True),
+                    payload.get("max_iterations", 20),
+                )
             else:
                 rebuild_graph_edges(
-                    job.payload["dataset_id"],
-                    job.id,
-                    job.payload.get("embedding_model"),
-                    job.payload.get("top_k", 5),
-                    job.payload.get("min_score", 0.2),
-                    job.payload.get("max_edges", 200),
-                    job.payload.get("include_cooccurrence", True),
-                    job.payload.get("limit_nodes", 2000),
-                    job.payload.get("co_window", 2),
+                    payload["dataset_id"],
+                    job_id,
+                    payload.get("embedding_model"),
+                    payload.get("top_k", 5),
+                    payload.get("min_score", 0.2),
+                    payload.get("max_edges", 200),
+                    payload.get("include_cooccurrence", True),
+                    payload.get("limit_nodes", 2000),
+                    payload.get("co_window", 2),
                 )
         else:
-            db.execute(text("UPDATE jobs SET status='done', finished_at=now() WHERE id=:id"), {"id": job.id})
+            db.execute(text("UPDATE jobs SET status='done', finished_at=now() WHERE id=:id"), {"id": job_id})
             db.commit()
     except Exception as e:
-        logger.exception("Sync job %d (%s) failed: %s", job.id, job.type, e)
+        logger.exception("Sync job %d (%s) failed: %s", job_id, job_type, e)
         raise
 
 
@@ -62,7 +86,12 @@ def enqueue_or_mark(db: Session, job: Job):
 
     try:
         if job.type == JobType.index:
-            async_result = index_dataset.delay(job.payload["dataset_id"], job.id)
+            if job.payload.get("action") == "vector_indexes":
+                async_result = build_dataset_vector_indexes.delay(
+                    job.payload["dataset_id"], job.id, job.payload.get("min_rows")
+                )
+            else:
+                async_result = index_dataset.delay(job.payload["dataset_id"], job.id)
             db.execute(
                 text("UPDATE jobs SET status=:st, task_id=:tid WHERE id=:id"),
                 dict(st=JobStatus.queued.value, tid=async_result.id, id=job.id),
@@ -98,6 +127,13 @@ def enqueue_or_mark(db: Session, job: Job):
         elif job.type == JobType.graph:
             if job.payload.get("action") == "reindex":
                 async_result = reindex_dataset_nodes.delay(job.payload["dataset_id"], job.id)
+            elif job.payload.get("action") == "cluster":
+                async_result = cluster_graph.delay(
+                    job.payload["dataset_id"],
+                    job.id,
+                    job.payload.get("include_cooccurrence", True),
+                    job.payload.get("max_iterations", 20),
+                )
             else:
                 async_result = rebuild_graph_edges.delay(
                     job.payload["dataset_id"],
@@ -122,3 +158,32 @@ def enqueue_or_mark(db: Session, job: Job):
         )
         db.commit()
         raise
+
+
+def schedule_graph_maintenance(db: Session, dataset_ids) -> None:
+    """
+    After a committed node write: updates the persisted graph edges of the
+    changed nodes (in the background with Celery; inline without, draining
+    only these datasets' queues). Only datasets with a persisted graph queue
+    nodes; best effort — what is not processed now stays queued for the next run.
+    """
+    ids = [int(dataset_ids)] if isinstance(dataset_ids, int) else sorted({int(i) for i in dataset_ids if i is not None})
+    if not ids:
+        return
+    try:
+        with_graph = db.execute(
+            text("SELECT id FROM datasets WHERE id IN :ids AND graph_params IS NOT NULL ORDER BY id").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": ids},
+        ).scalars().all()
+        if not with_graph:
+            return
+        if not ENABLE_CELERY:
+            # Inline, within the request: only the written datasets' queues.
+            for ds in with_graph:
+                maintain_graph_edges(ds)
+        else:
+            maintain_graph_edges.apply_async(countdown=GRAPH_MAINTENANCE_DELAY_S)
+    except Exception as e:
+        logger.warning("Graph edge maintenance for datasets %s not scheduled: %s", ids, e)
@@ -0,0 +1,135 @@
+"""
+Sharded embedding for index/reindex jobs.
+
+The id space of a dataset's chunks / nodes is split into contiguous id ranges
+of about INDEX_SHARD_ROWS rows. Each shard embeds and writes its range on its
+own (the writers upsert, so a retried shard just overwrites its rows) and
+reports progress under `jobs.payload["shards"][<key>]`.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+from dataclasses import asdict, dataclass
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..services.embedding import iter_embed_texts
+from ..services.result_cache import bump_generation
+from ..services.vector_store import ChunkEmbeddingWriter, NodeVectorWriter
+
+logger = logging.getLogger(__name__)
+
+# Target rows per shard; datasets at or below it are embedded in one pass.
+INDEX_SHARD_ROWS = int(os.getenv("INDEX_SHARD_ROWS", "5000"))
+# Upper bound on shards per kind (larger datasets get larger shards).
+INDEX_MAX_SHARDS = int(os.getenv("INDEX_MAX_SHARDS", "64"))
+
+_IDS_SQL = {
+    "chunks": (
+        "SELECT c.id FROM chunks c JOIN documents d ON d.id = c.document_id WHERE d.dataset_id = :ds"
+    ),
+    "nodes": "SELECT id FROM knowledge_nodes WHERE dataset_id = :ds",
+}
+_ROWS_SQL = {
+    "chunks": (
+        "SELECT c.id, c.text FROM chunks c JOIN documents d ON d.id = c.document_id "
+        "WHERE d.dataset_id = :ds AND c.id BETWEEN :lo AND :hi ORDER BY c.id"
+    ),
+    "nodes": (
+        "SELECT id, title || '. ' || context_text AS text FROM knowledge_nodes "
+        "WHERE dataset_id = :ds AND id BETWEEN :lo AND :hi ORDER BY id"
+    ),
+}
+_WRITERS = {"chunks": ChunkEmbeddingWriter, "nodes": NodeVectorWriter}
+
+
+@dataclass(frozen=True)
+class Shard:
+    kind: str  # "chunks" | "nodes"
+    index: int
+    lo: int
+    hi: int
+    rows: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.kind}-{self.index}"
+
+
+def shard_ranges(db: Session, kind: str, dataset_id: int, shard_rows: int | None = None) -> list[Shard]:
+    """Contiguous id ranges of about `shard_rows` rows covering the dataset's `kind` rows."""
+    ids_sql = _IDS_SQL[kind]
+    total = int(db.execute(text(f"SELECT count(*) FROM ({ids_sql}) ids"), {"ds": dataset_id}).scalar() or 0)
+    if total == 0:
+        return []
+    per_shard = max(1, int(shard_rows or INDEX_SHARD_ROWS))
+    n = max(1, min(INDEX_MAX_SHARDS, math.ceil(total / per_shard)))
+    rows = db.execute(
+        text(
+            f"""
+            SELECT min(id) AS lo, max(id) AS hi, count(*) AS n
+            FROM (SELECT id, ntile(:n) OVER (ORDER BY id) AS shard FROM ({ids_sql}) ids) t
+            GROUP BY shard
+            ORDER BY shard
+            """
+        ),
+        {"ds": dataset_id, "n": n},
+    ).all()
+    return [Shard(kind, i, int(r[0]), int(r[1]), int(r[2])) for i, r in enumerate(rows)]
+
+
+def init_shard_progress(db: Session, job_id: int | None, shards: list[Shard]) -> None:
+    if job_id is None:
+        return
+    progress = {s.key: {**asdict(s), "status": "queued", "embedded": 0} for s in shards}
+    db.execute(
+        text("UPDATE jobs SET payload = jsonb_set(payload, '{shards}', CAST(:p AS jsonb)) WHERE id = :id"),
+        {"p": json.dumps(progress), "id": job_id},
+    )
+    db.commit()
+
+
+def report_shard_progress(db: Session, job_id: int | None, shard: Shard, **fields) -> None:
+    """Merges `fields` into the shard's progress entry; one atomic update, so shards never clobber each other."""
+    if job_id is None:
+        return
+    db.execute(
+        text(
+            "UPDATE jobs SET payload = jsonb_set(payload, ARRAY['shards', :key], "
+            "COALESCE(payload->'shards'->:key, '{}'::jsonb) || CAST(:f AS jsonb)) "
+            "WHERE id = :id AND payload ? 'shards'"
+        ),
+        {"key": shard.key, "f": json.dumps(fields), "id": job_id},
+    )
+    db.commit()
+
+
+def embed_shard(db: Session, job_id: int | None, dataset_id: int, shard: Shard, model: str) -> int:
+    """
+    Embeds the rows of one shard with the active provider and writes them under
+    `model`. Progress is committed after every embedded batch; the dataset's
+    generation is bumped with the final one.
+    """
+    rows = db.execute(
+        text(_ROWS_SQL[shard.kind]), {"ds": dataset_id, "lo": shard.lo, "hi": shard.hi}
+    ).all()
+    ids = [int(r[0]) for r in rows]
+    texts = [r[1] or "" for r in rows]
+    if shard.kind == "nodes":
+        texts = [t.strip() for t in texts]
+    report_shard_progress(db, job_id, shard, status="running", rows=len(ids))
+    embedded = 0
+    with _WRITERS[shard.kind](db, model) as writer:
+        for positions, vecs in iter_embed_texts(texts):
+            writer.add([ids[pos] for pos in positions], vecs)
+            embedded += len(positions)
+            report_shard_progress(db, job_id, shard, embedded=embedded)
+    bump_generation(db, dataset_id)
+    db.commit()
+    report_shard_progress(db, job_id, shard, status="done", embedded=embedded, written=writer.written)
+    logger.info("embedded shard %s (%d..%d): %d rows", shard.key, shard.lo, shard.hi, embedded)
+    return embedded
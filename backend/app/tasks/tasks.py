@@ -1,23 +1,42 @@
+import json
 import logging
 import os
 
+from celery import chord, group
+
 from .celery_app import celery_app
+from .shards import Shard, embed_shard, init_shard_progress, report_shard_progress, shard_ranges
 from ..services.chunking import split_into_chunks
 from ..db.session import SessionLocal
 from ..models.models import Chunk, Document, KnowledgeNode
-from ..services.embedding import embed_texts
 from ..services.text_extract import extract_text as _extract_text
-from ..services.embedding_provider import current_embedding_model
+from ..services.embedding_provider import current_embedding_model, get_embedding_provider
+from ..services.result_cache import bump_generation
+from ..services.graph_cluster import cluster_dataset
+from ..services.graph_layout import GRAPH_LAYOUT_ENABLED, layout_dataset, update_layout
+from ..services.graph_build import (
+    cooccurrence_pairs,
+    graph_engine,
+    graph_params,
+    numpy_similarity_edges,
+    refresh_node_edges,
+    similarity_edges,
+    write_edges,
+)
+from ..services.vector_index import ensure_dataset_indexes, ensure_vector_indexes
+from ..services.vector_snapshot import build_node_snapshot
 from ..services.validation import validate_annotation
 from ..utils.bloom import annotate_bloom, LEVEL_ORDER
 from ..utils.rubrics import get_active_rubric
 from ..services.llm import llm_annotate, ENABLE_LLM
 from sqlalchemy import text
 from datetime import datetime
-from ..utils.vector import vector_literal
 
 logger = logging.getLogger(__name__)
 
+# Dirty nodes claimed (and their edges recomputed) per transaction by maintain_graph_edges.
+GRAPH_DIRTY_BATCH = int(os.getenv("GRAPH_DIRTY_BATCH", "500"))
+
 
 def _sync_prob_vectors(db, dataset_id: int, chunk_ids: list[int]) -> None:
     """Recompute KnowledgeNode.prob_vector from bloom_annotations for the given chunks."""
@@ -81,93 +100,175 @@ def _sync_prob_vectors(db, dataset_id: int, chunk_ids: list[int]) -> None:
         node.top_levels = top[:2] if top else [LEVEL_ORDER[probs.index(max(probs))]]
 
 
+def _mark_job(db, job_id: int | None, status: str, error: str | None = None) -> None:
+    if job_id is None:
+        return
+    if status == "running":
+        db.execute(text("UPDATE jobs SET status='running' WHERE id=:id"), {"id": job_id})
+    else:
+        db.execute(
+            text("UPDATE jobs SET status=:st, error=:err, finished_at=now() WHERE id=:id"),
+            {"st": status, "err": error, "id": job_id},
+        )
+    db.commit()
+
+
+def _run_embedding_job(task, db, dataset_id: int, job_id: int | None, shards: list[Shard], model: str, dim: int):
+    """
+    Embeds `shards` and finishes the job: sequentially in this process when the
+    task is called directly (ENABLE_CELERY=0) or the dataset fits in one shard
+    per kind, otherwise as a chord of parallel `embed_shard_task`s whose
+    callback builds the indexes and marks the job done. Node shards of an index
+    job are best effort, as before: their failure does not fail the job.
+    """
+    best_effort_nodes = task is index_dataset
+    init_shard_progress(db, job_id, shards)
+    kinds = [s.kind for s in shards]
+    if task.request.called_directly or all(kinds.count(k) == 1 for k in kinds):
+        for shard in shards:
+            try:
+                embed_shard(db, job_id, dataset_id, shard, model)
+            except Exception as exc:
+                db.rollback()
+                report_shard_progress(db, job_id, shard, status="failed", error=str(exc)[:500])
+                if not (best_effort_nodes and shard.kind == "nodes"):
+                    raise
+                logger.warning("%s: node shard %s failed for dataset %d: %s", task.name, shard.key, dataset_id, exc)
+        return finish_embedding_job(dataset_id, job_id, model, dim)
+
+    header = group(
+        embed_shard_task.si(
+            dataset_id, job_id, shard.kind, shard.index, shard.lo, shard.hi, shard.rows, model,
+            best_effort_nodes and shard.kind == "nodes",
+        )
+        for shard in shards
+    )
+    chord(header)(finish_embedding_job.si(dataset_id, job_id, model, dim))
+    logger.info("%s: dispatched %d shards for dataset %d", task.name, len(shards), dataset_id)
+    return {"ok": True, "shards": len(shards), "model": model}
+
+
 @celery_app.task
-def index_dataset(dataset_id: int, job_id: int | None = None, dim: int = 1536):
+def embed_shard_task(
+    dataset_id: int,
+    job_id: int | None,
+    kind: str,
+    index: int,
+    lo: int,
+    hi: int,
+    rows: int,
+    model: str,
+    best_effort: bool = False,
+):
+    """One shard of a sharded index/reindex job; see `_run_embedding_job`."""
+    shard = Shard(kind, index, lo, hi, rows)
     db = SessionLocal()
     try:
-        if job_id is not None:
-            db.execute(
-                text("UPDATE jobs SET status='running' WHERE id=:id"),
-                {"id": job_id},
-            )
-            db.commit()
-        chunks = db.query(Chunk).join(Chunk.document).filter(Chunk.document.has(dataset_id=dataset_id)).all()
-        if not chunks:
-            if job_id is not None:
-                db.execute(
-                    text("UPDATE jobs SET status='done', finished_at=now() WHERE id=:id"),
-                    {"id": job_id},
-                )
-                db.commit()
-            return {"ok": True, "count": 0}
-        vecs = embed_texts([c.text for c in chunks], dim=dim)
-        model_name = current_embedding_model()
-        for chunk, vec in zip(chunks, vecs):
-            db.execute(
-                text(
-                    """
-                    INSERT INTO embeddings (chunk_id, dim, model, vec)
-                    VALUES (:cid, :dim, :model, CAST(:v AS vector))
-                    ON CONFLICT (chunk_id)
-                    DO UPDATE SET dim = EXCLUDED.dim,
-                                  model = EXCLUDED.model,
-                                  vec = EXCLUDED.vec
-                    """
-                ),
-                dict(cid=chunk.id, dim=dim, model=model_name, v=vector_literal(vec)),
-            )
-        db.commit()
+        active = current_embedding_model()
+        if active != model:
+            # Never mix vectors of two models in one job.
+            raise RuntimeError(f"worker embeds with {active}, job was started for {model}")
+        return {"shard": shard.key, "embedded": embed_shard(db, job_id, dataset_id, shard, model)}
+    except Exception as e:
+        db.rollback()
+        report_shard_progress(db, job_id, shard, status="failed", error=str(e)[:500])
+        if best_effort:
+            logger.warning("node shard %s failed for dataset %d: %s", shard.key, dataset_id, e)
+            return {"shard": shard.key, "embedded": 0, "error": str(e)}
+        _mark_job(db, job_id, "failed", f"shard {shard.key}: {e}")
+        raise
+    finally:
+        db.close()
+
 
-        # Also fill knowledge_nodes.vec for this dataset so the graph and
-        # semantic search work immediately — without requiring a separate
-        # reindex_dataset_nodes call.
+@celery_app.task
+def finish_embedding_job(dataset_id: int, job_id: int | None, model: str, dim: int):
+    """
+    Builds the model's vector indexes and, for a large enough dataset, its own
+    partial ones (no-op once they exist) and node vector snapshot, updates
+    the persisted graph edges of re-embedded nodes, then marks the job done.
+    """
+    db = SessionLocal()
+    try:
+        # CREATE INDEX CONCURRENTLY waits for open transactions; the shards have committed.
+        ensure_vector_indexes(model, dim)
+        ensure_dataset_indexes(dataset_id, model, dim)
         try:
-            nodes = (
-                db.execute(
-                    text(
-                        "SELECT id, title, context_text FROM knowledge_nodes "
-                        "WHERE dataset_id = :ds ORDER BY id"
-                    ),
-                    {"ds": dataset_id},
-                )
-                .mappings()
-                .all()
-            )
-            if nodes:
-                node_texts = [f"{n['title']}. {n['context_text']}".strip() for n in nodes]
-                node_vecs = embed_texts(node_texts, dim=dim)
-                for node, vec in zip(nodes, node_vecs):
-                    db.execute(
-                        text(
-                            "UPDATE knowledge_nodes "
-                            "SET vec = CAST(:v AS vector), embedding_model = :m "
-                            "WHERE id = :id"
-                        ),
-                        {"v": vector_literal(vec), "m": model_name, "id": node["id"]},
-                    )
-                db.commit()
-                logger.info("index_dataset: embedded %d nodes for dataset %d", len(nodes), dataset_id)
-        except Exception as node_exc:
-            logger.warning("index_dataset: node embedding failed for dataset %d: %s", dataset_id, node_exc)
+            build_node_snapshot(db, dataset_id, model)
+        except Exception as exc:
+            # Optional read path: searches keep going to Postgres without it.
+            db.rollback()
+            logger.warning("vector snapshot of dataset %d failed: %s", dataset_id, exc)
+        try:
+            # New vectors queued their nodes if the dataset has a persisted graph.
+            maintain_graph_edges(dataset_id)
+        except Exception as exc:
+            logger.warning("graph edge maintenance of dataset %d failed: %s", dataset_id, exc)
+        count = db.execute(
+            text(
+                "SELECT COALESCE(sum((s.value->>'embedded')::int), 0) "
+                "FROM jobs j, jsonb_each(j.payload->'shards') s WHERE j.id = :id"
+            ),
+            {"id": job_id},
+        ).scalar() if job_id is not None else None
+        _mark_job(db, job_id, "done")
+        return {"ok": True, "dataset_id": dataset_id, "embedded": count, "model": model}
+    finally:
+        db.close()
 
-        if job_id is not None:
-            db.execute(
-                text("UPDATE jobs SET status='done', finished_at=now() WHERE id=:id"),
-                {"id": job_id},
-            )
-            db.commit()
-        return {"ok": True, "count": len(chunks)}
+
+@celery_app.task
+def index_dataset(dataset_id: int, job_id: int | None = None, dim: int | None = None):
+    db = SessionLocal()
+    try:
+        _mark_job(db, job_id, "running")
+        chunk_shards = shard_ranges(db, "chunks", dataset_id)
+        if not chunk_shards:
+            _mark_job(db, job_id, "done")
+            return {"ok": True, "count": 0}
+        provider = get_embedding_provider()
+        if dim is not None and dim != provider.dim:
+            raise ValueError(f"dim must be {provider.dim} for the active embedding model")
+        # Node vectors are filled too, so the graph and semantic search work
+        # immediately — without requiring a separate reindex_dataset_nodes call.
+        shards = chunk_shards + shard_ranges(db, "nodes", dataset_id)
+        result = _run_embedding_job(
+            index_dataset, db, dataset_id, job_id, shards, provider.embedding_model, provider.dim
+        )
+        return {**result, "count": sum(s.rows for s in chunk_shards)}
     except Exception as e:
-        if job_id is not None:
-            db.execute(
-                text("UPDATE jobs SET status='failed', error=:err, finished_at=now() WHERE id=:id"),
-                {"err": str(e), "id": job_id},
-            )
-            db.commit()
+        db.rollback()
+        _mark_job(db, job_id, "failed", str(e))
         raise
     finally:
         db.close()
 
+
+@celery_app.task
+def build_dataset_vector_indexes(dataset_id: int, job_id: int | None = None, min_rows: int | None = None):
+    """
+    Builds the dataset's partial vector indexes for the active embedding model
+    where it holds at least `min_rows` vectors (default VECTOR_DATASET_INDEX_MIN_ROWS).
+    """
+    db = SessionLocal()
+    try:
+        _mark_job(db, job_id, "running")
+        provider = get_embedding_provider()
+        specs = ensure_dataset_indexes(dataset_id, provider.embedding_model, provider.dim, min_rows)
+        _mark_job(db, job_id, "done")
+        return {
+            "ok": True,
+            "model": provider.embedding_model,
+            "indexes": {k: v is not None for k, v in specs.items()},
+        }
+    except Exception as e:
+        db.rollback()
+        _mark_job(db, job_id, "failed", str(e))
+        raise
+    finally:
+        db.close()
+
+
 @celery_app.task
 def annotate_dataset(dataset_id: int, level: str, job_id: int | None = None):
     db = SessionLocal()
@@ -214,6 +315,7 @@ def annotate_dataset(dataset_id: int, level: str, job_id: int | None = None):
         annotated_chunk_ids = [r["cid"] for r in records]
         if annotated_chunk_ids:
             _sync_prob_vectors(db, dataset_id, annotated_chunk_ids)
+            bump_generation(db, dataset_id)
             db.commit()
 
         if job_id is not None:
@@ -249,7 +351,8 @@ def rebuild_graph_edges(
 ):
     """
     Rebuilds and persists graph edges into `knowledge_edges`.
-    Similarity edges are computed with pgvector (<=>) over `knowledge_nodes.vec`.
+    Similarity edges are computed with pgvector (<=>) over `knowledge_nodes.vec`,
+    for all nodes at once by the GRAPH_ENGINE (services/graph_build.py).
     """
     from ..models.models import KnowledgeNode  # avoid circular import at module import time
 
@@ -263,6 +366,9 @@ def rebuild_graph_edges(
         sim_method = f"similarity|{em}"
         co_method = "co_occurrence_window"
 
+        # Queued nodes are covered by this rebuild (later ones stay queued).
+        db.execute(text("DELETE FROM graph_dirty_nodes WHERE dataset_id=:ds"), {"ds": dataset_id})
+
         # Fetch candidate nodes.
         rows = db.execute(
             text(
@@ -281,6 +387,7 @@ def rebuild_graph_edges(
         node_ids = [int(r["id"]) for r in rows]
         if not node_ids:
             db.execute(text("DELETE FROM knowledge_edges WHERE dataset_id=:ds"), {"ds": dataset_id})
+            bump_generation(db, dataset_id)
             db.commit()
             if job_id is not None:
                 db.execute(text("UPDATE jobs SET status='done', finished_at=now() WHERE id=:id"), {"id": job_id})
@@ -299,94 +406,53 @@ def rebuild_graph_edges(
             if cur is None or weight > cur:
                 edge_map[key] = weight
 
-        sql = """
-            WITH q AS (SELECT vec FROM knowledge_nodes WHERE id = :id)
-            SELECT kn2.id as node_id,
-                   1.0 - (kn2.vec <=> (SELECT vec FROM q)) as score
-            FROM knowledge_nodes kn2
-            WHERE kn2.dataset_id = :ds
-              AND kn2.embedding_model = :em
-              AND kn2.vec IS NOT NULL
-              AND kn2.id != :id
-            ORDER BY kn2.vec <=> (SELECT vec FROM q)
-            LIMIT :k
-        """
-        for nid in node_ids:
-            if len(edge_map) >= max_edges:
-                break
-            r2 = db.execute(
-                text(sql),
-                {"id": nid, "ds": dataset_id, "em": em, "k": top_k},
-            ).mappings().all()
-            for row in r2:
-                score = float(row["score"])
-                if score < min_score:
-                    continue
-                add_edge(nid, int(row["node_id"]), round(score, 4), sim_method)
-                if len(edge_map) >= max_edges:
-                    break
+        # All nodes at once (GRAPH_ENGINE); the best max_edges pairs overall are kept.
+        engine = graph_engine(len(node_ids))
+        find_edges = numpy_similarity_edges if engine == "numpy" else similarity_edges
+        for a, b, score in find_edges(
+            db, node_ids, em, top_k=top_k, min_score=min_score, max_edges=max_edges, dataset_id=dataset_id
+        ):
+            add_edge(a, b, round(score, 4), sim_method)
 
         # Co-occurrence by document + sentence window.
         if include_cooccurrence and len(edge_map) < max_edges:
-            by_doc: dict[int, list[tuple[int, int]]] = {}
-            for r in rows:
-                doc_id = r["document_id"]
-                if doc_id is None:
-                    continue
-                mi = r["model_info"] or {}
-                src = (mi.get("source") or {}) if isinstance(mi, dict) else {}
-                sent_idx = src.get("sentence_idx")
-                if sent_idx is None:
-                    continue
-                by_doc.setdefault(int(doc_id), []).append((int(sent_idx), int(r["id"])))
-
-            for _doc_id, pairs in by_doc.items():
-                pairs.sort(key=lambda x: x[0])
-                for i in range(len(pairs)):
-                    si, a = pairs[i]
-                    # connect to next nodes within window
-                    for j in range(i + 1, len(pairs)):
-                        sj, b = pairs[j]
-                        if (sj - si) > co_window:
-                            break
-                        add_edge(a, b, 0.5, co_method)
-                        if len(edge_map) >= max_edges:
-                            break
-                    if len(edge_map) >= max_edges:
-                        break
+            for a, b in cooccurrence_pairs(rows, co_window):
+                add_edge(a, b, 0.5, co_method)
                 if len(edge_map) >= max_edges:
                     break
 
-        # Persist edges.
+        # Persist edges, and the params maintain_graph_edges keeps them current with.
         db.execute(text("DELETE FROM knowledge_edges WHERE dataset_id=:ds"), {"ds": dataset_id})
-        if edge_map:
-            payload = [
-                {
-                    "ds": dataset_id,
-                    "a": a,
-                    "b": b,
-                    "w": w,
-                    "m": m,
-                }
-                for (a, b, m), w in edge_map.items()
-            ]
-            db.execute(
-                text(
-                    """
-                    INSERT INTO knowledge_edges (dataset_id, from_node_id, to_node_id, weight, method)
-                    VALUES (:ds, :a, :b, :w, :m)
-                    ON CONFLICT (dataset_id, from_node_id, to_node_id, method)
-                    DO UPDATE SET weight = GREATEST(knowledge_edges.weight, EXCLUDED.weight)
-                    """
-                ),
-                payload,
-            )
+        write_edges(db, dataset_id, ((a, b, w, m) for (a, b, m), w in edge_map.items()))
+        params = graph_params(
+            em, top_k=top_k, min_score=min_score, max_edges=max_edges,
+            include_cooccurrence=include_cooccurrence, co_window=co_window,
+            max_node_id=node_ids[-1] if len(node_ids) >= limit_nodes else None,
+        )
+        db.execute(
+            text(
+                "UPDATE datasets SET graph_params = CAST(:params AS jsonb), graph_version = graph_version + 1 "
+                "WHERE id = :ds"
+            ),
+            {"params": json.dumps(params), "ds": dataset_id},
+        )
+        bump_generation(db, dataset_id)
         db.commit()
 
+        # Layout of the new graph; until it lands, GET /graph serves nodes without positions.
+        if GRAPH_LAYOUT_ENABLED:
+            try:
+                layout_dataset(db, dataset_id)
+                bump_generation(db, dataset_id)
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                logger.warning("graph layout of dataset %s failed: %s", dataset_id, exc)
+
         if job_id is not None:
             db.execute(text("UPDATE jobs SET status='done', finished_at=now() WHERE id=:id"), {"id": job_id})
             db.commit()
-        return {"ok": True, "nodes": len(node_ids), "edges": len(edge_map)}
+        return {"ok": True, "nodes": len(node_ids), "edges": len(edge_map), "engine": engine}
     except Exception as e:
         if job_id is not None:
             db.execute(
@@ -399,6 +465,106 @@ def rebuild_graph_edges(
         db.close()
 
 
+@celery_app.task
+def maintain_graph_edges(dataset_id: int | None = None, batch_size: int | None = None):
+    """
+    Drains the dirty-node queue (graph_dirty_nodes, filled by triggers on
+    knowledge_nodes while a dataset has a persisted graph): batch by batch,
+    claims queued nodes and recomputes only their edges (`refresh_node_edges`)
+    in the same transaction, so a failed batch stays queued. Concurrent
+    workers skip each other's batches. Their layout positions follow
+    (`update_layout`); a failed relayout only leaves them unplaced.
+    """
+    batch_size = batch_size or GRAPH_DIRTY_BATCH
+    db = SessionLocal()
+    try:
+        nodes = 0
+        datasets: set[int] = set()
+        while True:
+            claimed = db.execute(
+                text(
+                    f"""
+                    DELETE FROM graph_dirty_nodes
+                    WHERE node_id IN (
+                        SELECT node_id FROM graph_dirty_nodes
+                        {"WHERE dataset_id = :ds" if dataset_id is not None else ""}
+                        ORDER BY queued_at, node_id
+                        LIMIT :n
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING node_id, dataset_id
+                    """
+                ),
+                {"ds": dataset_id, "n": batch_size},
+            ).all()
+            if not claimed:
+                db.commit()
+                break
+            by_dataset: dict[int, list[int]] = {}
+            for node_id, ds in claimed:
+                by_dataset.setdefault(int(ds), []).append(int(node_id))
+            params_by_dataset = dict(
+                db.execute(
+                    text("SELECT id, graph_params FROM datasets WHERE id = ANY(:ids) AND graph_params IS NOT NULL"),
+                    {"ids": list(by_dataset)},
+                ).all()
+            )
+            # Entries of datasets without a persisted graph (or deleted ones) are just dropped.
+            for ds, params in params_by_dataset.items():
+                refresh_node_edges(db, ds, by_dataset[ds], params)
+                if GRAPH_LAYOUT_ENABLED:
+                    try:
+                        with db.begin_nested():
+                            update_layout(db, ds, by_dataset[ds])
+                    except Exception as exc:
+                        logger.warning("graph relayout of dataset %s failed: %s", ds, exc)
+            bump_generation(db, params_by_dataset.keys())
+            db.commit()
+            nodes += len(claimed)
+            datasets.update(params_by_dataset)
+        return {"ok": True, "nodes": nodes, "datasets": sorted(datasets)}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+@celery_app.task
+def cluster_graph(
+    dataset_id: int,
+    job_id: int | None = None,
+    include_cooccurrence: bool = True,
+    max_iterations: int = 20,
+):
+    """
+    Label-propagation communities of the dataset's persisted edges, with
+    per-cluster aggregates, for GET /graph/summary (services/graph_cluster.py).
+    Centroids use the model of the last graph rebuild, else the active one.
+    """
+    db = SessionLocal()
+    try:
+        _mark_job(db, job_id, "running")
+        params = db.execute(
+            text("SELECT graph_params FROM datasets WHERE id = :ds"), {"ds": dataset_id}
+        ).scalar()
+        em = (params or {}).get("embedding_model") or current_embedding_model()
+        result = cluster_dataset(
+            db, dataset_id, embedding_model=em,
+            include_cooccurrence=include_cooccurrence, max_iterations=max_iterations,
+        )
+        bump_generation(db, dataset_id)
+        db.commit()
+        _mark_job(db, job_id, "done")
+        return {"ok": True, **result}
+    except Exception as e:
+        db.rollback()
+        _mark_job(db, job_id, "failed", str(e))
+        raise
+    finally:
+        db.close()
+
+
 @celery_app.task
 def parse_document(document_id: int, file_path: str, filename: str,
                    content_type: str, job_id: int | None = None):
@@ -430,6 +596,8 @@ def parse_document(document_id: int, file_path: str, filename: str,
             text("UPDATE documents SET status='ready' WHERE id=:id"),
             {"id": document_id},
         )
+        doc = db.get(Document, document_id)
+        bump_generation(db, doc.dataset_id if doc is not None else None)
         db.commit()
 
         try:
@@ -466,44 +634,20 @@ def reindex_dataset_nodes(dataset_id: int, job_id: int | None = None):
     """Re-embed all KnowledgeNodes for a dataset using the current EMBEDDING_PROVIDER."""
     db = SessionLocal()
     try:
-        if job_id is not None:
-            db.execute(text("UPDATE jobs SET status='running' WHERE id=:id"), {"id": job_id})
-            db.commit()
-
-        nodes = (
-            db.execute(
-                text("SELECT id, title, context_text FROM knowledge_nodes WHERE dataset_id = :ds ORDER BY id"),
-                {"ds": dataset_id},
-            ).mappings().all()
-        )
-        if not nodes:
-            if job_id is not None:
-                db.execute(text("UPDATE jobs SET status='done', finished_at=now() WHERE id=:id"), {"id": job_id})
-                db.commit()
+        _mark_job(db, job_id, "running")
+        shards = shard_ranges(db, "nodes", dataset_id)
+        if not shards:
+            _mark_job(db, job_id, "done")
             return {"ok": True, "reindexed": 0}
 
-        model_name = current_embedding_model()
-        texts = [f"{n['title']}. {n['context_text']}".strip() for n in nodes]
-        vecs = embed_texts(texts, dim=1536)
-
-        for node, vec in zip(nodes, vecs):
-            db.execute(
-                text("UPDATE knowledge_nodes SET vec = CAST(:v AS vector), embedding_model = :m WHERE id = :id"),
-                {"v": vector_literal(vec), "m": model_name, "id": node["id"]},
-            )
-        db.commit()
-
-        if job_id is not None:
-            db.execute(text("UPDATE jobs SET status='done', finished_at=now() WHERE id=:id"), {"id": job_id})
-            db.commit()
-        return {"ok": True, "reindexed": len(nodes), "model": model_name}
+        provider = get_embedding_provider()
+        result = _run_embedding_job(
+            reindex_dataset_nodes, db, dataset_id, job_id, shards, provider.embedding_model, provider.dim
+        )
+        return {**result, "reindexed": sum(s.rows for s in shards), "model": provider.embedding_model}
     except Exception as e:
-        if job_id is not None:
-            db.execute(
-                text("UPDATE jobs SET status='failed', error=:err, finished_at=now() WHERE id=:id"),
-                {"err": str(e), "id": job_id},
-            )
-            db.commit()
+        db.rollback()
+        _mark_job(db, job_id, "failed", str(e))
         raise
     finally:
         db.close()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU whose entries also expire after `ttl_seconds`
+    (0 = never). Keeps hit/miss/eviction counters for stats endpoints.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float = 0.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any | None:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (not self.ttl_seconds or item[0] > now):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class RedisCache:
+    """
+    Bytes cache in Redis shared by all replicas, with a key prefix and TTL.
+    Never raises: Redis being down only costs recomputation (counted as errors).
+    """
+
+    def __init__(self, url: str, prefix: str, ttl_seconds: float = 0.0):
+        self._url = url
+        self._prefix = prefix
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self._client = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _redis(self):
+        with self._lock:
+            if self._client is None:
+                import redis  # local import: only needed when a Redis cache is enabled
+
+                self._client = redis.Redis.from_url(self._url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            return self._client
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            value = self._redis().get(self._prefix + key)
+        except Exception as exc:
+            self.errors += 1
+            logger.debug("redis cache get failed: %s", exc)
+            return None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        try:
+            ttl = int(self.ttl_seconds) or None
+            self._redis().set(self._prefix + key, value, ex=ttl)
+        except Exception as exc:
+            self.errors += 1
+            logger.debug("redis cache set failed: %s", exc)
+
+    def stats(self) -> dict:
+        return {
+            "prefix": self._prefix,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
@@ -31,7 +31,14 @@ CREATE TABLE IF NOT EXISTS embeddings (
   model VARCHAR(100) DEFAULT 'text-embedding-3-small',
   created_at TIMESTAMPTZ DEFAULT now()
 );
-CREATE INDEX IF NOT EXISTS idx_embeddings_vec ON embeddings USING ivfflat (vec vector_l2_ops) WITH (lists = 100);
+DO $$
+BEGIN
+  CREATE INDEX IF NOT EXISTS idx_embeddings_vec ON embeddings USING ivfflat (vec vector_l2_ops) WITH (lists = 100);
+EXCEPTION WHEN OTHERS THEN
+  -- Since 0019 embeddings.vec has no fixed dimension and global vector indexes
+  -- are replaced by per-model ones; don't block re-applying migrations.
+  RAISE NOTICE 'Skipping initial embeddings vector index creation: %', SQLERRM;
+END$$;
 
 DO $$
 BEGIN
@@ -0,0 +1,17 @@
+-- Content-addressed embedding cache shared by the API and all Celery workers.
+-- Keyed by (provider embedding_model, sha256(text)); vectors are raw float32 bytes
+-- so every model dimension fits. Bounded by EMBEDDING_CACHE_MAX_ENTRIES with
+-- least-recently-used eviction on last_used_at (see services/embedding_cache.py).
+
+CREATE TABLE IF NOT EXISTS embedding_cache (
+  model VARCHAR(100) NOT NULL,
+  text_hash BYTEA NOT NULL,
+  dim INT NOT NULL,
+  vec BYTEA NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  last_used_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (model, text_hash)
+);
+
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used
+  ON embedding_cache (last_used_at);
@@ -0,0 +1,44 @@
+-- Native-dimension vector storage.
+-- Until now every vector was stored as vector(1536); the local e5-large model
+-- (1024 dims) was zero-padded, and the padding was stored, indexed and scanned.
+-- The vec columns become dimensionless so each embedding model keeps its own
+-- width. A single HNSW index cannot span mixed dimensions, so the global vector
+-- indexes are replaced by per-model partial expression indexes, built on demand
+-- by services/vector_index.py (halfvec when pgvector >= 0.7) and tracked in
+-- `vector_indexes`. Legacy padded rows are converted by
+-- scripts/migrate_vector_storage.py.
+
+DROP INDEX IF EXISTS idx_embeddings_vec;
+DROP INDEX IF EXISTS idx_embeddings_vec_hnsw;
+DROP INDEX IF EXISTS idx_knowledge_nodes_vec;
+DROP INDEX IF EXISTS ix_knode_vec_hnsw;
+
+DO $$
+BEGIN
+  -- Guarded: re-typing on every startup would rebuild the per-model indexes.
+  IF (SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+      WHERE attrelid = 'embeddings'::regclass AND attname = 'vec') <> 'vector' THEN
+    ALTER TABLE embeddings ALTER COLUMN vec TYPE vector;
+  END IF;
+  IF (SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+      WHERE attrelid = 'knowledge_nodes'::regclass AND attname = 'vec') <> 'vector' THEN
+    ALTER TABLE knowledge_nodes ALTER COLUMN vec TYPE vector;
+  END IF;
+END$$;
+
+CREATE TABLE IF NOT EXISTS vector_indexes (
+  id SERIAL PRIMARY KEY,
+  table_name VARCHAR(64) NOT NULL,
+  model VARCHAR(100) NOT NULL,
+  dataset_id INT REFERENCES datasets(id) ON DELETE CASCADE,
+  dim INT NOT NULL,
+  precision VARCHAR(8) NOT NULL,
+  index_name VARCHAR(63) NOT NULL UNIQUE,
+  status VARCHAR(16) NOT NULL DEFAULT 'building',
+  error TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_vector_indexes_scope
+  ON vector_indexes (table_name, model, COALESCE(dataset_id, 0));
@@ -0,0 +1,9 @@
+-- vector_indexes (0019) now tracks several index kinds per model: "hnsw"
+-- (cosine over vec::halfvec/vector) and "binary" (Hamming over
+-- binary_quantize(vec), used as the coarse stage of two-stage search).
+
+ALTER TABLE vector_indexes ADD COLUMN IF NOT EXISTS kind VARCHAR(16) NOT NULL DEFAULT 'hnsw';
+
+DROP INDEX IF EXISTS ux_vector_indexes_scope;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_vector_indexes_scope_kind
+  ON vector_indexes (table_name, model, kind, COALESCE(dataset_id, 0));
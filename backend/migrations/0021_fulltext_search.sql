@@ -0,0 +1,17 @@
+-- Lexical side of hybrid search (GET /search?mode=hybrid, /nodes/search?mode=hybrid):
+-- stored tsvectors (russian config; ASCII words go through the english stemmer)
+-- with GIN indexes, fused with vector kNN by reciprocal rank fusion.
+
+ALTER TABLE chunks
+  ADD COLUMN IF NOT EXISTS tsv tsvector
+  GENERATED ALWAYS AS (to_tsvector('russian'::regconfig, COALESCE(text, ''))) STORED;
+CREATE INDEX IF NOT EXISTS ix_chunks_tsv ON chunks USING gin (tsv);
+
+-- Titles weigh more than context (ts_rank_cd weights A > B).
+ALTER TABLE knowledge_nodes
+  ADD COLUMN IF NOT EXISTS tsv tsvector
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian'::regconfig, COALESCE(title, '')), 'A')
+    || setweight(to_tsvector('russian'::regconfig, COALESCE(context_text, '')), 'B')
+  ) STORED;
+CREATE INDEX IF NOT EXISTS ix_knowledge_nodes_tsv ON knowledge_nodes USING gin (tsv);
@@ -0,0 +1,15 @@
+-- Per-dataset partial vector indexes (services/vector_index.py,
+-- ensure_dataset_indexes). knowledge_nodes already carries dataset_id; the
+-- embeddings get a denormalized copy (written by ChunkEmbeddingWriter) so a
+-- partial index `WHERE model = … AND dataset_id = …` can be declared on them.
+-- The indexes are tracked in `vector_indexes` with dataset_id set.
+
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS dataset_id INT REFERENCES datasets(id) ON DELETE CASCADE;
+
+UPDATE embeddings e
+SET dataset_id = d.dataset_id
+FROM chunks c
+JOIN documents d ON d.id = c.document_id
+WHERE c.id = e.chunk_id AND e.dataset_id IS NULL;
+
+CREATE INDEX IF NOT EXISTS ix_embeddings_dataset_model ON embeddings (dataset_id, model);
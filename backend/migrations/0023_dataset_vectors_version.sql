@@ -0,0 +1,46 @@
+-- Version stamp of a dataset's node vectors, used to tell whether an exported
+-- vector snapshot (services/vector_snapshot.py) is still current. Bumped once
+-- per statement that adds, removes or changes node vectors of the dataset,
+-- whichever code path runs it.
+
+ALTER TABLE datasets ADD COLUMN IF NOT EXISTS vectors_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_dataset_vectors_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE datasets SET vectors_version = vectors_version + 1
+    WHERE id IN (SELECT dataset_id FROM new_rows WHERE vec IS NOT NULL);
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE datasets SET vectors_version = vectors_version + 1
+    WHERE id IN (SELECT dataset_id FROM old_rows WHERE vec IS NOT NULL);
+  ELSE
+    UPDATE datasets SET vectors_version = vectors_version + 1
+    WHERE id IN (
+      SELECT unnest(ARRAY[o.dataset_id, n.dataset_id])
+      FROM new_rows n JOIN old_rows o ON o.id = n.id
+      WHERE n.vec IS DISTINCT FROM o.vec
+         OR n.embedding_model IS DISTINCT FROM o.embedding_model
+         OR n.dataset_id IS DISTINCT FROM o.dataset_id
+    );
+  END IF;
+  RETURN NULL;
+END$$;
+
+DROP TRIGGER IF EXISTS trg_knowledge_nodes_vectors_ins ON knowledge_nodes;
+CREATE TRIGGER trg_knowledge_nodes_vectors_ins
+  AFTER INSERT ON knowledge_nodes
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_dataset_vectors_version();
+
+DROP TRIGGER IF EXISTS trg_knowledge_nodes_vectors_upd ON knowledge_nodes;
+CREATE TRIGGER trg_knowledge_nodes_vectors_upd
+  AFTER UPDATE ON knowledge_nodes
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_dataset_vectors_version();
+
+DROP TRIGGER IF EXISTS trg_knowledge_nodes_vectors_del ON knowledge_nodes;
+CREATE TRIGGER trg_knowledge_nodes_vectors_del
+  AFTER DELETE ON knowledge_nodes
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_dataset_vectors_version();
@@ -0,0 +1,6 @@
+-- Generation counter of a dataset's content. Every write path that changes
+-- what /search, /nodes/search or /graph return bumps it (parse, index,
+-- annotate, canvas ingest, node CRUD, graph rebuild); cached responses are
+-- keyed by it (services/result_cache.py).
+
+ALTER TABLE datasets ADD COLUMN IF NOT EXISTS generation BIGINT NOT NULL DEFAULT 0;
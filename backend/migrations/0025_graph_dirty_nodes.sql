@@ -0,0 +1,78 @@
+-- Incremental maintenance of persisted graph edges.
+--
+-- datasets.graph_params holds the parameters of the dataset's last
+-- rebuild_graph_edges run (NULL: no persisted graph). While it is set, every
+-- statement that adds a node vector or changes one (or the node's model,
+-- dataset, document or sentence position) queues the node in
+-- graph_dirty_nodes; the maintain_graph_edges task recomputes only the edges of
+-- queued nodes, in batches. Edges of deleted nodes go with them (ON DELETE CASCADE);
+-- their former neighbours are queued first, so their kNN lists are refilled.
+
+ALTER TABLE datasets ADD COLUMN IF NOT EXISTS graph_params JSONB;
+
+-- No foreign keys: rows of deleted nodes / datasets are dropped by the worker.
+CREATE TABLE IF NOT EXISTS graph_dirty_nodes (
+  node_id INTEGER PRIMARY KEY,
+  dataset_id INTEGER NOT NULL,
+  queued_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_graph_dirty_nodes_queued ON graph_dirty_nodes (queued_at);
+CREATE INDEX IF NOT EXISTS ix_graph_dirty_nodes_dataset ON graph_dirty_nodes (dataset_id);
+
+CREATE OR REPLACE FUNCTION queue_graph_dirty_nodes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO graph_dirty_nodes (node_id, dataset_id)
+    SELECT n.id, n.dataset_id
+    FROM new_rows n JOIN datasets d ON d.id = n.dataset_id
+    WHERE n.vec IS NOT NULL AND d.graph_params IS NOT NULL
+    ON CONFLICT (node_id) DO UPDATE SET dataset_id = EXCLUDED.dataset_id, queued_at = now();
+  ELSE
+    INSERT INTO graph_dirty_nodes (node_id, dataset_id)
+    SELECT n.id, n.dataset_id
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id
+    JOIN datasets d ON d.id = n.dataset_id
+    WHERE d.graph_params IS NOT NULL
+      AND (n.vec IS DISTINCT FROM o.vec
+           OR n.embedding_model IS DISTINCT FROM o.embedding_model
+           OR n.dataset_id IS DISTINCT FROM o.dataset_id
+           OR n.document_id IS DISTINCT FROM o.document_id
+           OR (n.model_info::jsonb #> '{source,sentence_idx}')
+              IS DISTINCT FROM (o.model_info::jsonb #> '{source,sentence_idx}'))
+    ON CONFLICT (node_id) DO UPDATE SET dataset_id = EXCLUDED.dataset_id, queued_at = now();
+  END IF;
+  RETURN NULL;
+END$$;
+
+DROP TRIGGER IF EXISTS trg_knowledge_nodes_graph_ins ON knowledge_nodes;
+CREATE TRIGGER trg_knowledge_nodes_graph_ins
+  AFTER INSERT ON knowledge_nodes
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION queue_graph_dirty_nodes();
+
+DROP TRIGGER IF EXISTS trg_knowledge_nodes_graph_upd ON knowledge_nodes;
+CREATE TRIGGER trg_knowledge_nodes_graph_upd
+  AFTER UPDATE ON knowledge_nodes
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION queue_graph_dirty_nodes();
+
+-- Row-level and BEFORE: the node's edges are still there (the cascade comes later).
+CREATE OR REPLACE FUNCTION queue_graph_neighbours_of_deleted() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO graph_dirty_nodes (node_id, dataset_id)
+  SELECT DISTINCT CASE WHEN e.from_node_id = OLD.id THEN e.to_node_id ELSE e.from_node_id END, e.dataset_id
+  FROM knowledge_edges e JOIN datasets d ON d.id = e.dataset_id
+  WHERE (e.from_node_id = OLD.id OR e.to_node_id = OLD.id)
+    AND e.from_node_id <> e.to_node_id
+    AND d.graph_params IS NOT NULL
+  ON CONFLICT (node_id) DO UPDATE SET dataset_id = EXCLUDED.dataset_id, queued_at = now();
+  RETURN OLD;
+END$$;
+
+DROP TRIGGER IF EXISTS trg_knowledge_nodes_graph_del ON knowledge_nodes;
+CREATE TRIGGER trg_knowledge_nodes_graph_del
+  BEFORE DELETE ON knowledge_nodes
+  FOR EACH ROW EXECUTE FUNCTION queue_graph_neighbours_of_deleted();
@@ -0,0 +1,35 @@
+-- Communities of the persisted graph (cluster_graph job, label propagation over
+-- knowledge_edges) for GET /graph/summary and cluster drill-down. Each run
+-- replaces the dataset's rows; nodes added since have no cluster until the next run.
+
+CREATE TABLE IF NOT EXISTS graph_clusters (
+  dataset_id INT NOT NULL REFERENCES datasets(id) ON DELETE CASCADE,
+  cluster_id INT NOT NULL,
+  size INT NOT NULL,
+  label VARCHAR(300),
+  label_node_id INT REFERENCES knowledge_nodes(id) ON DELETE SET NULL,
+  prob_vector JSONB NOT NULL DEFAULT '[]'::jsonb,
+  top_levels JSONB NOT NULL DEFAULT '[]'::jsonb,
+  embedding_model VARCHAR(100),
+  -- Mean of the members' normalized vectors (native dimension, like knowledge_nodes.vec)
+  centroid vector,
+  created_at TIMESTAMPTZ DEFAULT now(),
+  PRIMARY KEY (dataset_id, cluster_id)
+);
+
+CREATE TABLE IF NOT EXISTS graph_cluster_members (
+  node_id INT PRIMARY KEY REFERENCES knowledge_nodes(id) ON DELETE CASCADE,
+  dataset_id INT NOT NULL REFERENCES datasets(id) ON DELETE CASCADE,
+  cluster_id INT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_graph_cluster_members_cluster ON graph_cluster_members (dataset_id, cluster_id);
+
+-- Edges between clusters: summed weight and count of the node edges they aggregate.
+CREATE TABLE IF NOT EXISTS graph_cluster_edges (
+  dataset_id INT NOT NULL REFERENCES datasets(id) ON DELETE CASCADE,
+  from_cluster_id INT NOT NULL,
+  to_cluster_id INT NOT NULL,
+  weight DOUBLE PRECISION NOT NULL,
+  edges INT NOT NULL,
+  PRIMARY KEY (dataset_id, from_cluster_id, to_cluster_id)
+);
@@ -0,0 +1,16 @@
+-- Precomputed 2D graph layout (services/graph_layout.py).
+--
+-- datasets.graph_version counts persisted graph rebuilds; a full layout is
+-- computed after each one and stamped with it, small changes (maintain_graph_edges)
+-- only place the changed nodes. GET /graph returns positions of the current version.
+
+ALTER TABLE datasets ADD COLUMN IF NOT EXISTS graph_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS graph_node_positions (
+  node_id INT PRIMARY KEY REFERENCES knowledge_nodes(id) ON DELETE CASCADE,
+  dataset_id INT NOT NULL REFERENCES datasets(id) ON DELETE CASCADE,
+  x REAL NOT NULL,
+  y REAL NOT NULL,
+  graph_version BIGINT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_graph_node_positions_dataset ON graph_node_positions (dataset_id);
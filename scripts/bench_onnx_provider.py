@@ -0,0 +1,79 @@
+"""
+Benchmark: ONNX Runtime (fp32 and int8) vs the PyTorch LocalProvider.
+
+Reports throughput and how closely the ONNX vectors agree with PyTorch's:
+per-text cosine and overlap of the top-10 neighbours of each text. The first
+run also exports (and quantizes) the model into ONNX_CACHE_DIR.
+
+Usage:
+  python scripts/bench_onnx_provider.py [n_texts] [model]
+    # default: 512 texts, EMBEDDING_MODEL_LOCAL or intfloat/multilingual-e5-large
+  ONNX_INTRA_OP_THREADS=4 python scripts/bench_onnx_provider.py
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from backend.app.services.embedding_provider import LocalProvider  # noqa: E402
+from backend.app.services.onnx_embedding import OnnxProvider  # noqa: E402
+
+_SENTENCES = [
+    "Фотосинтез — процесс образования органических веществ из углекислого газа и воды на свету.",
+    "Митохондрия — органоид клетки, в котором синтезируется АТФ.",
+    "Сравните причины Февральской и Октябрьской революций 1917 года.",
+    "Закон Ома связывает силу тока, напряжение и сопротивление участка цепи.",
+    "Производная функции описывает скорость её изменения.",
+    "Оцените роль реформ Петра I в развитии российского флота.",
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "Design an experiment to measure the boiling point of a salt solution.",
+]
+
+
+def synthetic_texts(n: int) -> list[str]:
+    rng = random.Random(0)
+    return [" ".join(rng.choices(_SENTENCES, k=rng.randint(1, 6))) for _ in range(n)]
+
+
+def timed_embed(provider, texts: list[str]) -> tuple[np.ndarray, float]:
+    provider.embed(texts[:8])  # warm-up
+    t0 = time.perf_counter()
+    vecs = provider.embed(texts)
+    return vecs, time.perf_counter() - t0
+
+
+def neighbour_overlap(a: np.ndarray, b: np.ndarray, k: int = 10) -> float:
+    k = min(k, len(a) - 1)
+    top_a = np.argsort(-(a @ a.T), axis=1)[:, 1 : k + 1]
+    top_b = np.argsort(-(b @ b.T), axis=1)[:, 1 : k + 1]
+    return float(np.mean([len(set(x) & set(y)) / k for x, y in zip(top_a, top_b)]))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    model = sys.argv[2] if len(sys.argv) > 2 else os.getenv("EMBEDDING_MODEL_LOCAL", "intfloat/multilingual-e5-large")
+    texts = synthetic_texts(n)
+
+    ref, t_ref = timed_embed(LocalProvider(model), texts)
+    print(f"model:        {model}")
+    print(f"texts:        {n}")
+    print(f"pytorch fp32: {t_ref:.2f}s ({n / t_ref:,.1f} texts/s)")
+    for quantize in ("none", "int8"):
+        provider = OnnxProvider(model, quantize=quantize)
+        vecs, t = timed_embed(provider, texts)
+        cos = np.sum(ref * vecs, axis=1)
+        label = f"onnx {'int8' if quantize == 'int8' else 'fp32'}:"
+        print(
+            f"{label:<13} {t:.2f}s ({n / t:,.1f} texts/s, {t_ref / t:.2f}x)  "
+            f"cosine mean={cos.mean():.5f} min={cos.min():.5f}  "
+            f"top-10 overlap={neighbour_overlap(ref, vecs):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Moves existing vectors to native-dimension storage (migration 0019) and builds
+the per-model vector indexes.
+
+Usage:
+    python scripts/migrate_vector_storage.py            # convert + index
+    python scripts/migrate_vector_storage.py --dry-run  # only report row counts
+
+Steps:
+  1. Rows written by the local provider before 0019 (`local:<name>:padded1536`)
+     are truncated to the model's native width and relabelled `local:<name>:<dim>`.
+     No text is re-embedded.
+  2. For every (model, dim) present in `embeddings` / `knowledge_nodes`, the
+     partial HNSW indexes are built (halfvec when pgvector >= 0.7, see
+     VECTOR_INDEX_PRECISION).
+
+Safe to re-run; an interrupted conversion resumes where it stopped.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from sqlalchemy import text
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from backend.app.db.session import SessionLocal  # noqa: E402
+from backend.app.services.embedding_provider import LocalProvider, get_embedding_provider  # noqa: E402
+from backend.app.services.vector_index import ensure_vector_indexes  # noqa: E402
+from backend.app.services.vector_store import migrate_legacy_vectors  # noqa: E402
+
+
+def model_dims(db) -> list[tuple[str, int, int]]:
+    rows = db.execute(
+        text(
+            """
+            SELECT model, dim, count(*) FROM (
+              SELECT model, vector_dims(vec) AS dim FROM embeddings WHERE vec IS NOT NULL
+              UNION ALL
+              SELECT embedding_model, vector_dims(vec) FROM knowledge_nodes WHERE vec IS NOT NULL
+            ) t
+            WHERE model IS NOT NULL
+            GROUP BY model, dim
+            ORDER BY model, dim
+            """
+        )
+    ).all()
+    return [(str(r[0]), int(r[1]), int(r[2])) for r in rows]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="report only, change nothing")
+    args = parser.parse_args()
+
+    provider = get_embedding_provider()
+    db = SessionLocal()
+    try:
+        for model, dim, n in model_dims(db):
+            print(f"{model:60s} dim={dim:<5d} rows={n}")
+        if args.dry_run:
+            return
+
+        if isinstance(provider, LocalProvider):
+            moved = migrate_legacy_vectors(
+                db, provider.legacy_embedding_model, provider.embedding_model, provider.dim
+            )
+            print(f"converted {provider.legacy_embedding_model} -> {provider.embedding_model}: {moved}")
+        db.commit()
+
+        for model, dim, _n in model_dims(db):
+            db.commit()  # CREATE INDEX CONCURRENTLY waits for open transactions
+            if model.endswith(":padded1536"):
+                print(f"skipping legacy {model}: switch EMBEDDING_PROVIDER to its local model to convert it")
+                continue
+            specs = ensure_vector_indexes(model, dim)
+            print(f"indexes for {model}: {specs}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
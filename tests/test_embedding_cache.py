@@ -0,0 +1,64 @@
+"""Tests for the content-addressed embedding cache in front of embed_texts."""
+import numpy as np
+
+from backend.app.services import embedding as embedding_mod
+from backend.app.services.embedding_cache import MemoryEmbeddingCache, text_key
+from backend.app.services.embedding_provider import EmbeddingProvider
+
+
+class _CountingProvider(EmbeddingProvider):
+    def __init__(self):
+        self.calls: list[list[str]] = []
+        self.model = "fake:counting"
+
+    @property
+    def embedding_model(self):
+        return self.model
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        out = np.zeros((len(texts), 1536), dtype=np.float32)
+        for i, t in enumerate(texts):
+            out[i, len(t) % 1536] = 1.0
+        return out
+
+
+def _patch(monkeypatch, provider, cache):
+    monkeypatch.setattr(embedding_mod, "get_embedding_provider", lambda: provider)
+    monkeypatch.setattr(embedding_mod, "get_embedding_cache", lambda: cache)
+
+
+def test_only_misses_reach_provider(monkeypatch):
+    provider = _CountingProvider()
+    cache = MemoryEmbeddingCache(max_entries=100)
+    _patch(monkeypatch, provider, cache)
+
+    first = embedding_mod.embed_texts(["a", "bb", "a"])
+    assert provider.calls == [["a", "bb"]]
+    assert np.array_equal(first[0], first[2])
+
+    second = embedding_mod.embed_texts(["bb", "ccc"])
+    assert provider.calls[-1] == ["ccc"]
+    assert np.array_equal(second[0], first[1])
+
+
+def test_cache_is_keyed_by_model(monkeypatch):
+    provider = _CountingProvider()
+    cache = MemoryEmbeddingCache(max_entries=100)
+    _patch(monkeypatch, provider, cache)
+    embedding_mod.embed_texts(["same text"])
+
+    provider.model = "fake:other"
+    embedding_mod.embed_texts(["same text"])
+    assert len(provider.calls) == 2
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryEmbeddingCache(max_entries=2)
+    v = np.ones(4, dtype=np.float32)
+    cache.put_many("m", {text_key("a"): v, text_key("b"): v})
+    cache.get_many("m", [text_key("a")])  # touch "a"
+    cache.put_many("m", {text_key("c"): v})
+    assert len(cache) == 2
+    hits = cache.get_many("m", [text_key("a"), text_key("b"), text_key("c")])
+    assert set(hits) == {text_key("a"), text_key("c")}
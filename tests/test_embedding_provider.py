@@ -0,0 +1,148 @@
+"""Tests for embedding providers (no model downloads required)."""
+import numpy as np
+
+from backend.app.services.embedding_provider import DEFAULT_DIM, LocalProvider
+
+
+class _FakeSentenceTransformer:
+    def __init__(self):
+        self.batches: list[list[str]] = []
+
+    def encode(self, texts, batch_size, **kwargs):
+        self.batches.append(list(texts))
+        out = np.zeros((len(texts), 8), dtype=np.float32)
+        for i, t in enumerate(texts):
+            out[i, len(t) % 8] = 1.0
+        return out
+
+
+def _local_provider() -> LocalProvider:
+    provider = LocalProvider.__new__(LocalProvider)
+    provider._model_name = "fake"
+    provider._model = _FakeSentenceTransformer()
+    provider._dim = 8
+    return provider
+
+
+def test_local_embed_batches_are_length_sorted_and_complete():
+    provider = _local_provider()
+    texts = ["a" * n for n in (3, 10, 1, 7, 5)]
+    seen = []
+    for positions, vecs in provider.embed_batches(texts, batch_size=2):
+        assert vecs.shape == (len(positions), provider.dim)
+        assert vecs.dtype == np.float32
+        seen.extend(positions)
+    assert sorted(seen) == list(range(len(texts)))
+    lengths = [len(texts[i]) for i in seen]
+    assert lengths == sorted(lengths, reverse=True)
+    assert all(len(b) <= 2 for b in provider._model.batches)
+
+
+def test_local_embed_restores_input_order():
+    provider = _local_provider()
+    texts = ["abc", "abcdefg", "a"]
+    vecs = np.asarray(provider.embed(texts))
+    for t, v in zip(texts, vecs):
+        assert int(np.argmax(v)) == len(t) % 8
+
+
+def test_local_vectors_keep_native_dim():
+    provider = _local_provider()
+    assert provider.embed(["x"]).shape == (1, 8)
+    assert provider.embedding_model == "local:fake:8"
+    assert provider.legacy_embedding_model == "local:fake:padded1536"
+
+
+class _FakeTokenizer:
+    def __call__(self, texts, **kwargs):
+        width = max(len(t) for t in texts)
+        mask = np.array([[1] * len(t) + [0] * (width - len(t)) for t in texts], dtype=np.int64)
+        return {"input_ids": mask.copy(), "attention_mask": mask}
+
+
+class _FakeSession:
+    """Token j of a text of length n gets hidden state [1, j]; padding gets [100, 100]."""
+
+    def run(self, _outputs, feed):
+        mask = feed["attention_mask"]
+        hidden = np.full(mask.shape + (2,), 100.0, dtype=np.float32)
+        hidden[..., 0] = np.where(mask == 1, 1.0, 100.0)
+        hidden[..., 1] = np.where(mask == 1, np.arange(mask.shape[1]), 100.0)
+        return [hidden]
+
+
+def _onnx_provider(pooling: str):
+    from backend.app.services.onnx_embedding import OnnxProvider
+
+    provider = OnnxProvider.__new__(OnnxProvider)
+    provider._session = _FakeSession()
+    provider._tokenizer = _FakeTokenizer()
+    provider._model_name = "fake"
+    provider._precision = "int8"
+    provider._dim = 2
+    provider._pooling = pooling
+    provider._max_length = 16
+    provider._input_names = ["input_ids", "attention_mask"]
+    return provider
+
+
+def test_onnx_mean_pooling_ignores_padding():
+    provider = _onnx_provider("mean")
+    texts = ["abc", "a", "abcde"]
+    vecs = provider.embed(texts)
+    assert vecs.shape == (3, 2) and vecs.dtype == np.float32
+    for t, v in zip(texts, vecs):
+        expected = np.array([1.0, (len(t) - 1) / 2.0], dtype=np.float32)
+        np.testing.assert_allclose(v, expected / np.linalg.norm(expected), rtol=1e-6)
+
+
+def test_onnx_cls_pooling_and_model_string():
+    provider = _onnx_provider("cls")
+    np.testing.assert_allclose(provider.embed(["abc", "a"]), [[1.0, 0.0], [1.0, 0.0]])
+    # Backend and precision are part of the model string, so ONNX vectors are
+    # never compared with the PyTorch ones of the same model.
+    assert provider.embedding_model == "onnx:fake:2:int8"
+    assert provider.embed([]).shape == (0, 2)
+
+
+def _reference_hash_embed(texts):
+    """The original per-token loop; HashingProvider must stay bit-identical to it."""
+    import hashlib
+
+    from backend.app.services.embedding_provider import _TOK_RE, _l2_normalize
+
+    out = np.zeros((len(texts), DEFAULT_DIM), dtype=np.float32)
+    for i, t in enumerate(texts):
+        for tok in _TOK_RE.findall((t or "").lower()):
+            h = hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest()
+            v = int.from_bytes(h, "little", signed=False)
+            out[i, v % DEFAULT_DIM] += -1.0 if (v >> 63) & 1 else 1.0
+    return _l2_normalize(out)
+
+
+def test_hashing_provider_matches_reference_loop():
+    from backend.app.services.embedding_provider import HashingProvider
+
+    texts = [
+        "Фотосинтез — процесс образования органических веществ.",
+        "",
+        "repeat repeat repeat word-with-dash",
+        "Сравните причины двух революций. Сравните!",
+    ]
+    got = np.asarray(HashingProvider().embed(texts), dtype=np.float32)
+    assert np.array_equal(got, _reference_hash_embed(texts))
+
+
+def test_token_memo_stays_bounded_and_safe_across_threads(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from backend.app.services import embedding_provider as ep
+
+    monkeypatch.setattr(ep, "HASH_TOKEN_CACHE_SIZE", 50)
+    monkeypatch.setattr(ep, "_TOKEN_SLOTS", {})
+    texts = [[" ".join(f"w{t}-{i}-{j}" for j in range(80))] for t in range(8) for i in range(10)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        got = list(pool.map(ep.HashingProvider().embed, texts))  # resets race with lookups
+    for text, vecs in zip(texts, got):
+        assert np.array_equal(np.asarray(vecs, dtype=np.float32), _reference_hash_embed(text))
+    assert len(ep._TOKEN_SLOTS) <= 50
@@ -0,0 +1,175 @@
+"""Tests for graph edge construction and maintenance (no Postgres required)."""
+import struct
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.models.base import Base
+from backend.app.models.models import Dataset
+from backend.app.services.graph_build import (
+    _parse_vector_copy,
+    cooccurrence_pairs,
+    graph_params,
+    rank_edges,
+    similarity_edges_sql,
+    topk_edges,
+)
+from backend.app.tasks import queue
+from backend.app.services.vector_index import IndexSpec, distance_sql
+
+
+def test_sql_searches_all_sources_in_one_statement():
+    sql = similarity_edges_sql(
+        where="kn2.vec IS NOT NULL AND kn2.dataset_id = :ds",
+        distance=distance_sql("kn2.vec", "s.vec", IndexSpec(1024, "half")),
+    )
+    assert "id = ANY(:src)" in sql
+    assert "CROSS JOIN LATERAL" in sql
+    assert "ORDER BY (kn2.vec)::halfvec(1024) <=> (s.vec)::halfvec(1024)" in sql
+    # Undirected pairs, ranked globally before the edge budget applies.
+    assert "LEAST(a, b) AS a, GREATEST(a, b) AS b, max(score)" in sql
+    assert "ORDER BY score DESC, a, b" in sql
+    assert sql.rstrip().endswith("LIMIT :max_edges")
+
+
+def test_rank_edges_keeps_best_pairs_overall():
+    hits = {
+        1: [(2, 0.9), (3, 0.3), (1, 1.0)],
+        2: [(1, 0.9), (4, 0.1)],
+        5: [(6, 0.95), (3, 0.5)],
+    }
+    assert rank_edges(hits, min_score=0.2, max_edges=3) == [(5, 6, 0.95), (1, 2, 0.9), (3, 5, 0.5)]
+    assert rank_edges(hits, min_score=0.2, max_edges=10)[-1] == (1, 3, 0.3)
+    assert rank_edges(hits, min_score=0.96, max_edges=10) == []
+
+
+def test_numpy_topk_matches_brute_force_in_any_block_size():
+    rng = np.random.default_rng(3)
+    vecs = rng.standard_normal((60, 8)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    ids = np.arange(10, 130, 2, dtype=np.int64)
+    sources = ids[::3]
+
+    sims = vecs @ vecs.T
+    np.fill_diagonal(sims, -np.inf)
+    best: dict[tuple[int, int], float] = {}
+    for i in np.searchsorted(ids, sources):
+        for j in np.argsort(-sims[i])[:4]:
+            if sims[i, j] >= 0.1:
+                key = (int(min(ids[i], ids[j])), int(max(ids[i], ids[j])))
+                best[key] = max(best.get(key, -1.0), float(sims[i, j]))
+    expected = [pair for pair, _ in sorted(best.items(), key=lambda item: (-item[1], item[0]))][:25]
+
+    for block_rows in (1, 7, None):
+        got = topk_edges(ids, vecs, sources, top_k=4, min_score=0.1, max_edges=25, block_rows=block_rows)
+        assert [(a, b) for a, b, _ in got] == expected
+    assert topk_edges(ids, vecs, np.array([11, 999]), top_k=4, min_score=0.1, max_edges=25) == []
+    assert topk_edges(ids[:1], vecs[:1], ids[:1], top_k=4, min_score=0.0, max_edges=25) == []
+
+
+def test_parse_binary_copy_of_vectors():
+    header = b"PGCOPY\n\xff\r\n\x00" + b"\x00" * 8
+    rows = b""
+    for node_id, vec in ((7, [1.0, -2.0, 0.5]), (42, [0.0, 3.0, 4.0])):
+        rows += struct.pack(">hiqi", 2, 8, node_id, 4 + 4 * 3) + struct.pack(">HH3f", 3, 0, *vec)
+    ids, vecs = _parse_vector_copy(header + rows + b"\xff\xff")
+    assert ids.tolist() == [7, 42]
+    assert vecs.dtype == np.float32
+    assert vecs.tolist() == [[1.0, -2.0, 0.5], [0.0, 3.0, 4.0]]
+    assert len(_parse_vector_copy(header + b"\xff\xff")[0]) == 0
+
+
+def test_cooccurrence_pairs_within_window_per_document():
+    def row(node_id, doc, idx):
+        return {"id": node_id, "document_id": doc, "model_info": {"source": {"sentence_idx": idx}}}
+
+    rows = [
+        row(1, 10, 0), row(2, 10, 5), row(3, 10, 1), row(4, 10, 3),
+        row(5, 11, 0), row(6, 11, 2),
+        {"id": 7, "document_id": None, "model_info": {"source": {"sentence_idx": 0}}},
+        {"id": 8, "document_id": 10, "model_info": {}},
+    ]
+    assert list(cooccurrence_pairs(rows, 2)) == [(1, 3), (3, 4), (4, 2), (5, 6)]
+    assert list(cooccurrence_pairs(rows, 1)) == [(1, 3)]
+
+
+def test_graph_params_bound_the_refresh_like_the_rebuild():
+    params = graph_params(
+        "hash:v1", top_k=5, min_score=0.2, max_edges=200,
+        include_cooccurrence=True, co_window=2, max_node_id=None,
+    )
+    assert params == {
+        "embedding_model": "hash:v1", "top_k": 5, "min_score": 0.2, "max_edges": 200,
+        "include_cooccurrence": True, "co_window": 2, "max_node_id": None,
+    }
+
+
+def test_maintenance_runs_only_for_datasets_with_a_persisted_graph(monkeypatch):
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    plain, built = Dataset(name="plain"), Dataset(name="built", graph_params={"top_k": 5})
+    db.add_all([plain, built])
+    db.commit()
+
+    runs = []
+    monkeypatch.setattr(queue, "ENABLE_CELERY", False)
+    monkeypatch.setattr(queue, "maintain_graph_edges", lambda *args: runs.append(args))
+    queue.schedule_graph_maintenance(db, plain.id)
+    queue.schedule_graph_maintenance(db, {None})
+    assert runs == []
+    queue.schedule_graph_maintenance(db, {plain.id, built.id})
+    assert runs == [(built.id,)]  # inline: only the written dataset's queue
+
+    def broken(*args):
+        raise RuntimeError("database is gone")
+
+    monkeypatch.setattr(queue, "maintain_graph_edges", broken)
+    queue.schedule_graph_maintenance(db, built.id)  # best effort: logged, not raised
+    db.close()
+    engine.dispose()
+
+
+def test_deleting_a_node_schedules_maintenance_of_its_dataset(monkeypatch):
+    from fastapi.testclient import TestClient
+    from sqlalchemy.pool import StaticPool
+
+    from backend.app.db.session import get_db
+    from backend.app.main import app
+    from backend.app.models.models import KnowledgeNode
+    from backend.app.routers import nodes
+
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:", future=True, connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    db = Session()
+    dataset = Dataset(name="built", graph_params={"top_k": 5})
+    db.add(dataset)
+    db.flush()
+    ds = dataset.id
+    db.add(KnowledgeNode(
+        id=1, dataset_id=ds, title="n1", context_text="", prob_vector=[], top_levels=[], embedding_dim=8,
+    ))
+    db.commit()
+    db.close()
+
+    scheduled = []
+    monkeypatch.setattr(nodes, "schedule_graph_maintenance", lambda _db, ids: scheduled.append(ids))
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        assert TestClient(app).delete("/nodes/1").status_code == 200
+        assert scheduled == [ds]
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
@@ -0,0 +1,108 @@
+"""Tests for graph communities: label propagation and GET /graph/summary drill-down."""
+import numpy as np
+import pytest
+
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app.db.session import get_db
+from backend.app.main import app
+from backend.app.models.base import Base
+from backend.app.models.models import (
+    Dataset,
+    GraphCluster,
+    GraphClusterEdge,
+    GraphClusterMember,
+    KnowledgeEdge,
+    KnowledgeNode,
+)
+from backend.app.services import result_cache
+from backend.app.services.graph_cluster import label_propagation, mean_prob_vector
+
+
+def _clique(nodes):
+    return [(a, b) for i, a in enumerate(nodes) for b in nodes[i + 1 :]]
+
+
+def test_label_propagation_separates_weakly_linked_communities():
+    pairs = _clique([0, 1, 2, 3, 4]) + _clique([5, 6, 7]) + [(4, 5)]
+    src = np.array([a for a, _ in pairs])
+    dst = np.array([b for _, b in pairs])
+    weight = np.array([0.1 if (a, b) == (4, 5) else 0.9 for a, b in pairs])
+    labels = label_propagation(9, src, dst, weight, seed=1)
+    assert labels.tolist() == [0, 0, 0, 0, 0, 1, 1, 1, 2]  # numbered by size; node 8 is alone
+    assert label_propagation(0, src[:0], dst[:0], weight[:0]).tolist() == []
+
+
+def test_mean_prob_vector_and_top_levels():
+    probs, top = mean_prob_vector(np.array([0.0, 0.2, 1.2, 0.2, 0.4, 0.0]), 2)
+    assert probs == [0.0, 0.1, 0.6, 0.1, 0.2, 0.0]
+    assert top == ["apply", "evaluate"]
+    assert mean_prob_vector(np.zeros(6), 0) == ([], [])
+
+
+def test_summary_and_cluster_drill_down(monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_ENABLED", False)
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:",
+        future=True,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    db = Session()
+    dataset = Dataset(name="dataset-1")
+    db.add(dataset)
+    db.flush()
+    ds = dataset.id
+    for i in range(1, 6):
+        db.add(KnowledgeNode(
+            id=i, dataset_id=ds, title=f"n{i}", context_text="", prob_vector=[0, 0, 1, 0, 0, 0],
+            top_levels=["apply"], embedding_dim=8, embedding_model="hash:v1",
+        ))
+    db.flush()
+    for a, b, w in [(1, 2, 0.9), (2, 3, 0.8), (3, 4, 0.1), (4, 5, 0.7)]:
+        db.add(KnowledgeEdge(dataset_id=ds, from_node_id=a, to_node_id=b, weight=w, method="similarity|hash:v1"))
+    db.add_all([
+        GraphCluster(dataset_id=ds, cluster_id=0, size=3, label="n2", label_node_id=2,
+                     prob_vector=[0, 0, 1, 0, 0, 0], top_levels=["apply"]),
+        GraphCluster(dataset_id=ds, cluster_id=1, size=2, label="n4", label_node_id=4,
+                     prob_vector=[0, 0, 1, 0, 0, 0], top_levels=["apply"]),
+        GraphClusterEdge(dataset_id=ds, from_cluster_id=0, to_cluster_id=1, weight=0.1, edges=1),
+    ])
+    db.add_all([GraphClusterMember(node_id=i, dataset_id=ds, cluster_id=0 if i <= 3 else 1) for i in range(1, 6)])
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        client = TestClient(app)
+        summary = client.get("/graph/summary", params={"dataset_id": ds}).json()
+        assert (summary["total_clusters"], summary["total_nodes"]) == (2, 5)
+        assert [(c["id"], c["size"], c["label"]) for c in summary["clusters"]] == [(0, 3, "n2"), (1, 2, "n4")]
+        assert summary["edges"] == [{"from_id": 0, "to_id": 1, "weight": 0.1}]
+
+        big_only = client.get("/graph/summary", params={"dataset_id": ds, "min_size": 3}).json()
+        assert [c["id"] for c in big_only["clusters"]] == [0] and big_only["edges"] == []
+
+        cluster = client.get("/graph/clusters/0", params={"dataset_id": ds}).json()
+        assert [n["id"] for n in cluster["nodes"]] == [1, 2, 3]
+        assert [(e["from_id"], e["to_id"]) for e in cluster["edges"]] == [(1, 2), (2, 3)]
+        assert client.get("/graph/clusters/7", params={"dataset_id": ds}).status_code == 404
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
@@ -0,0 +1,109 @@
+"""Tests for the precomputed graph layout and the positions graph routes return."""
+import numpy as np
+import pytest
+
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app.db.session import get_db
+from backend.app.main import app
+from backend.app.models.base import Base
+from backend.app.models.models import Dataset, GraphNodePosition, KnowledgeEdge, KnowledgeNode
+from backend.app.services import result_cache
+from backend.app.services.graph_layout import compute_layout, force_layout, place_nodes
+
+
+def _two_communities(size=60, links=4, seed=0):
+    rng = np.random.default_rng(seed)
+    pairs = [
+        (base + i, base + j)
+        for base in (0, size)
+        for i in range(size)
+        for j in rng.choice(size, links, replace=False)
+        if i != j
+    ]
+    pairs.append((0, 2 * size - 1))
+    src, dst = (np.array(p) for p in zip(*pairs))
+    return 2 * size, src, dst, np.full(len(pairs), 0.8)
+
+
+def test_layout_separates_communities_within_bounds():
+    n, src, dst, weight = _two_communities()
+    pos = compute_layout(n, src, dst, weight, iterations=30)
+    assert pos.shape == (n, 2) and np.abs(pos).max() <= 1.0 + 1e-9
+    a, b = pos[: n // 2], pos[n // 2 :]
+    gap = np.linalg.norm(a.mean(axis=0) - b.mean(axis=0))
+    assert gap > 2 * max(a.std(axis=0).max(), b.std(axis=0).max())
+    assert compute_layout(0, src[:0], dst[:0], weight[:0]).shape == (0, 2)
+    assert compute_layout(1, src[:0], dst[:0], weight[:0]).tolist() == [[0.0, 0.0]]
+
+
+def test_incremental_placement_keeps_placed_nodes():
+    n, src, dst, weight = _two_communities()
+    pos = compute_layout(n, src, dst, weight, iterations=30)
+    placed = np.ones(n, dtype=bool)
+    placed[[5, n - 5]] = False
+    moved = place_nodes(np.where(placed[:, None], pos, 0.0), placed, src, dst, weight)
+    moved = force_layout(moved, src, dst, weight, iterations=10, temperature=0.02, movable=~placed)
+    assert np.array_equal(moved[placed], pos[placed])
+    # Each re-placed node lands with its own community.
+    assert np.linalg.norm(moved[5] - pos[: n // 2].mean(axis=0)) < np.linalg.norm(moved[5] - pos[n // 2 :].mean(axis=0))
+    assert np.linalg.norm(moved[n - 5] - pos[n // 2 :].mean(axis=0)) < np.linalg.norm(moved[n - 5] - pos[: n // 2].mean(axis=0))
+
+
+def test_routes_return_positions_of_the_current_graph_only(monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_ENABLED", False)
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:",
+        future=True,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    db = Session()
+    dataset = Dataset(name="dataset-1", graph_version=3)
+    db.add(dataset)
+    db.flush()
+    ds = dataset.id
+    for i in range(1, 4):
+        db.add(KnowledgeNode(
+            id=i, dataset_id=ds, title=f"n{i}", context_text="", prob_vector=[], top_levels=[],
+            embedding_dim=8, embedding_model="hash:v1",
+        ))
+    db.flush()
+    db.add_all([
+        KnowledgeEdge(dataset_id=ds, from_node_id=1, to_node_id=2, weight=0.9, method="similarity|hash:v1"),
+        KnowledgeEdge(dataset_id=ds, from_node_id=2, to_node_id=3, weight=0.8, method="similarity|hash:v1"),
+        GraphNodePosition(node_id=1, dataset_id=ds, x=0.5, y=-0.25, graph_version=3),
+        GraphNodePosition(node_id=2, dataset_id=ds, x=-1.0, y=1.0, graph_version=3),
+        GraphNodePosition(node_id=3, dataset_id=ds, x=0.0, y=0.0, graph_version=2),
+    ])
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        client = TestClient(app)
+        body = client.get("/graph/nodes/1/neighborhood").json()
+        assert {n["id"]: (n["x"], n["y"]) for n in body["nodes"]} == {
+            1: (0.5, -0.25),
+            2: (-1.0, 1.0),
+            3: (None, None),  # laid out for an older graph
+        }
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
@@ -0,0 +1,102 @@
+"""Tests for GET /graph/nodes/{id}/neighborhood (bounded walk over persisted edges)."""
+import pytest
+
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app.db.session import get_db
+from backend.app.main import app
+from backend.app.models.base import Base
+from backend.app.models.models import Dataset, KnowledgeEdge, KnowledgeNode
+from backend.app.services import result_cache
+
+MODEL = "hash:v1"
+SIM = f"similarity|{MODEL}"
+CO = "co_occurrence_window"
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_ENABLED", False)
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:",
+        future=True,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+
+    db = Session()
+    dataset, other = Dataset(name="dataset-1"), Dataset(name="dataset-2")
+    db.add_all([dataset, other])
+    db.flush()
+    for i in range(1, 9):
+        db.add(KnowledgeNode(
+            id=i, dataset_id=other.id if i == 8 else dataset.id, title=f"n{i}", context_text="",
+            prob_vector=[], top_levels=[], embedding_dim=8, embedding_model=MODEL,
+        ))
+    db.flush()
+    for a, b, w, method, ds in [
+        (1, 2, 0.9, SIM, dataset.id),
+        (1, 3, 0.5, CO, dataset.id),
+        (1, 4, 0.3, SIM, dataset.id),
+        (2, 5, 0.8, SIM, dataset.id),
+        (5, 6, 0.7, SIM, dataset.id),
+        (2, 3, 0.6, SIM, dataset.id),
+        (3, 7, 0.95, "similarity|other:v1", dataset.id),
+        (1, 8, 0.99, SIM, other.id),
+    ]:
+        db.add(KnowledgeEdge(dataset_id=ds, from_node_id=a, to_node_id=b, weight=w, method=method))
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+
+def _get(client, node_id, **params):
+    resp = client.get(f"/graph/nodes/{node_id}/neighborhood", params=params)
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    return body, {n["id"]: n["depth"] for n in body["nodes"]}
+
+
+def test_walk_is_bounded_by_depth(client):
+    body, depths = _get(client, 1, depth=1)
+    assert body["center_id"] == 1 and not body["truncated"]
+    assert depths == {1: 0, 2: 1, 3: 1, 4: 1}
+    assert [(e["from_id"], e["to_id"]) for e in body["edges"]] == [(1, 2), (2, 3), (1, 3), (1, 4)]
+
+    _, depths = _get(client, 1, depth=3)
+    assert depths == {1: 0, 2: 1, 3: 1, 4: 1, 5: 2, 6: 3}
+
+
+def test_budget_keeps_the_strongest_nearest_nodes(client):
+    body, depths = _get(client, 1, depth=3, max_nodes=3)
+    assert body["truncated"]
+    assert list(depths) == [1, 2, 3]
+
+    _, depths = _get(client, 1, depth=3, include_cooccurrence=False, min_weight=0.4)
+    assert depths == {1: 0, 2: 1, 3: 2, 5: 2, 6: 3}
+
+
+def test_unknown_node_is_404(client):
+    assert client.get("/graph/nodes/999/neighborhood").status_code == 404
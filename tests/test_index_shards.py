@@ -0,0 +1,60 @@
+"""Tests for splitting index/reindex jobs into id-range shards."""
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("celery")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app.models.base import Base
+from backend.app.models.models import Chunk, Dataset, Document
+from backend.app.tasks import shards as shards_mod
+from backend.app.tasks.shards import shard_ranges
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:",
+        future=True,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, future=True)()
+    yield session
+    session.close()
+
+
+def _dataset_with_chunks(db, name: str, n: int) -> int:
+    ds = Dataset(name=name)
+    db.add(ds)
+    db.flush()
+    doc = Document(dataset_id=ds.id, title=name, source="test")
+    db.add(doc)
+    db.flush()
+    db.add_all(Chunk(document_id=doc.id, idx=i, text=f"chunk {i}", meta={}) for i in range(n))
+    db.commit()
+    return ds.id
+
+
+def test_shards_cover_the_dataset_in_disjoint_ranges(db):
+    other = _dataset_with_chunks(db, "other", 4)
+    ds = _dataset_with_chunks(db, "target", 10)
+    shards = shard_ranges(db, "chunks", ds, shard_rows=3)
+    assert [s.rows for s in shards] == [3, 3, 2, 2]
+    assert [s.key for s in shards] == ["chunks-0", "chunks-1", "chunks-2", "chunks-3"]
+    for a, b in zip(shards, shards[1:]):
+        assert a.hi < b.lo
+    assert sum(s.rows for s in shards) == 10
+    assert shard_ranges(db, "chunks", other, shard_rows=3)[-1].hi < shards[0].lo
+
+
+def test_shard_count_is_capped(db, monkeypatch):
+    ds = _dataset_with_chunks(db, "big", 12)
+    monkeypatch.setattr(shards_mod, "INDEX_MAX_SHARDS", 2)
+    assert [s.rows for s in shard_ranges(db, "chunks", ds, shard_rows=1)] == [6, 6]
+    assert len(shard_ranges(db, "chunks", ds, shard_rows=100)) == 1
+    assert shard_ranges(db, "nodes", ds) == []
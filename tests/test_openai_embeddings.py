@@ -0,0 +1,99 @@
+"""Tests for the OpenAI embeddings client against a local HTTP stand-in."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.app.services import openai_client
+
+
+class _FakeOpenAI(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    requests: list[list[str]] = []
+    throttle_first = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        cls = type(self)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with cls.lock:
+            if cls.throttle_first > 0:
+                cls.throttle_first -= 1
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            cls.requests.append(body["input"])
+        time.sleep(0.02)
+        # Reversed on purpose: the client must restore order by "index".
+        data = [
+            {"index": i, "embedding": [float(len(t)), float(i + 1)]}
+            for i, t in reversed(list(enumerate(body["input"])))
+        ]
+        payload = json.dumps({"data": data}).encode()
+        with cls.lock:
+            cls.in_flight -= 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    _FakeOpenAI.in_flight = 0
+    _FakeOpenAI.max_in_flight = 0
+    _FakeOpenAI.requests = []
+    _FakeOpenAI.throttle_first = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeOpenAI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_BASE", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(openai_client, "_session", None)
+    yield _FakeOpenAI
+    server.shutdown()
+    server.server_close()
+
+
+def test_token_batches_respect_budgets():
+    texts = ["x" * 30, "x" * 30, "x" * 30, "x", "x"]  # 11, 11, 11, 1, 1 estimated tokens
+    assert openai_client.token_batches(texts, max_tokens=25, max_inputs=10) == [[0, 1], [2, 3, 4]]
+    assert openai_client.token_batches(texts, max_tokens=1000, max_inputs=2) == [[0, 1], [2, 3], [4]]
+    # An input over budget still gets its own request.
+    assert openai_client.token_batches(["x" * 300], max_tokens=10) == [[0]]
+
+
+def test_embeddings_are_concurrent_bounded_and_ordered(fake_openai, monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_EMBED_MAX_INPUTS", 3)
+    monkeypatch.setattr(openai_client, "OPENAI_EMBED_CONCURRENCY", 2)
+    texts = ["a" * n for n in range(1, 21)]
+    vecs = openai_client.embeddings("text-embedding-3-small", texts)
+    assert [v[0] for v in vecs] == [float(len(t)) for t in texts]
+    assert len(fake_openai.requests) == 7
+    assert fake_openai.max_in_flight == 2
+
+
+def test_rate_limited_requests_are_retried(fake_openai, monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_EMBED_CONCURRENCY", 1)
+    fake_openai.throttle_first = 2
+    vecs = openai_client.embeddings("text-embedding-3-small", ["hello", "world!"])
+    assert [v[0] for v in vecs] == [5.0, 6.0]
+    assert len(fake_openai.requests) == 1
+
+
+def test_gives_up_after_max_retries(fake_openai, monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_MAX_RETRIES", 1)
+    fake_openai.throttle_first = 5
+    with pytest.raises(Exception):
+        openai_client.embeddings("text-embedding-3-small", ["hello"])
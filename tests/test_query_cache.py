@@ -0,0 +1,68 @@
+"""Tests for the query-embedding cache used by the search endpoints."""
+import time
+
+import numpy as np
+
+from backend.app.services import query_embed
+from backend.app.utils.cache import TTLCache
+
+
+def test_ttl_cache_evicts_lru_and_expires(monkeypatch):
+    cache = TTLCache(max_entries=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+    now = time.monotonic()
+    monkeypatch.setattr("backend.app.utils.cache.time.monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_repeated_queries_hit_the_cache(monkeypatch):
+    calls = []
+
+    def fake_embed(texts):
+        calls.append(list(texts))
+        return np.ones((len(texts), 1536), dtype=np.float32)
+
+    monkeypatch.setattr(query_embed, "embed_texts", fake_embed)
+    monkeypatch.setattr(query_embed, "get_query_redis_cache", lambda: None)
+    cache = TTLCache(16, 60)
+    monkeypatch.setattr(query_embed, "get_query_cache", lambda: cache)
+
+    query_embed.embed_query("фотосинтез  в клетке")
+    query_embed.embed_query(" фотосинтез в клетке ")
+    assert calls == [["фотосинтез в клетке"]]
+    stats = query_embed.query_cache_stats()["local"]
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_batch_embeds_only_distinct_misses_in_one_call(monkeypatch):
+    calls = []
+
+    def fake_embed(texts):
+        calls.append(list(texts))
+        return np.stack([np.full(1536, len(t), dtype=np.float32) for t in texts])
+
+    monkeypatch.setattr(query_embed, "embed_texts", fake_embed)
+    monkeypatch.setattr(query_embed, "get_query_redis_cache", lambda: None)
+    cache = TTLCache(16, 60)
+    monkeypatch.setattr(query_embed, "get_query_cache", lambda: cache)
+
+    query_embed.embed_query("клетка")
+    vecs = query_embed.embed_queries(["ядро", "клетка", "митохондрия", "ядро "])
+    assert calls == [["клетка"], ["ядро", "митохондрия"]]
+    assert [int(v[0]) for v in vecs] == [4, 6, 11, 4]
+
+
+def test_cache_stats_endpoint():
+    from fastapi.testclient import TestClient
+
+    from backend.app.main import app
+
+    body = TestClient(app).get("/search/cache/stats").json()
+    assert {"local", "redis"} <= set(body["query_embedding"])
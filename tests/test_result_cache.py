@@ -0,0 +1,113 @@
+"""Tests for the generation-keyed response cache (GET /search, /nodes/search, /graph)."""
+import pytest
+
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app.db.session import get_db
+from backend.app.main import app
+from backend.app.models.base import Base
+from backend.app.models.models import BloomAnnotation, BloomLevel, Chunk, Dataset, Document
+from backend.app.routers import graph as graph_router
+from backend.app.schemas.schemas import GraphOut
+from backend.app.services import result_cache
+from backend.app.utils.cache import TTLCache
+
+
+def test_keys_normalize_params_and_separate_generations():
+    a = result_cache.result_key("search", "1:0", {"q": "клетка", "top_k": 5})
+    b = result_cache.result_key("search", "1:0", {"top_k": 5, "q": "клетка"})
+    assert a == b
+    assert a != result_cache.result_key("search", "1:1", {"q": "клетка", "top_k": 5})
+    assert a != result_cache.result_key("nodes/search", "1:0", {"q": "клетка", "top_k": 5})
+
+
+def test_etag_matching():
+    etag = result_cache.etag_for("graph:1:0:abc")
+    assert etag.startswith('W/"')
+    assert result_cache.etag_matches(etag, etag)
+    assert result_cache.etag_matches(f'"other", {etag}', etag)
+    assert result_cache.etag_matches(etag.removeprefix("W/"), etag)
+    assert result_cache.etag_matches("*", etag)
+    assert not result_cache.etag_matches('"other"', etag)
+    assert not result_cache.etag_matches(None, etag)
+
+
+def test_graph_is_cached_until_a_write_bumps_the_generation(monkeypatch):
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:",
+        future=True,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    db = Session()
+    dataset = Dataset(name="dataset-1")
+    db.add(dataset)
+    db.flush()
+    document = Document(dataset_id=dataset.id, title="doc", source="test")
+    db.add(document)
+    db.flush()
+    chunk = Chunk(document_id=document.id, idx=0, text="chunk text", meta={})
+    db.add(chunk)
+    db.flush()
+    db.add(BloomAnnotation(chunk_id=chunk.id, level=BloomLevel.apply, label="l", rationale="r", score=0.5))
+    db.commit()
+    dataset_id, chunk_id = dataset.id, chunk.id
+    db.close()
+
+    builds = []
+
+    def fake_build(db, **params):
+        builds.append(params)
+        return GraphOut(nodes=[], edges=[])
+
+    monkeypatch.setattr(graph_router, "_build_graph", fake_build)
+    cache = TTLCache(16, 60)
+    monkeypatch.setattr(result_cache, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(result_cache, "get_result_redis_cache", lambda: None)
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_ENABLED", True)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        client = TestClient(app)
+        first = client.get("/graph", params={"dataset_id": dataset_id})
+        assert first.status_code == 200
+        assert first.json() == {"nodes": [], "edges": []}
+        etag = first.headers["etag"]
+
+        again = client.get("/graph", params={"dataset_id": dataset_id})
+        assert again.headers["etag"] == etag
+        assert len(builds) == 1
+
+        assert client.get("/graph", params={"dataset_id": dataset_id}, headers={"If-None-Match": etag}).status_code == 304
+        client.get("/graph", params={"dataset_id": dataset_id, "top_k": 7})
+        assert len(builds) == 2
+
+        resp = client.put(f"/annotate/chunks/{chunk_id}/levels/apply", json={"score": 0.9})
+        assert resp.status_code == 200
+        after = client.get("/graph", params={"dataset_id": dataset_id}, headers={"If-None-Match": etag})
+        assert after.status_code == 200
+        assert after.headers["etag"] != etag
+        assert len(builds) == 3
+
+        assert client.get("/graph", params={"dataset_id": dataset_id + 1}).status_code == 200
+        assert "etag" not in client.get("/graph", params={"dataset_id": dataset_id + 1}).headers
+        assert len(builds) == 5
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
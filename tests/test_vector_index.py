@@ -0,0 +1,53 @@
+"""Tests for per-model vector index SQL (no database required)."""
+import numpy as np
+import pytest
+
+from backend.app.services import embedding as embedding_mod
+from backend.app.services.vector_index import IndexSpec, distance_sql, index_name
+
+
+def test_distance_sql_matches_index_expression():
+    half = IndexSpec(dim=1024, precision="half")
+    assert distance_sql("e.vec", ":q", half) == "(e.vec)::halfvec(1024) <=> (:q)::halfvec(1024)"
+    full = IndexSpec(dim=1536, precision="full")
+    assert full.opclass == "vector_cosine_ops"
+    assert distance_sql("e.vec", ":q", full) == "(e.vec)::vector(1536) <=> (:q)::vector(1536)"
+    assert distance_sql("e.vec", ":q", None) == "e.vec <=> :q"
+    binary = IndexSpec(dim=1024, precision="bit")
+    assert binary.kind == "binary" and binary.opclass == "bit_hamming_ops"
+    assert distance_sql("e.vec", ":q", binary) == (
+        "binary_quantize(e.vec)::bit(1024) <~> binary_quantize(:q)::bit(1024)"
+    )
+
+
+def test_index_names_are_stable_and_per_table():
+    a = index_name("embeddings", "local:intfloat/multilingual-e5-large:1024")
+    assert a == index_name("embeddings", "local:intfloat/multilingual-e5-large:1024")
+    assert a != index_name("knowledge_nodes", "local:intfloat/multilingual-e5-large:1024")
+    assert len(a) <= 63 and a.isidentifier()
+    assert index_name("embeddings", "m", "binary") != index_name("embeddings", "m")
+
+
+def test_dataset_index_names_are_scoped():
+    model = "local:intfloat/multilingual-e5-large:1024"
+    scoped = index_name("knowledge_nodes", model, dataset_id=123456)
+    assert scoped.startswith("vidx_kn_d123456_")
+    assert scoped != index_name("knowledge_nodes", model)
+    assert scoped != index_name("knowledge_nodes", model, dataset_id=123457)
+    long = index_name("embeddings", model, "binary", dataset_id=2**31 - 1)
+    assert len(long) <= 63 and long.isidentifier()
+
+
+def test_embed_texts_uses_native_dim(monkeypatch):
+    class _Provider:
+        embedding_model = "fake:8"
+        dim = 8
+
+        def embed_batches(self, texts, batch_size=None):
+            yield list(range(len(texts))), np.ones((len(texts), 8), dtype=np.float32)
+
+    monkeypatch.setattr(embedding_mod, "get_embedding_provider", lambda: _Provider())
+    monkeypatch.setattr(embedding_mod, "get_embedding_cache", lambda: None)
+    assert embedding_mod.embed_texts(["a", "b"]).shape == (2, 8)
+    with pytest.raises(ValueError):
+        embedding_mod.embed_texts(["a"], dim=1536)
@@ -0,0 +1,141 @@
+"""Tests for kNN planning and two-stage SQL (no database required)."""
+from backend.app.services import vector_search
+from backend.app.services.vector_index import IndexSpec
+from backend.app.services.vector_search import KnnPlan, batch_knn_sql, hybrid_sql, knn_sql, plan_knn, recall_at_k
+
+HNSW = IndexSpec(1024, "half")
+BINARY = IndexSpec(1024, "bit")
+
+
+def _with_indexes(monkeypatch, **specs):
+    monkeypatch.setattr(
+        vector_search,
+        "index_spec",
+        lambda db, table, model, kind="hnsw", dataset_id=None: specs.get(kind) if dataset_id is None else None,
+    )
+
+
+def test_plan_prefers_single_stage_hnsw_without_oversample(monkeypatch):
+    _with_indexes(monkeypatch, hnsw=HNSW, binary=BINARY)
+    assert plan_knn(None, "embeddings", "m", 5, None) == KnnPlan("hnsw", HNSW)
+
+
+def test_plan_uses_binary_candidates_when_oversampling(monkeypatch):
+    _with_indexes(monkeypatch, hnsw=HNSW, binary=BINARY)
+    assert plan_knn(None, "embeddings", "m", 5, 8) == KnnPlan("binary+rerank", BINARY, 40)
+    assert plan_knn(None, "embeddings", "m", 500, 8).candidates == vector_search.MAX_CANDIDATES
+
+
+def test_plan_binary_only_always_reranks(monkeypatch):
+    _with_indexes(monkeypatch, binary=BINARY)
+    plan = plan_knn(None, "embeddings", "m", 5, None)
+    assert plan.mode == "binary+rerank"
+    assert plan.candidates == 5 * vector_search.VECTOR_RERANK_OVERSAMPLE
+
+
+def test_plan_without_indexes_is_exact(monkeypatch):
+    _with_indexes(monkeypatch)
+    assert plan_knn(None, "embeddings", "m", 5, 4) == vector_search.EXACT
+
+
+def _with_counts(monkeypatch, filtered, total, iterative=False):
+    monkeypatch.setattr(vector_search, "_row_counts", lambda db, table, model, ds: (filtered, total))
+    monkeypatch.setattr(vector_search, "_has_iterative_scan", lambda db: iterative)
+
+
+def test_plan_scans_small_datasets_exactly(monkeypatch):
+    _with_indexes(monkeypatch, hnsw=HNSW)
+    _with_counts(monkeypatch, vector_search.VECTOR_EXACT_MAX_ROWS, 10**6)
+    plan = plan_knn(None, "embeddings", "m", 5, None, dataset_id=1)
+    assert plan.mode == "exact" and plan.coarse is None
+    assert plan.filtered_rows == vector_search.VECTOR_EXACT_MAX_ROWS
+
+
+def test_plan_raises_ef_search_with_filter_selectivity(monkeypatch):
+    _with_indexes(monkeypatch, hnsw=HNSW)
+    _with_counts(monkeypatch, 10_000, 100_000)
+    plan = plan_knn(None, "embeddings", "m", 10, None, dataset_id=1)
+    assert plan.mode == "hnsw"
+    assert plan.selectivity == 0.1
+    assert plan.ef_search == 200  # 10 rows * factor 2 / selectivity 0.1
+    assert plan.iterative_scan is None
+    # Unfiltered, the same top_k fits the default ef_search.
+    assert plan_knn(None, "embeddings", "m", 10, None).ef_search is None
+
+
+def test_plan_prefers_iterative_scan_when_available(monkeypatch):
+    _with_indexes(monkeypatch, hnsw=HNSW)
+    _with_counts(monkeypatch, 10_000, 1_000_000, iterative=True)
+    plan = plan_knn(None, "embeddings", "m", 50, None, dataset_id=1)
+    assert plan.iterative_scan == vector_search.VECTOR_ITERATIVE_SCAN
+    assert plan.ef_search == 100  # not inflated: the scan continues until enough rows pass
+
+
+def test_plan_routes_to_dataset_index(monkeypatch):
+    monkeypatch.setattr(
+        vector_search,
+        "index_spec",
+        lambda db, table, model, kind="hnsw", dataset_id=None: HNSW if kind == "hnsw" and dataset_id == 7 else None,
+    )
+    _with_counts(monkeypatch, 50_000, 1_000_000, iterative=True)
+    plan = plan_knn(None, "knowledge_nodes", "m", 10, None, dataset_id=7)
+    assert plan.mode == "hnsw" and plan.index_dataset == 7
+    assert plan.selectivity == 1.0 and plan.iterative_scan is None
+
+    executed = []
+
+    class _Db:
+        def execute(self, stmt, params):
+            executed.append((str(stmt), params))
+
+    settings = vector_search.apply_knn_settings(_Db(), plan)
+    assert settings == {"plan_cache_mode": "force_custom_plan"}
+    assert "set_config('plan_cache_mode', :v0, true)" in executed[0][0]
+    # Other datasets keep the model-wide index (here: none, so exact).
+    assert plan_knn(None, "knowledge_nodes", "m", 10, None, dataset_id=8).mode == "exact"
+
+
+def test_ef_search_is_capped_and_covers_rerank_candidates():
+    assert vector_search.ef_search_for(30) is None
+    assert vector_search.ef_search_for(64) == 64
+    assert vector_search.ef_search_for(64, 0.001) == vector_search.MAX_CANDIDATES
+
+
+def test_two_stage_sql_reranks_candidates_exactly():
+    sql = knn_sql(
+        select="t.id", from_="t", where="t.vec IS NOT NULL", id_column="t.id", column="t.vec",
+        plan=KnnPlan("binary+rerank", BINARY, 40),
+    )
+    assert "binary_quantize(t.vec)::bit(1024) <~>" in sql
+    assert "LIMIT 40" in sql
+    assert "ORDER BY t.vec <=> (SELECT v FROM q)" in sql
+
+
+def test_batch_sql_runs_one_lateral_knn_per_query():
+    sql = batch_knn_sql(
+        select="t.id", from_="t", where="t.vec IS NOT NULL", id_column="t.id", column="t.vec",
+        plan=KnnPlan("hnsw", HNSW),
+    )
+    assert "unnest(CAST(:qvecs AS vector[])) WITH ORDINALITY" in sql
+    assert "CROSS JOIN LATERAL" in sql
+    assert "ORDER BY (t.vec)::halfvec(1024) <=> (qs.v)::halfvec(1024)" in sql
+    assert "ORDER BY qs.qpos" in sql
+
+
+def test_hybrid_sql_fuses_vector_and_lexical_ranks():
+    sql = hybrid_sql(
+        select="t.id", from_="t", where="t.vec IS NOT NULL", id_column="t.id", column="t.vec",
+        tsv_column="t.tsv", plan=KnnPlan("hnsw", HNSW),
+    )
+    # ANN branch orders by the index expression and takes :pool candidates.
+    assert "ORDER BY (t.vec)::halfvec(1024) <=> ((SELECT v FROM q))::halfvec(1024)" in sql
+    assert sql.count("LIMIT :pool") == 2
+    assert "websearch_to_tsquery('russian', :qtext)" in sql
+    assert "t.tsv @@ (SELECT t FROM tsq)" in sql
+    assert "SUM(w / (:rrf_k + rnk)) AS rrf_score" in sql
+
+
+def test_recall_counts_ties_with_kth_exact_score():
+    exact = [{"id": 1, "score": 0.9}, {"id": 2, "score": 0.5}]
+    assert recall_at_k([{"id": 1, "score": 0.9}, {"id": 3, "score": 0.5}], exact, "id") == 1.0
+    assert recall_at_k([{"id": 1, "score": 0.9}, {"id": 4, "score": 0.1}], exact, "id") == 0.5
@@ -0,0 +1,76 @@
+"""Tests for memory-mapped node vector snapshots (no database required)."""
+import json
+
+import numpy as np
+import pytest
+
+from backend.app.services import vector_snapshot
+from backend.app.services.vector_snapshot import NodeVectorSnapshot, drop_node_snapshots
+
+
+def _write_snapshot(path, ids, vecs, version=3, widen_max_mb=0, format_version=1):
+    path.mkdir(parents=True)
+    vecs = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    np.save(path / "vecs.npy", vecs.astype(np.float16))
+    np.save(path / "ids.npy", np.asarray(ids, dtype=np.int64))
+    (path / "meta.json").write_text(
+        json.dumps({
+            "format_version": format_version, "dataset_id": 1, "model": "m", "version": version, "rows": len(ids),
+        }),
+        encoding="utf-8",
+    )
+    return NodeVectorSnapshot.open(path, widen_max_mb)
+
+
+def test_blocked_search_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    vecs = rng.normal(size=(1000, 32)).astype(np.float32)
+    ids = np.arange(10, 1010) * 3
+    snap = _write_snapshot(tmp_path / "v3", ids, vecs)
+    assert isinstance(snap.vecs, np.memmap) and snap.vecs.dtype == np.float16
+    queries = rng.normal(size=(4, 32)).astype(np.float32)
+
+    found, scores = snap.search(queries, 10, block_rows=64)
+
+    normed = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    exact = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normed.T
+    for row, got in zip(exact, found):
+        assert set(got) == set(ids[np.argsort(-row)[:10]])
+    assert np.all(np.diff(scores, axis=1) <= 0)
+    assert np.allclose(scores, np.sort(exact, axis=1)[:, ::-1][:, :10], atol=2e-3)
+
+    # Widened once in memory: same neighbours without the blocked path.
+    widened = NodeVectorSnapshot.open(tmp_path / "v3", widen_max_mb=64)
+    assert widened.widened is not None
+    assert np.array_equal(widened.search(queries, 10)[0], found)
+
+
+def test_neighbours_skip_the_node_itself(tmp_path):
+    vecs = np.array([[1, 0], [0.9, 0.1], [0, 1], [0.1, 0.9]], dtype=np.float32)
+    snap = _write_snapshot(tmp_path / "v1", [5, 6, 7, 8], vecs)
+    out = snap.neighbours([5, 7, 99], k=1)
+    assert [n for n, _ in out[5]] == [6]
+    assert [n for n, _ in out[7]] == [8]
+    assert 99 not in out  # not in the snapshot: callers fall back to Postgres
+    # k larger than the snapshot is capped.
+    assert len(snap.neighbours([5], k=10)[5]) == 3
+
+
+def test_open_rejects_other_formats(tmp_path):
+    vecs = np.eye(3, dtype=np.float32)
+    with pytest.raises(ValueError, match="format"):
+        _write_snapshot(tmp_path / "v1", [1, 2, 3], vecs, format_version=2)
+
+
+def test_drop_removes_only_that_datasets_snapshots(tmp_path):
+    vecs = np.eye(3, dtype=np.float32)
+    for ds in (1, 2):
+        _write_snapshot(tmp_path / "nodes" / str(ds) / "m" / "v1", [1, 2, 3], vecs)
+    vector_snapshot._open[(1, "m")] = object()
+    try:
+        assert drop_node_snapshots(1, root=str(tmp_path))
+        assert not (tmp_path / "nodes" / "1").exists() and (tmp_path / "nodes" / "2" / "m" / "v1").exists()
+        assert (1, "m") not in vector_snapshot._open
+        assert not drop_node_snapshots(1, root=str(tmp_path))
+    finally:
+        vector_snapshot._open.pop((1, "m"), None)
@@ -0,0 +1,56 @@
+"""Tests for batch boundaries of the staged (COPY + merge) vector writers."""
+import numpy as np
+
+from backend.app.services.vector_store import NodeVectorWriter
+
+
+class _FakeSession:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+class _RecordingWriter(NodeVectorWriter):
+    def __init__(self, db, **kwargs):
+        super().__init__(db, "fake:model", **kwargs)
+        self.batches: list[list[int]] = []
+
+    def _stage(self, ids, vecs):
+        assert len(ids) == len(vecs)
+        self.batches.append(list(ids))
+
+    def _merge(self):
+        pass
+
+
+def test_writer_flushes_and_commits_bounded_batches():
+    db = _FakeSession()
+    with _RecordingWriter(db, batch_size=4) as writer:
+        for start in range(0, 10, 3):
+            ids = list(range(start, min(start + 3, 10)))
+            writer.add(ids, np.zeros((len(ids), 8), dtype=np.float32))
+    assert [len(b) for b in writer.batches] == [4, 4, 2]
+    assert sum(writer.batches, []) == list(range(10))
+    assert db.commits == 3
+    assert writer.written == 10
+
+
+def test_writer_splits_adds_larger_than_a_batch():
+    db = _FakeSession()
+    with _RecordingWriter(db, batch_size=4) as writer:
+        writer.add([0], np.zeros((1, 8), dtype=np.float32))
+        writer.add(list(range(1, 11)), np.zeros((10, 8), dtype=np.float32))
+        writer.add([], np.zeros((0, 8), dtype=np.float32))
+    assert [len(b) for b in writer.batches] == [4, 4, 3]
+    assert sum(writer.batches, []) == list(range(11))
+
+
+def test_writer_leaves_transaction_to_caller_without_commit():
+    db = _FakeSession()
+    with _RecordingWriter(db, batch_size=2, commit=False) as writer:
+        writer.add([1, 2, 3], np.zeros((3, 8), dtype=np.float32))
+    assert [len(b) for b in writer.batches] == [2, 1]
+    assert db.commits == 0
+    assert writer.written == 3
@@ -0,0 +1,63 @@
+"""Tests for model warm-up at startup and the health/readiness endpoints."""
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.app.services import warmup
+
+
+def test_run_warmup_times_each_step():
+    status = warmup.run_warmup("test")
+    assert status["status"] == "ready"
+    assert set(status["steps"]) == {"embedding", "node_extractor"}
+    for step in status["steps"].values():
+        assert step["ok"] is True
+        assert step["seconds"] >= 0
+    assert status["steps"]["embedding"]["dummy_batch"] == 2
+    assert warmup.loaded_embedding_model() == status["steps"]["embedding"]["model"]
+
+
+def test_failed_step_is_reported_not_raised(monkeypatch):
+    def boom():
+        raise RuntimeError("model missing")
+
+    monkeypatch.setattr(warmup, "_STEPS", [("embedding", boom)])
+    status = warmup.run_warmup("test")
+    assert status["status"] == "failed"
+    assert status["steps"]["embedding"]["ok"] is False
+    assert "model missing" in status["steps"]["embedding"]["error"]
+    assert warmup.is_ready()
+
+
+def test_lifespan_warms_up_in_background(monkeypatch):
+    def slow():
+        time.sleep(0.3)
+        return {}
+
+    monkeypatch.setattr(warmup, "_STEPS", [("embedding", slow)])
+    with TestClient(app) as client:
+        # Health answers immediately while the model is still loading.
+        health = client.get("/health")
+        assert health.status_code == 200
+        assert health.json()["warmup"] == "running"
+        assert client.get("/ready").status_code == 503
+
+        deadline = time.monotonic() + 5
+        while client.get("/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        resp = client.get("/ready")
+        assert resp.status_code == 200
+        assert resp.json()["steps"]["embedding"]["ok"] is True
+
+
+def test_warmup_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_ON_STARTUP", False)
+    with TestClient(app) as client:
+        assert client.get("/health").json()["warmup"] == "disabled"
+        assert client.get("/ready").status_code == 200
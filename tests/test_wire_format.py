@@ -0,0 +1,192 @@
+"""Tests for response encodings chosen by Accept (JSON, columnar msgpack / Arrow) on GET /nodes."""
+import pytest
+
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app.db.session import get_db
+from backend.app.main import app
+from backend.app.models.base import Base
+from backend.app.models.models import Dataset, KnowledgeNode
+from backend.app.schemas.schemas import GraphEdgeOut, GraphNodeOut, GraphOut
+from backend.app.services import wire_format
+from backend.app.services.wire_format import accepts_gzip, columnar, dumps_json, negotiate
+
+
+def test_negotiate_prefers_the_clients_highest_q(monkeypatch):
+    monkeypatch.setattr(wire_format, "_HAS_MSGPACK", True)
+    monkeypatch.setattr(wire_format, "_HAS_ARROW", True)
+    assert negotiate(None) == "json"
+    assert negotiate("*/*") == "json"
+    assert negotiate("application/x-msgpack") == "msgpack"
+    assert negotiate("application/json;q=0.5, application/vnd.apache.arrow.stream") == "arrow"
+    assert negotiate("application/msgpack;q=0.9, application/vnd.apache.arrow.stream;q=0.9") == "msgpack"
+    assert negotiate("application/msgpack;q=0") == "json"
+    monkeypatch.setattr(wire_format, "_HAS_MSGPACK", False)
+    assert negotiate("application/msgpack") == "json"  # not installed: JSON rather than 406
+
+
+def test_accepts_gzip_honours_q_values():
+    assert accepts_gzip("gzip, deflate, br")
+    assert accepts_gzip("br;q=1.0, *;q=0.5")
+    assert not accepts_gzip("")
+    assert not accepts_gzip("identity")
+    assert not accepts_gzip("gzip;q=0, *")
+    assert not accepts_gzip("*;q=0")
+
+
+def test_columnar_transposes_rows_and_drops_text():
+    graph = GraphOut(
+        nodes=[
+            GraphNodeOut(id=1, title="a", context_text="long", prob_vector=[1.0], top_levels=["apply"], x=0.5, y=0.0),
+            GraphNodeOut(id=2, title="b", context_text="text", prob_vector=[0.0], top_levels=[], rationale="why"),
+        ],
+        edges=[GraphEdgeOut(from_id=1, to_id=2, weight=0.75)],
+    )
+    data = columnar(graph)
+    assert data["nodes"] == {
+        "id": [1, 2],
+        "title": ["a", "b"],
+        "prob_vector": [[1.0], [0.0]],
+        "top_levels": [["apply"], []],
+        "frequency": [None, None],
+        "x": [0.5, None],
+        "y": [0.0, None],
+    }
+    assert data["edges"] == {"from_id": [1], "to_id": [2], "weight": [0.75]}
+    assert columnar(graph, include_text=True)["nodes"]["rationale"] == [None, "why"]
+    assert columnar(GraphOut(nodes=[], edges=[]))["edges"] == {"from_id": [], "to_id": [], "weight": []}
+
+
+def test_dumps_json_matches_the_standard_encoder():
+    import json
+
+    value = [GraphEdgeOut(from_id=1, to_id=2, weight=0.5), {"k": "ü", 3: None}]
+    assert json.loads(dumps_json(value)) == [{"from_id": 1, "to_id": 2, "weight": 0.5}, {"k": "ü", "3": None}]
+
+
+@pytest.fixture()
+def client():
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:",
+        future=True,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    db = Session()
+    dataset = Dataset(name="dataset-1")
+    db.add(dataset)
+    db.flush()
+    for i in range(1, 4):
+        db.add(KnowledgeNode(
+            id=i, dataset_id=dataset.id, title=f"n{i}", context_text="some text " * 20, prob_vector=[0, 0, 1, 0, 0, 0],
+            top_levels=["apply"], embedding_dim=8, embedding_model="hash:v1", model_info={"frequency": i},
+        ))
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+
+def test_nodes_json_is_unchanged(client):
+    resp = client.get("/nodes", params={"limit": 2})
+    assert resp.headers["content-type"] == "application/json" and resp.headers["vary"] == "Accept, Accept-Encoding"
+    body = resp.json()
+    assert body["total"] == 3 and [n["id"] for n in body["items"]] == [1, 2]
+    assert body["items"][0]["context_text"].startswith("some text") and body["items"][0]["model_info"] == {"frequency": 1}
+
+
+def test_nodes_are_gzipped_from_the_threshold_up(client, monkeypatch):
+    monkeypatch.setattr(wire_format, "GZIP_MIN_BYTES", 1024)
+    resp = client.get("/nodes", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip" and int(resp.headers["content-length"]) < 1024
+    assert resp.json()["total"] == 3  # decoded by the client
+    small = client.get("/nodes", params={"limit": 1}, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers and small.headers["vary"] == "Accept, Accept-Encoding"
+    assert "content-encoding" not in client.get("/nodes", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_nodes_msgpack_is_columnar(client):
+    msgpack = pytest.importorskip("msgpack")
+    resp = client.get("/nodes", headers={"Accept": "application/msgpack"})
+    assert resp.headers["content-type"] == "application/msgpack"
+    body = msgpack.unpackb(resp.content)
+    assert body["total"] == 3 and body["items"]["id"] == [1, 2, 3]
+    assert "context_text" not in body["items"] and "model_info" not in body["items"]
+    full = msgpack.unpackb(client.get("/nodes", params={"include_text": True}, headers={"Accept": "application/msgpack"}).content)
+    assert full["items"]["model_info"] == [{"frequency": 1}, {"frequency": 2}, {"frequency": 3}]
+
+
+def test_nodes_arrow_stream(client):
+    pa = pytest.importorskip("pyarrow")
+    resp = client.get("/nodes", headers={"Accept": "application/vnd.apache.arrow.stream"})
+    assert resp.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(resp.content).read_all()
+    assert table.num_rows == 1 and table["total"].to_pylist() == [3]
+    items = table["items"][0].values
+    assert items.field("id").to_pylist() == [1, 2, 3]
+    assert items.field("top_levels").to_pylist() == [["apply"]] * 3
+
+
+def test_event_stream_is_not_buffered_for_gzip_clients(client, monkeypatch):
+    """Every SSE event of /canvas/ingest-stream leaves as its own uncompressed body chunk."""
+    import json
+
+    import anyio
+
+    from backend.app.routers import canvas
+
+    monkeypatch.setenv("CANVAS_TOKEN", "token")
+    monkeypatch.setenv("CANVAS_URL", "https://canvas.invalid")
+    monkeypatch.setattr(canvas, "get_node_extractor", lambda: None)
+    monkeypatch.setattr(canvas, "_fetch_module_map", lambda course_id: {})
+    monkeypatch.setattr(canvas, "_process_document", lambda *args, **kwargs: None)
+    monkeypatch.setattr(canvas.cc, "list_discussions", lambda cid: [{"id": i, "title": f"t{i}"} for i in range(3)])
+    session_factory = app.dependency_overrides[get_db]
+    monkeypatch.setattr(canvas, "SessionLocal", lambda: next(session_factory()))
+
+    request = json.dumps({"course_id": 1, "dataset_id": 1, "content_types": ["discussions"]}).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/canvas/ingest-stream", "raw_path": b"/canvas/ingest-stream", "query_string": b"",
+        "root_path": "", "client": ("test", 1), "server": ("test", 80),
+        "headers": [(b"content-type", b"application/json"), (b"accept-encoding", b"gzip")],
+    }
+    messages = []
+
+    async def receive():
+        if not messages:
+            messages.append({"type": "request-sent"})
+            return {"type": "http.request", "body": request, "more_body": False}
+        await anyio.sleep_forever()
+
+    async def send(message):
+        messages.append(message)
+
+    anyio.run(app, scope, receive, send)
+
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    assert b"content-encoding" not in dict(start["headers"])
+    chunks = [m["body"] for m in messages if m["type"] == "http.response.body" and m["body"]]
+    events = [json.loads(c.decode().rsplit("data: ", 1)[1]) for c in chunks]
+    assert [e["type"] for e in events] == ["start", "stage", "progress", "progress", "progress", "done"]